@@ -12,6 +12,11 @@ class Invoice(BaseModel):
     payment_mode = models.CharField(max_length=20, null=True, blank=True, choices=(('CASH', 'Cash'), ('UPI', 'Google Pay / UPI'), ('CARD', 'Card')))
     remarks = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='invoice_created_keyset_idx'),
+        ]
+
     def __str__(self):
         return f"Invoice {self.id} - {self.total_amount}"
 
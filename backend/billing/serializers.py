@@ -1,6 +1,11 @@
 from rest_framework import serializers
+from revive_cms.realtime import publish_event, snapshot, role_room, patient_room, visit_room
 from .models import Invoice, InvoiceItem, PaymentTransaction
 
+# Compact row sent with billing_update so clients can patch in place
+INVOICE_SNAPSHOT_FIELDS = ('visit_id', 'patient_name', 'total_amount', 'refund_amount', 'payment_status', 'payment_mode', 'updated_at')
+
+
 class PaymentTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentTransaction
@@ -55,17 +60,13 @@ class InvoiceSerializer(serializers.ModelSerializer):
         for item_data in items_data:
             InvoiceItem.objects.create(invoice=invoice, **item_data)
         
-        # Emit Socket Event
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            async_to_sync(sio.emit)('billing_update', {
-                'invoice_id': str(invoice.id),
-                'amount': float(invoice.total_amount),
-                'status': invoice.payment_status
-            })
-        except Exception as e:
-            print(f"Socket emit error: {e}")
+        # Emit Socket Event (after commit)
+        publish_event('billing_update', {
+            'invoice_id': str(invoice.id),
+            'amount': float(invoice.total_amount),
+            'status': invoice.payment_status,
+            **snapshot(invoice, INVOICE_SNAPSHOT_FIELDS),
+        }, room=self.invoice_rooms(invoice))
 
         return invoice
 
@@ -100,16 +101,21 @@ class InvoiceSerializer(serializers.ModelSerializer):
             # Remove missing items
             instance.items.exclude(id__in=keep_ids).delete()
         
-        # Emit Socket Event
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            async_to_sync(sio.emit)('billing_update', {
-                'invoice_id': str(instance.id),
-                'amount': float(instance.total_amount),
-                'status': instance.payment_status
-            })
-        except Exception as e:
-            print(f"Socket emit error: {e}")
+        # Emit Socket Event (after commit)
+        publish_event('billing_update', {
+            'invoice_id': str(instance.id),
+            'amount': float(instance.total_amount),
+            'status': instance.payment_status,
+            **snapshot(instance, INVOICE_SNAPSHOT_FIELDS),
+        }, room=self.invoice_rooms(instance))
 
         return instance
+
+    @staticmethod
+    def invoice_rooms(invoice):
+        """Billing desk roles plus anyone viewing the visit/patient."""
+        rooms = [role_room('ADMIN'), role_room('RECEPTION'), role_room('PHARMACY')]
+        if invoice.visit_id:
+            rooms.append(visit_room(invoice.visit_id))
+            rooms.append(patient_room(invoice.visit.patient_id))
+        return rooms
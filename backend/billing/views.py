@@ -7,9 +7,11 @@ from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from patients.models import Visit
 from patients.serializers import VisitSerializer
-from .models import Invoice, PaymentTransaction
-from .serializers import InvoiceSerializer, PaymentTransactionSerializer
-from pharmacy.models import PharmacyStock
+from .models import Invoice, InvoiceItem, PaymentTransaction
+from .serializers import InvoiceSerializer, PaymentTransactionSerializer, INVOICE_SNAPSHOT_FIELDS
+from pharmacy.models import PharmacyStock, StockMovement
+from revive_cms.pagination import CursorOrPageNumberPagination
+from revive_cms.realtime import publish_event, snapshot
 
 class IsAdminOrReception(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -18,6 +20,8 @@ class IsAdminOrReception(permissions.BasePermission):
 class InvoiceViewSet(viewsets.ModelViewSet):
     queryset = Invoice.objects.all().order_by('-created_at')
     serializer_class = InvoiceSerializer
+    pagination_class = CursorOrPageNumberPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         queryset = Invoice.objects.all().order_by('-created_at')
@@ -50,59 +54,74 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         self._deduct_stock(invoice)
 
     def _deduct_stock(self, invoice):
-        from django.db import transaction
         from rest_framework import serializers
+        from core.stock import InsufficientStock
+        from pharmacy.dispensing import dispense_medicines, medicine_batches, medicine_key
+        from pharmacy.ledger import recording
 
-        items = invoice.items.all()
-        for item in items:
+        lines = []     # (item, name, batch, delta) for pharmacy lines whose quantity changed
+        for item in invoice.items.all():
             if item.dept == 'PHARMACY':
                 name = item.description.strip() if item.description else ""
                 batch = item.batch.strip() if item.batch else ""
-                current_qty = int(item.qty)
-                already_deducted = int(item.deducted_qty)
-                delta = current_qty - already_deducted
-                
-                if delta == 0:
-                    continue
-                    
-                # Find Stock
-                stock = None
-                if batch:
-                    # Strict match by name and batch
-                    stock = PharmacyStock.objects.select_for_update().filter(
-                        name__iexact=name, 
-                        batch_no__iexact=batch,
-                        is_deleted=False
-                    ).first()
-                
-                if not stock and not batch:
-                    # Fallback to name only if batch is not provided (should be avoided in UI)
-                    stock = PharmacyStock.objects.select_for_update().filter(
-                        name__iexact=name,
-                        is_deleted=False
-                    ).order_by('expiry_date').first()
-                
-                if stock:
-                    if stock.qty_available < delta:
-                        raise serializers.ValidationError({
-                            "error": f"Insufficient stock for {name} (Batch: {batch or 'Any'}). Available: {stock.qty_available}, Requested: {delta}"
-                        })
-                        
-                    # Perform stock adjustment
-                    stock.qty_available -= delta
-                    stock.save()
-                    
-                    # Update item tracking
-                    item.deducted_qty = current_qty
-                    item.stock_deducted = True
-                    item.save()
-                else:
-                    # If it's a new manual entry and no stock found, we should probably warn or block
-                    # unless it's a non-pharmacy item mislabeled as dept='PHARMACY'
-                    if delta > 0:
-                         raise serializers.ValidationError({
-                            "error": f"No stock record found for {name} (Batch: {batch or 'N/A'})."
-                        })
+                delta = int(item.qty) - int(item.deducted_qty)
+                if delta != 0:
+                    lines.append((item, name, batch, delta))
+
+        # Every batch of every billed medicine in one query, nearest expiry first
+        batches = medicine_batches(name for _, name, _, _ in lines)
+
+        changes = []   # (stock pk, signed delta) for lines tied to a batch
+        by_name = []   # (name, qty) for lines without a batch: split FEFO across batches
+        labels = {}    # stock pk / medicine key -> (name, batch) for error messages
+        touched = []
+        for item, name, batch, delta in lines:
+            candidates = batches.get(medicine_key(name), [])
+            stock = None
+            if batch:
+                # Strict match by name and batch
+                stock = next((s for s in candidates if s.batch_no.lower() == batch.lower()), None)
+            elif delta < 0 and candidates:
+                # Giving back a line billed without a batch: to the nearest-expiry batch
+                stock = candidates[0]
+
+            if stock:
+                changes.append((stock.pk, -delta))
+                labels[stock.pk] = (name, batch)
+            elif not batch and candidates:
+                # Fallback to name only if batch is not provided (should be avoided in UI)
+                by_name.append((name, delta))
+                labels[medicine_key(name)] = (name, batch)
+            else:
+                # If it's a new manual entry and no stock found, we should probably warn or block
+                # unless it's a non-pharmacy item mislabeled as dept='PHARMACY'
+                if delta > 0:
+                     raise serializers.ValidationError({
+                        "error": f"No stock record found for {name} (Batch: {batch or 'N/A'})."
+                    })
+                continue
+
+            # Update item tracking
+            item.deducted_qty = int(item.qty)
+            item.stock_deducted = True
+            touched.append(item)
+
+        # Perform stock adjustment: conditional UPDATEs in one consistent order, all lines or none
+        try:
+            # Lines raised take stock (OUT); lines lowered or removed give it back
+            with recording('billing', invoice.id, inbound=StockMovement.RETURN):
+                dispense_medicines(by_name, changes=changes)
+        except InsufficientStock as e:
+            name, batch = labels[e.pk]
+            raise serializers.ValidationError({
+                "error": f"Insufficient stock for {name} (Batch: {batch or 'Any'}). Available: {e.available}, Requested: {e.requested}"
+            })
+
+        if touched:
+            now = timezone.now()
+            for item in touched:
+                item.updated_at = now
+            InvoiceItem.objects.bulk_update(touched, ['deducted_qty', 'stock_deducted', 'updated_at'])
 
     @action(detail=True, methods=['post'])
     def add_payment(self, request, pk=None):
@@ -161,18 +180,14 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             
         invoice.save()
         
-        # Emit Socket Update
-        try:
-             from asgiref.sync import async_to_sync
-             from revive_cms.sio import sio
-             async_to_sync(sio.emit)('billing_update', {
-                 'invoice_id': str(invoice.id),
-                 'amount': float(invoice.total_amount),
-                 'status': invoice.payment_status,
-                 'paid': float(total_paid)
-             })
-        except:
-            pass
+        # Emit Socket Update (after commit)
+        publish_event('billing_update', {
+            'invoice_id': str(invoice.id),
+            'amount': float(invoice.total_amount),
+            'status': invoice.payment_status,
+            'paid': float(total_paid),
+            **snapshot(invoice, INVOICE_SNAPSHOT_FIELDS, paid=total_paid),
+        }, room=InvoiceSerializer.invoice_rooms(invoice))
 
         return Response(InvoiceSerializer(invoice).data)
 
@@ -238,15 +253,24 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def pending_visits(self, request):
-        from django.db.models import Q
+        from django.db.models import Exists, OuterRef
+        from pharmacy.models import PharmacySale
+        from casualty.models import CasualtyMedicine, CasualtyService
         # Pending Billing: Visits that have unbilled pharmacy sales OR casualty items
-        # And no invoice yet
+        # And no invoice yet. EXISTS subqueries avoid the join fan-out + DISTINCT.
+        def has(model):
+            return Exists(model.objects.filter(visit=OuterRef('pk')))
+
         visits = Visit.objects.filter(
-            invoices__isnull=True  # No invoice yet
+            ~has(Invoice)  # No invoice yet
         ).filter(
-            Q(pharmacy_sales__isnull=False) |
-            Q(casualty_medicines__isnull=False) |
-            Q(casualty_services__isnull=False)
-        ).distinct().order_by('-updated_at')
-        serializer = VisitSerializer(visits, many=True)
-        return Response(serializer.data)
+            has(PharmacySale) |
+            has(CasualtyMedicine) |
+            has(CasualtyService)
+        ).order_by('-updated_at')
+        visits = VisitSerializer.setup_eager_loading(visits)
+
+        page = self.paginate_queryset(visits)
+        if page is not None:
+            return self.get_paginated_response(VisitSerializer(page, many=True).data)
+        return Response(VisitSerializer(visits, many=True).data)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import viewsets, permissions, filters
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import (
@@ -53,16 +54,23 @@ class CasualtyMedicineViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return CasualtyMedicine.objects.all().order_by('-created_at')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         from rest_framework.exceptions import ValidationError
-        stock = serializer.validated_data['med_stock']
-        qty = serializer.validated_data['qty']
+        from core.stock import InsufficientStock, take
+        from pharmacy.ledger import recording
+        from pharmacy.models import PharmacyStock, StockMovement
+        stock = serializer.validated_data.get('med_stock')
+        qty = serializer.validated_data.get('qty', 1)
+        visit = serializer.validated_data.get('visit')
 
-        if stock.qty_available < qty:
-            raise ValidationError({"med_stock": f"Insufficient stock. Available: {stock.qty_available}"})
+        if stock:
+            try:
+                with recording('casualty', visit.pk if visit else None, kind=StockMovement.OUT):
+                    take(PharmacyStock, {stock.pk: qty})
+            except InsufficientStock as e:
+                raise ValidationError({"med_stock": f"Insufficient stock. Available: {e.available}"})
 
-        stock.qty_available -= qty
-        stock.save()
         serializer.save()
 
 class CasualtyObservationViewSet(viewsets.ModelViewSet):
@@ -4,6 +4,6 @@ from .models import Notification
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('recipient', 'message', 'type', 'is_read', 'created_at')
-    list_filter = ('type', 'is_read', 'created_at')
+    list_display = ('recipient', 'recipient_role', 'message', 'type', 'is_read', 'created_at')
+    list_filter = ('type', 'recipient_role', 'is_read', 'created_at')
     search_fields = ('recipient__username', 'message')
@@ -0,0 +1,40 @@
+"""
+Subject-keyed alerts (e.g. low stock), de-duplicated on the indexed (type, related_id)
+pair instead of matching message text. Alerts go to role channels: one row per role.
+"""
+from .models import Notification
+from .notifications import invalidate_role, invalidate_user, notification_created
+
+LOW_STOCK = 'LOW_STOCK'
+LAB_LOW_STOCK = 'LAB_LOW_STOCK'
+
+
+def raise_alert(alert_type, related_id, message, roles):
+    """Post to each role channel in `roles` that has no alert for this subject yet (one INSERT)."""
+    alerted = set(Notification.objects.filter(
+        type=alert_type, related_id=related_id, recipient_role__in=roles
+    ).values_list('recipient_role', flat=True))
+
+    created = Notification.objects.bulk_create([
+        Notification(recipient_role=role, message=message, type=alert_type, related_id=related_id)
+        for role in roles if role not in alerted
+    ])
+    for notification in created:
+        notification_created(notification)
+    return len(created)
+
+
+def clear_alerts(alert_type, related_ids):
+    """Drop alerts for subjects that are no longer in the alerted state, refreshing the unread counts they were in."""
+    if not related_ids:
+        return 0
+    alerts = Notification.objects.filter(type=alert_type, related_id__in=related_ids)
+    recipients = set(alerts.values_list('recipient_role', 'recipient_id').distinct())
+    deleted, _ = alerts.delete()
+    if deleted:
+        for role, user_id in recipients:
+            if user_id:
+                invalidate_user(user_id)
+            else:
+                invalidate_role(role)
+    return deleted
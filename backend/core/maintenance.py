@@ -0,0 +1,91 @@
+"""
+Base for data-maintenance commands that rewrite rows in bulk (pharmacy.populate_ptr, ...).
+
+A ChunkedCommand walks `get_queryset()` in primary-key pages (keyset, never OFFSET) and
+hands each page of ids to `process_chunk`, which should change them with set-based
+statements (`update()`, `bulk_update`) and return how many rows it changed. Every chunk
+commits on its own, so a long run holds no lock for long and can be stopped and re-run.
+
+Shared options: --chunk-size, --dry-run (each chunk runs and is rolled back, so the counts
+are exact and nothing is written) and --with-signals.
+
+Model signals (`muted_signals`) are switched off while chunks run: bulk writes skip most of
+them anyway, and a `save()` per row would otherwise raise alerts and rebuild caches row by
+row. That includes the pharmacy stock ledger, so a command that changes stock quantities
+records them itself (pharmacy.ledger.record), as pharmacy.imports does. `finish` runs once
+at the end, for the cache invalidation the muted handlers would have done.
+"""
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+
+@contextmanager
+def muted(signals):
+    """Disconnect every receiver of `signals` for the duration of the block (this process)."""
+    saved = [(signal, signal.receivers) for signal in signals]
+    try:
+        for signal, _ in saved:
+            signal.receivers = []
+            signal.sender_receivers_cache.clear()
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+class ChunkedCommand(BaseCommand):
+    chunk_size = 1000
+    muted_signals = (pre_save, post_save, pre_delete, post_delete)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=self.chunk_size)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change, write nothing')
+        parser.add_argument('--with-signals', action='store_true', help='Leave model signal handlers connected')
+
+    def get_queryset(self, **options):
+        raise NotImplementedError
+
+    def process_chunk(self, ids, **options):
+        """Change the rows with these ids; return how many changed."""
+        raise NotImplementedError
+
+    def finish(self, changed, **options):
+        pass
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        queryset = self.get_queryset(**options)
+        total = queryset.count()
+        seen = changed = 0
+        started = time.monotonic()
+
+        with muted(() if options['with_signals'] else self.muted_signals):
+            for ids in self.chunks(queryset, options['chunk_size']):
+                with transaction.atomic():
+                    changed += self.process_chunk(ids, **options)
+                    if self.dry_run:
+                        transaction.set_rollback(True)
+                seen += len(ids)
+                self.stdout.write(f"{seen}/{total} rows, {changed} changed ({time.monotonic() - started:.1f}s)")
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING(f"Dry run: {changed} of {total} rows would change"))
+        else:
+            self.finish(changed, **options)
+            self.stdout.write(self.style.SUCCESS(f"{changed} of {total} rows changed"))
+
+    def chunks(self, queryset, size):
+        """Ids of `queryset` in keyset pages of `size`."""
+        ids = queryset.order_by('pk').values_list('pk', flat=True)
+        last = None
+        while True:
+            page = list((ids if last is None else ids.filter(pk__gt=last))[:size])
+            if not page:
+                return
+            yield page
+            last = page[-1]
@@ -0,0 +1,175 @@
+import csv
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from core.alerts import LOW_STOCK, LAB_LOW_STOCK
+from core.models import Notification
+from core.notifications import invalidate_role, invalidate_user
+
+ARCHIVE_FIELDS = ['id', 'created_at', 'recipient_id', 'recipient_role', 'type', 'related_id', 'is_read', 'message']
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes (optionally archiving to CSV) read notifications older than --days, collapses '
+        'superseded low-stock alerts and drops alerts for stock that has recovered. '
+        'Works in bounded batches; safe to run nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30),
+                            help='Age after which read notifications are removed')
+        parser.add_argument('--max-days', type=int, default=getattr(settings, 'NOTIFICATION_MAX_AGE_DAYS', None),
+                            help='Age after which every notification is removed, read or not')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--archive', dest='archive_path', help='Append removed rows to this CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.touched_users = set()
+        self.touched_roles = set()
+
+        self.archive_file = None
+        self.writer = None
+        if options['archive_path'] and not self.dry_run:
+            self.archive_file = open(options['archive_path'], 'a', newline='')
+            self.writer = csv.writer(self.archive_file)
+            if self.archive_file.tell() == 0:
+                self.writer.writerow(ARCHIVE_FIELDS)
+
+        try:
+            now = timezone.now()
+            cutoff = now - timedelta(days=options['days'])
+
+            self._remove('read direct notifications', Notification.objects.filter(
+                recipient__isnull=False, is_read=True, created_at__lt=cutoff
+            ))
+            self._remove('read role notifications', self._role_rows_read_by_everyone().filter(created_at__lt=cutoff))
+
+            if options['max_days'] is not None:
+                self._remove('expired notifications', Notification.objects.filter(
+                    created_at__lt=now - timedelta(days=options['max_days'])
+                ), affects_unread=True)
+
+            for alert_type in (LOW_STOCK, LAB_LOW_STOCK):
+                self._remove(f'superseded {alert_type} alerts', self._superseded(alert_type), affects_unread=True)
+            self._remove('recovered LOW_STOCK alerts', self._recovered_pharmacy_alerts(), affects_unread=True)
+            self._remove('recovered LAB_LOW_STOCK alerts', self._recovered_lab_alerts(), affects_unread=True)
+            self._remove('superseded legacy low-stock alerts', self._superseded_legacy(), affects_unread=True)
+        finally:
+            if self.archive_file:
+                self.archive_file.close()
+
+        if not self.dry_run:
+            for user_id in self.touched_users:
+                invalidate_user(user_id)
+            for role in self.touched_roles:
+                invalidate_role(role)
+
+    # --- Selections ---
+
+    def _role_rows_read_by_everyone(self):
+        """Role notifications with a receipt from every active user currently in the role."""
+        User = get_user_model()
+        members = dict(
+            User.objects.filter(is_active=True).values('role').annotate(n=Count('id')).values_list('role', 'n')
+        )
+        condition = Q(pk__in=[])
+        for role, n in members.items():
+            condition |= Q(recipient_role=role, receipt_count__gte=n)
+        # Roles with no active members left: nobody can read those rows any more
+        condition |= Q(recipient_role__isnull=False) & ~Q(recipient_role__in=list(members))
+        return Notification.objects.filter(recipient_role__isnull=False).annotate(
+            receipt_count=Count('receipts')
+        ).filter(condition)
+
+    def _superseded(self, alert_type):
+        """Older alerts for a subject that has a newer alert on the same channel."""
+        newer_role = Notification.objects.filter(
+            type=alert_type, related_id=OuterRef('related_id'),
+            recipient_role=OuterRef('recipient_role'), created_at__gt=OuterRef('created_at'),
+        )
+        newer_direct = Notification.objects.filter(
+            type=alert_type, related_id=OuterRef('related_id'),
+            recipient=OuterRef('recipient'), created_at__gt=OuterRef('created_at'),
+        )
+        return Notification.objects.filter(type=alert_type).filter(
+            Q(recipient_role__isnull=False, pk__in=Notification.objects.filter(
+                type=alert_type, recipient_role__isnull=False
+            ).filter(Exists(newer_role)).values('pk')) |
+            Q(recipient__isnull=False, pk__in=Notification.objects.filter(
+                type=alert_type, recipient__isnull=False
+            ).filter(Exists(newer_direct)).values('pk'))
+        )
+
+    def _recovered_pharmacy_alerts(self):
+        from pharmacy.models import PharmacyStock
+        still_low = PharmacyStock.objects.filter(
+            pk=OuterRef('related_id'), is_deleted=False, qty_available__lte=F('reorder_level')
+        )
+        return Notification.objects.filter(type=LOW_STOCK).exclude(Exists(still_low))
+
+    def _recovered_lab_alerts(self):
+        from lab.models import LabInventory
+        still_low = LabInventory.objects.filter(
+            pk=OuterRef('related_id'), is_deleted=False, qty__lte=F('reorder_level')
+        )
+        return Notification.objects.filter(type=LAB_LOW_STOCK).exclude(Exists(still_low))
+
+    def _superseded_legacy(self):
+        """
+        Per-user text alerts written before alerts were keyed by stock id: keep the newest
+        per (recipient, item) and return the rest. Walks the rows in bounded pages.
+        """
+        legacy = Notification.objects.filter(type='WARNING', related_id__isnull=True).filter(
+            Q(message__startswith='Low stock alert: ') | Q(message__startswith='Lab Low Stock: ')
+        )
+        seen = set()
+        stale = []
+        last = None
+        while True:
+            page = legacy.order_by('-created_at', '-id').values_list('id', 'created_at', 'recipient_id', 'message')
+            if last:
+                page = page.filter(Q(created_at__lt=last[0]) | Q(created_at=last[0], id__lt=last[1]))
+            page = list(page[:self.batch_size])
+            if not page:
+                break
+            for pk, created_at, recipient_id, message in page:
+                key = (recipient_id, message.split(' has only')[0])
+                if key in seen:
+                    stale.append(pk)
+                else:
+                    seen.add(key)
+            last = (page[-1][1], page[-1][0])
+        return Notification.objects.filter(pk__in=stale)
+
+    # --- Removal ---
+
+    def _remove(self, label, queryset, affects_unread=False):
+        if self.dry_run:
+            self.stdout.write(f"{label}: {queryset.count()} would be removed")
+            return 0
+
+        removed = 0
+        while True:
+            rows = list(queryset.order_by('created_at', 'id').values(*ARCHIVE_FIELDS)[:self.batch_size])
+            if not rows:
+                break
+            if self.writer:
+                self.writer.writerows([row[field] for field in ARCHIVE_FIELDS] for row in rows)
+            if affects_unread:
+                self.touched_users.update(row['recipient_id'] for row in rows if row['recipient_id'])
+                self.touched_roles.update(row['recipient_role'] for row in rows if row['recipient_role'])
+            Notification.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            removed += len(rows)
+            self.stdout.write(f"{label}: removed {removed}")
+
+        self.stdout.write(self.style.SUCCESS(f"{label}: {removed} removed"))
+        return removed
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['type', 'related_id'], name='notification_type_related_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.db.models import Case, Exists, F, OuterRef, Q, When
 
 class BaseModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -11,12 +12,104 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+
+class StockLevelMixin:
+    """
+    Remembers the quantity and reorder level a row was loaded (or last saved) with, so a
+    post_save handler can tell whether this save crossed the reorder threshold without
+    re-reading the row. Models set `stock_qty_field` and have a `reorder_level` field.
+    """
+    stock_qty_field = 'qty'
+
+    STOCK_WENT_LOW = 'LOW'
+    STOCK_RECOVERED = 'RECOVERED'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stock_level()
+        return instance
+
+    def remember_stock_level(self):
+        loaded = self.__dict__
+        if self.stock_qty_field in loaded and 'reorder_level' in loaded:
+            self._saved_stock_level = (loaded[self.stock_qty_field], loaded['reorder_level'])
+        else:
+            self._saved_stock_level = None  # deferred fields; unknown
+
+    def stock_level_crossing(self):
+        """STOCK_WENT_LOW / STOCK_RECOVERED when the unsaved -> saved change crossed the threshold, else None."""
+        qty, reorder = getattr(self, self.stock_qty_field), self.reorder_level
+        previous = getattr(self, '_saved_stock_level', None)
+        was_low = previous is not None and previous[0] < previous[1]
+        was_healthy = previous is not None and previous[0] > previous[1]
+
+        if qty < reorder and not was_low:
+            return self.STOCK_WENT_LOW
+        if qty > reorder and not was_healthy:
+            return self.STOCK_RECOVERED
+        return None
+
+
+class NotificationQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        The user's direct notifications merged with their role channel, each with
+        `read_by_user` (own row flag or a read receipt).
+        """
+        receipt = NotificationReceipt.objects.filter(notification=OuterRef('pk'), user=user)
+        return self.filter(
+            Q(recipient=user) | Q(recipient_role=user.role)
+        ).annotate(
+            read_by_user=Case(
+                When(recipient_role__isnull=True, then=F('is_read')),
+                default=Exists(receipt),
+                output_field=models.BooleanField(),
+            )
+        )
+
+
 class Notification(BaseModel):
-    recipient = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='notifications')
+    """
+    Addressed either to one user (`recipient`) or to everyone holding a role
+    (`recipient_role`): a role broadcast is a single row, not one per user.
+    Direct notifications track `is_read` on the row; role notifications record
+    per-user reads in NotificationReceipt.
+    """
+    recipient = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    recipient_role = models.CharField(max_length=20, null=True, blank=True)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     type = models.CharField(max_length=50, default='INFO') # e.g., VISIT_ASSIGNED
     related_id = models.UUIDField(null=True, blank=True)
 
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Alert de-duplication / clean-up by subject (e.g. LOW_STOCK + stock id)
+            models.Index(fields=['type', 'related_id'], name='notification_type_related_idx'),
+            models.Index(fields=['recipient_role', 'created_at'], name='notification_role_created_idx'),
+            # Unread counts / unread-first lists for direct notifications
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(recipient__isnull=False) | Q(recipient_role__isnull=False),
+                name='notification_has_audience',
+            ),
+        ]
+
     def __str__(self):
-        return f"Notification for {self.recipient}: {self.message}"
+        return f"Notification for {self.recipient or self.recipient_role}: {self.message}"
+
+
+class NotificationReceipt(BaseModel):
+    """Sparse: a row exists only once a user has read a role notification."""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='receipts')
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='notification_receipts')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='notification_receipt_unique'),
+        ]
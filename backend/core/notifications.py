@@ -0,0 +1,75 @@
+"""
+Unread counters and live delivery for notifications.
+
+Counts are cached per user under generation keys: a new direct notification bumps the
+user's generation, a new role notification bumps the role's, and mark_read and deletes
+(dismissals, cleared alerts, prune_notifications) bump whichever they touched; the next read
+recounts with two indexed queries.
+
+Generations live in the Django cache, so a process never serves a count older than its own
+last bump. Several workers must share that cache (CACHE_DIR, see settings): with the default
+per-process cache a worker that did not make the change keeps its count for up to
+UNREAD_CACHE_SECONDS.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+
+from revive_cms.realtime import publish_event, snapshot, role_room, user_room
+
+from .models import Notification, NotificationReceipt
+
+UNREAD_CACHE_SECONDS = getattr(settings, 'NOTIFICATION_UNREAD_CACHE_SECONDS', 300)
+
+
+def _generation(key):
+    return cache.get_or_set(key, 1, None)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def _count_key(user):
+    user_gen = _generation(f'notifications:gen:user:{user.id}')
+    role_gen = _generation(f'notifications:gen:role:{user.role}')
+    return f'notifications:unread:{user.id}:{user.role}:{user_gen}:{role_gen}'
+
+
+def unread_count(user):
+    key = _count_key(user)
+    count = cache.get(key)
+    if count is None:
+        direct = Notification.objects.filter(recipient=user, is_read=False).count()
+        role = Notification.objects.filter(recipient_role=user.role).exclude(
+            Exists(NotificationReceipt.objects.filter(notification=OuterRef('pk'), user=user))
+        ).count()
+        count = direct + role
+        cache.set(key, count, UNREAD_CACHE_SECONDS)
+    return count
+
+
+def invalidate_user(user_id):
+    _bump(f'notifications:gen:user:{user_id}')
+
+
+def invalidate_role(role):
+    _bump(f'notifications:gen:role:{role}')
+
+
+def notification_created(notification):
+    """Refresh counters and push the row to its user/role room (after commit)."""
+    if notification.recipient_id:
+        invalidate_user(notification.recipient_id)
+        room = user_room(notification.recipient_id)
+    else:
+        invalidate_role(notification.recipient_role)
+        room = role_room(notification.recipient_role)
+
+    publish_event('notification_new', snapshot(
+        notification, ('recipient_role', 'message', 'type', 'related_id'),
+        is_read=False, timestamp=notification.created_at,
+    ), room=room)
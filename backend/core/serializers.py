@@ -6,5 +6,14 @@ class NotificationSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Notification
-        fields = ['id', 'recipient', 'message', 'is_read', 'type', 'related_id', 'timestamp']
-        read_only_fields = ['recipient', 'created_at']
+        fields = ['id', 'recipient', 'recipient_role', 'message', 'is_read', 'type', 'related_id', 'timestamp']
+        read_only_fields = ['recipient', 'recipient_role', 'created_at']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Role rows: per-user read state from Notification.objects.for_user(). Direct rows
+        # use their own flag, which stays writable (role rows are marked read via mark_read)
+        read = getattr(instance, 'read_by_user', None)
+        if instance.recipient_role and read is not None:
+            data['is_read'] = bool(read)
+        return data
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Notification
+from .notifications import notification_created
+
+
+@receiver(post_save, sender=Notification)
+def announce_notification(sender, instance, created, **kwargs):
+    # bulk_create skips signals; callers of bulk_create call notification_created themselves
+    if created:
+        notification_created(instance)
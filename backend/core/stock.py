@@ -0,0 +1,221 @@
+"""
+Stock movements as conditional UPDATEs instead of read-modify-write saves.
+
+Taking stock is a single statement per row:
+
+    UPDATE ... SET qty = qty - n, updated_at = now WHERE id = <pk> AND qty >= n
+
+The database checks and decrements in one step, so concurrent counters can never
+oversell, and no row is loaded and written back with every column. An affected-row
+count of 0 means the row could not cover the quantity. Multi-line requests move all
+their rows in one such statement (falling back to one per row, in primary-key order,
+to find the row that fell short).
+
+Quantities asked for by name rather than by batch are split across batches nearest expiry
+first (FEFO): `allocate` plans the split over rows read in one query, `dispense` takes the
+whole plan in one `move`.
+
+`.update()` skips post_save, so moved rows are announced through `stock_moved`;
+pharmacy.signals and lab.signals raise or clear low-stock alerts from it, and
+pharmacy.signals appends the moves to the stock ledger.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import GreaterThanOrEqual
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent with `instances`: the moved rows re-read after the UPDATEs, each remembering
+# (StockLevelMixin) the level it had before the move, and `deltas`: {pk: signed change}
+# as requested (a partial take may have moved less).
+stock_moved = Signal()
+
+# Passes over the candidate rows in consume_in_order before settling for a shortfall
+CONSUME_ATTEMPTS = 3
+
+
+class InsufficientStock(Exception):
+    def __init__(self, pk, requested, available):
+        self.pk = pk
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Insufficient stock for {pk}: requested {requested}, available {available}")
+
+
+def move(model, changes, field=None, partial=False):
+    """
+    Apply signed quantity `changes` ({pk: delta} or (pk, delta) pairs; repeated rows are
+    summed) to `model` rows. Negative deltas are conditional takes and raise
+    InsufficientStock for a row that cannot cover them, so call this inside
+    transaction.atomic to roll back the rows already moved. With partial=True a take stops
+    at zero instead (qty = MAX(qty - n, 0)) and never raises.
+
+    Several rows move in one UPDATE (qty = qty + CASE id ... END, only where the result
+    stays >= 0); if any row could not cover its take, that statement is undone and the
+    rows are moved one by one in primary-key order, which names the row that failed.
+    """
+    field = field or getattr(model, 'stock_qty_field', 'qty')
+    deltas = _merge(changes)
+
+    if partial or len(deltas) < 2 or not _move_together(model, field, deltas):
+        _move_each(model, field, deltas, partial)
+
+    _announce(model, field, deltas)
+    return deltas
+
+
+class _FellShort(Exception):
+    pass
+
+
+def _move_together(model, field, deltas):
+    """One conditional UPDATE for every row; False (and nothing moved) if a row fell short."""
+    delta = Case(*[When(pk=pk, then=Value(n)) for pk, n in deltas.items()], output_field=IntegerField())
+    try:
+        with transaction.atomic():
+            updated = model.objects.filter(pk__in=list(deltas)).filter(
+                GreaterThanOrEqual(F(field) + delta, 0)
+            ).update(**{field: F(field) + delta, 'updated_at': timezone.now()})
+            if updated != len(deltas):
+                raise _FellShort
+    except _FellShort:
+        return False
+    return True
+
+
+def _move_each(model, field, deltas, partial):
+    now = timezone.now()
+    for pk in sorted(deltas, key=str):
+        delta = deltas[pk]
+        rows = model.objects.filter(pk=pk)
+        if delta > 0:
+            rows.update(**{field: F(field) + delta, 'updated_at': now})
+        elif partial:
+            rows.update(**{field: Greatest(F(field) + delta, 0), 'updated_at': now})
+        elif not rows.filter(**{f'{field}__gte': -delta}).update(**{field: F(field) + delta, 'updated_at': now}):
+            raise InsufficientStock(pk, -delta, rows.values_list(field, flat=True).first())
+
+
+def take(model, quantities, field=None, partial=False):
+    """Conditional decrement of {pk: n} (see `move`)."""
+    return move(model, [(pk, -n) for pk, n in _pairs(quantities)], field=field, partial=partial)
+
+
+def put(model, quantities, field=None):
+    """Increment of {pk: n}, e.g. a restock or a reversed deduction."""
+    return move(model, _pairs(quantities), field=field)
+
+
+def allocate(batches, lines, field='qty', reserved=None):
+    """
+    FEFO split, nothing written: each (key, qty) of `lines` is drawn from batches[key]
+    (rows nearest expiry first) in turn, and lines sharing a key draw down the same rows.
+    `reserved` ({pk: qty}) is already spoken for. Returns one ([(row, n), ...], shortfall)
+    per line.
+    """
+    reserved = reserved or {}
+    left = {}
+    allocation = []
+    for key, qty in lines:
+        taken = []
+        remaining = qty
+        for row in batches.get(key, ()):
+            if remaining <= 0:
+                break
+            available = left[row.pk] if row.pk in left else getattr(row, field) - reserved.get(row.pk, 0)
+            n = min(available, remaining)
+            if n > 0:
+                taken.append((row, n))
+                left[row.pk] = available - n
+                remaining -= n
+        allocation.append((taken, max(remaining, 0)))
+    return allocation
+
+
+def dispense(model, load, lines, changes=(), field=None, allow_shortfall=False):
+    """
+    Allocate `lines` ([(key, qty), ...]) over the batches `load()` reads in one query
+    ({key: [row, ...]} nearest expiry first) and take them, together with any fixed
+    `changes`, in one conditional `move` inside a savepoint.
+    A batch drained since it was read fails its UPDATE, and the allocation is re-planned
+    from a fresh read (CONSUME_ATTEMPTS times). Unless allow_shortfall, a line the
+    batches cannot cover raises InsufficientStock(key, requested, available) and nothing
+    moves. Returns the allocation (see `allocate`).
+    """
+    field = field or getattr(model, 'stock_qty_field', 'qty')
+    changes = list(_pairs(changes))
+    # Fixed takes come first: FEFO lines only get what they leave
+    reserved = {pk: -delta for pk, delta in _merge(changes).items() if delta < 0}
+    for attempt in range(CONSUME_ATTEMPTS):
+        allocation = allocate(load(), lines, field, reserved)
+        if not allow_shortfall:
+            for (key, qty), (_, shortfall) in zip(lines, allocation):
+                if shortfall:
+                    raise InsufficientStock(key, qty, qty - shortfall)
+
+        planned = {row.pk: key for (key, _), (taken, _) in zip(lines, allocation) for row, _ in taken}
+        try:
+            with transaction.atomic():
+                move(model, changes + [
+                    (row.pk, -n) for taken, _ in allocation for row, n in taken
+                ], field=field)
+            return allocation
+        except InsufficientStock as e:
+            if e.pk not in planned:
+                raise
+            if attempt == CONSUME_ATTEMPTS - 1:
+                raise InsufficientStock(planned[e.pk], e.requested, e.available)
+
+
+def consume_in_order(queryset, qty, field='qty'):
+    """
+    Take up to `qty` from the rows of `queryset` in its order (order by expiry, then id,
+    for FIFO/FEFO: callers sharing that order also share a lock order). Each step is one
+    conditional decrement; a row drained concurrently since it was read is re-read on the
+    next pass. Returns ([(pk, taken), ...], shortfall).
+    """
+    model = queryset.model
+    remaining = qty
+    taken = {}
+
+    for _ in range(CONSUME_ATTEMPTS):
+        if remaining <= 0:
+            break
+        candidates = list(queryset.filter(**{f'{field}__gt': 0}).only('pk', field))
+        if not candidates:
+            break
+        [(planned, _)] = allocate({None: candidates}, [(None, remaining)], field)
+        for row, n in planned:
+            updated = model.objects.filter(pk=row.pk, **{f'{field}__gte': n}).update(
+                **{field: F(field) - n, 'updated_at': timezone.now()}
+            )
+            if updated:
+                taken[row.pk] = taken.get(row.pk, 0) + n
+                remaining -= n
+
+    _announce(model, field, {pk: -n for pk, n in taken.items()})
+    return list(taken.items()), remaining
+
+
+def _pairs(quantities):
+    return quantities.items() if isinstance(quantities, dict) else quantities
+
+
+def _merge(changes):
+    merged = {}
+    for pk, delta in _pairs(changes):
+        merged[pk] = merged.get(pk, 0) + delta
+    return {pk: delta for pk, delta in merged.items() if delta}
+
+
+def _announce(model, field, deltas):
+    """Re-read moved rows (one query) for stock_moved receivers, if there are any."""
+    if not deltas or not stock_moved.has_listeners(model):
+        return
+    rows = list(model.objects.filter(pk__in=list(deltas)))
+    if field == getattr(model, 'stock_qty_field', None):
+        by_id = {str(pk): delta for pk, delta in deltas.items()}
+        for row in rows:
+            row._saved_stock_level = (max(getattr(row, field) - by_id[str(row.pk)], 0), row.reorder_level)
+    stock_moved.send(sender=model, instances=rows, deltas=deltas)
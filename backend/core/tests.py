@@ -1,3 +1,152 @@
+from types import SimpleNamespace
+
+from django.db import transaction
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.models import Notification
+from core.notifications import unread_count
+from core.stock import InsufficientStock, allocate, dispense, put, take
+from pharmacy.models import PharmacyStock
+from users.models import User
+
+
+def make_stock(batch_no, qty, expiry_date='2030-01-01', name='Paracetamol'):
+    return PharmacyStock.objects.create(
+        name=name, batch_no=batch_no, expiry_date=expiry_date, mrp=10, selling_price=10, qty_available=qty,
+    )
+
+
+def stock_qty(stock):
+    return PharmacyStock.objects.values_list('qty_available', flat=True).get(pk=stock.pk)
+
+
+class TakePutTests(TestCase):
+    def setUp(self):
+        self.first = make_stock('B1', 5)
+        self.second = make_stock('B2', 3)
+
+    def test_take_decrements_when_covered(self):
+        take(PharmacyStock, {self.first.pk: 4})
+        self.assertEqual(stock_qty(self.first), 1)
+
+    def test_take_refuses_more_than_available(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            take(PharmacyStock, {self.first.pk: 6})
+        self.assertEqual((raised.exception.pk, raised.exception.requested, raised.exception.available),
+                         (self.first.pk, 6, 5))
+        self.assertEqual(stock_qty(self.first), 5)
+
+    def test_take_of_several_rows_moves_none_when_one_falls_short(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            with transaction.atomic():
+                take(PharmacyStock, {self.first.pk: 2, self.second.pk: 4})
+        self.assertEqual(raised.exception.pk, self.second.pk)
+        self.assertEqual((stock_qty(self.first), stock_qty(self.second)), (5, 3))
+
+    def test_partial_take_stops_at_zero(self):
+        take(PharmacyStock, {self.first.pk: 2, self.second.pk: 7}, partial=True)
+        self.assertEqual((stock_qty(self.first), stock_qty(self.second)), (3, 0))
+
+    def test_put_increments(self):
+        put(PharmacyStock, {self.first.pk: 2})
+        put(PharmacyStock, [(self.first.pk, 1), (self.second.pk, 4)])
+        self.assertEqual((stock_qty(self.first), stock_qty(self.second)), (8, 7))
+
+    def test_take_does_not_overwrite_a_concurrent_change(self):
+        stale = PharmacyStock.objects.get(pk=self.first.pk)
+        PharmacyStock.objects.filter(pk=self.first.pk).update(qty_available=2)
+        with self.assertRaises(InsufficientStock):
+            take(PharmacyStock, {stale.pk: stale.qty_available})
+        self.assertEqual(stock_qty(self.first), 2)
+
+
+class AllocateTests(TestCase):
+    def rows(self, *qtys):
+        return [SimpleNamespace(pk=index, qty=qty) for index, qty in enumerate(qtys)]
+
+    def test_splits_nearest_expiry_first(self):
+        near, far = self.rows(3, 10)
+        [(taken, shortfall)] = allocate({'para': [near, far]}, [('para', 5)])
+        self.assertEqual(taken, [(near, 3), (far, 2)])
+        self.assertEqual(shortfall, 0)
+
+    def test_reports_shortfall_across_batches(self):
+        near, far = self.rows(3, 2)
+        [(taken, shortfall)] = allocate({'para': [near, far]}, [('para', 8)])
+        self.assertEqual(taken, [(near, 3), (far, 2)])
+        self.assertEqual(shortfall, 3)
+
+    def test_lines_of_one_key_share_batches_and_respect_reserved(self):
+        near, far = self.rows(4, 4)
+        allocation = allocate({'para': [near, far]}, [('para', 3), ('para', 3), ('amox', 1)], reserved={near.pk: 1})
+        self.assertEqual(allocation, [([(near, 3)], 0), ([(far, 3)], 0), ([], 1)])
+
+
+class DispenseTests(TestCase):
+    def setUp(self):
+        self.far = make_stock('FAR', 5, expiry_date='2031-01-01')
+        self.near = make_stock('NEAR', 3, expiry_date='2030-01-01')
+
+    def load(self):
+        return {'para': list(PharmacyStock.objects.order_by('expiry_date', 'id'))}
+
+    def test_takes_fefo_split(self):
+        dispense(PharmacyStock, self.load, [('para', 4)])
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (0, 4))
+
+    def test_shortfall_raises_and_moves_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            dispense(PharmacyStock, self.load, [('para', 2), ('para', 7)])
+        self.assertEqual((raised.exception.pk, raised.exception.requested, raised.exception.available), ('para', 7, 6))
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (3, 5))
+
+    def test_allowed_shortfall_takes_what_there_is(self):
+        [(taken, shortfall)] = dispense(PharmacyStock, self.load, [('para', 10)], allow_shortfall=True)
+        self.assertEqual([(row.pk, n) for row, n in taken], [(self.near.pk, 3), (self.far.pk, 5)])
+        self.assertEqual(shortfall, 2)
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (0, 0))
+
+    def test_fixed_change_falling_short_rolls_back_fefo_lines(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            with transaction.atomic():
+                dispense(PharmacyStock, self.load, [('para', 1)], changes={self.far.pk: -9})
+        self.assertEqual(raised.exception.pk, self.far.pk)
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (3, 5))
+
+
+class MarkReadTests(TestCase):
+    url = '/api/core/notifications/mark_read/'
+
+    def setUp(self):
+        self.user = User.objects.create(username='reception', role='RECEPTION')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.direct = Notification.objects.create(recipient=self.user, message='Visit assigned')
+        self.shared = Notification.objects.create(recipient_role='RECEPTION', message='Low stock')
+
+    def test_without_ids_marks_nothing(self):
+        for payload in ({}, {'ids': []}):
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'status': 'ok', 'unread': 2})
+
+    def test_marks_direct_and_role_notifications(self):
+        response = self.client.post(self.url, {'ids': [str(self.direct.id), str(self.shared.id)]}, format='json')
+        self.assertEqual(response.json()['unread'], 0)
+        self.direct.refresh_from_db()
+        self.assertTrue(self.direct.is_read)
+        self.assertTrue(self.shared.receipts.filter(user=self.user).exists())
+
+
+class ClearAlertsTests(TestCase):
+    def test_restock_refreshes_cached_unread_count(self):
+        user = User.objects.create(username='pharmacist', role='PHARMACY')
+        stock = make_stock('LOW', 20)
+        take(PharmacyStock, {stock.pk: 15})
+        self.assertEqual(unread_count(user), 1)
+
+        put(PharmacyStock, {stock.pk: 30})
 
-# Create your tests here.
+        self.assertFalse(Notification.objects.filter(related_id=stock.pk).exists())
+        self.assertEqual(unread_count(user), 0)
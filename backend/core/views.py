@@ -50,6 +50,10 @@ class DashboardStatsView(APIView):
         from django.db.models import F
         low_stock_count = PharmacyStock.objects.filter(qty_available__lte=F('reorder_level'), is_deleted=False).count()
 
+        # 6. Expiry buckets, pharmacy and lab (nightly table, see reports.expiry)
+        from reports.expiry import bucket_summary, expiry_rows
+        expiry = bucket_summary(expiry_rows()[0])
+
         data = {
             "patients_today": new_patients_today,
             "active_visits": active_visits,
@@ -57,6 +61,7 @@ class DashboardStatsView(APIView):
             "pharmacy_low_stock": low_stock_count,
             "pending_labs": pending_labs,
             "recent_visits": recent_visits_data,
+            "expiry_buckets": [{**bucket, "value_at_risk": float(bucket['value_at_risk'])} for bucket in expiry],
             "revenue_trend": [{ "date": item['date'], "amount": float(item['total']) } for item in weekly_revenue]
         }
 
@@ -64,7 +69,9 @@ class DashboardStatsView(APIView):
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from .models import Notification
+from rest_framework.exceptions import PermissionDenied
+from .models import Notification, NotificationReceipt
+from .notifications import unread_count, invalidate_user
 from .serializers import NotificationSerializer
 
 class NotificationViewSet(viewsets.ModelViewSet):
@@ -72,11 +79,45 @@ class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user).order_by('-created_at')
+        # Own notifications + the user's role channel (indexed on recipient / recipient_role)
+        return Notification.objects.for_user(self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(recipient=self.request.user)
+
+    def perform_update(self, serializer):
+        if serializer.instance.recipient_role:
+            raise PermissionDenied("Role notifications are shared; use mark_read.")
+        serializer.save()
+        invalidate_user(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        if instance.recipient_role:
+            # Shared role row: dismissing it only marks it read for this user
+            NotificationReceipt.objects.get_or_create(notification=instance, user=self.request.user)
+        else:
+            instance.delete()
+        invalidate_user(self.request.user.id)
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        """Badge count from the per-user cache; poll-free clients refresh it on `notification_new`."""
+        return Response({'unread': unread_count(request.user)})
 
     @action(detail=False, methods=['post'])
     def mark_read(self, request):
         ids = request.data.get('ids', [])
+        user = request.user
         if ids:
-            self.get_queryset().filter(id__in=ids).update(is_read=True)
-        return Response({'status': 'ok'})
+            # Direct notifications carry their own flag
+            Notification.objects.filter(id__in=ids, recipient=user).update(is_read=True)
+            # Role notifications get a per-user receipt (idempotent)
+            role_ids = Notification.objects.filter(
+                id__in=ids, recipient_role=user.role
+            ).values_list('id', flat=True)
+            NotificationReceipt.objects.bulk_create(
+                [NotificationReceipt(notification_id=nid, user=user) for nid in role_ids],
+                ignore_conflicts=True
+            )
+            invalidate_user(user.id)
+        return Response({'status': 'ok', 'unread': unread_count(user)})
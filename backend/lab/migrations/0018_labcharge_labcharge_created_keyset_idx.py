@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0017_labinventory_items_per_pack'),
+        ('patients', '0011_patient_patient_created_keyset_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labcharge',
+            index=models.Index(fields=['created_at', 'id'], name='labcharge_created_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0018_labcharge_labcharge_created_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labbatch',
+            index=models.Index(fields=['is_deleted', 'expiry_date'], name='labbatch_live_expiry_idx'),
+        ),
+    ]
@@ -2,7 +2,7 @@ import uuid
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from core.models import BaseModel
+from core.models import BaseModel, StockLevelMixin
 from patients.models import Visit
 
 
@@ -17,7 +17,7 @@ class LabSupplier(BaseModel):
         return self.supplier_name
 
 
-class LabInventory(BaseModel):
+class LabInventory(StockLevelMixin, BaseModel):
     item_name = models.CharField(max_length=255)
     category = models.CharField(max_length=50)
     qty = models.PositiveIntegerField(default=0)
@@ -60,6 +60,11 @@ class LabBatch(BaseModel):
     
     supplier = models.ForeignKey(LabSupplier, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_deleted', 'expiry_date'], name='labbatch_live_expiry_idx'),
+        ]
+
     def __str__(self):
         return f"{self.inventory_item.item_name} ({self.batch_no})"
 
@@ -144,6 +149,11 @@ class LabCharge(BaseModel):
     technician_name = models.CharField(max_length=255, blank=True, null=True)
     specimen = models.CharField(max_length=100, default='BLOOD', blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='labcharge_created_keyset_idx'),
+        ]
+
     def __str__(self):
         return f"{self.test_name} - {getattr(self.visit, 'id', self.visit.id)}"
 
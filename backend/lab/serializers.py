@@ -1,10 +1,17 @@
 from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
+from core.stock import put
+from revive_cms.realtime import publish_event, snapshot, role_room, doctor_room, patient_room, visit_room
 from .models import (
     LabInventory, LabCharge, LabInventoryLog, LabTest, LabTestParameter, 
     LabTestRequiredItem, LabCategory, LabSupplier, LabPurchase, LabPurchaseItem, LabBatch
 )
 
+# Compact rows sent with socket events so clients can patch in place
+LAB_CHARGE_SNAPSHOT_FIELDS = ('visit_id', 'test_name', 'sub_name', 'amount', 'status', 'results', 'report_date', 'technician_name', 'updated_at')
+LAB_PURCHASE_SNAPSHOT_FIELDS = ('total_amount', 'updated_at')
+
 
 class LabSupplierSerializer(serializers.ModelSerializer):
     class Meta:
@@ -193,11 +200,13 @@ class LabPurchaseSerializer(serializers.ModelSerializer):
             )
             
             if not created:
-                # Update latest cost and details
-                inventory_item.cost_per_unit = item_data.get('unit_cost', inventory_item.cost_per_unit)
-                inventory_item.is_liquid = is_liquid # Ensure liquid status is updated/consistent
-                inventory_item.items_per_pack = items_per_pack
-                inventory_item.save()
+                # Update latest cost and details (qty is left to the increment below)
+                LabInventory.objects.filter(pk=inventory_item.pk).update(
+                    cost_per_unit=item_data.get('unit_cost', inventory_item.cost_per_unit),
+                    is_liquid=is_liquid, # Ensure liquid status is updated/consistent
+                    items_per_pack=items_per_pack,
+                    updated_at=timezone.now(),
+                )
 
             # 2. Create Batch
             batch = LabBatch.objects.create(
@@ -219,8 +228,7 @@ class LabPurchaseSerializer(serializers.ModelSerializer):
             )
             
             # 4. Update Master Inventory Qty
-            inventory_item.qty += item_data['qty']
-            inventory_item.save()
+            put(LabInventory, {inventory_item.pk: item_data['qty']})
             
             # 5. Log Transaction
             LabInventoryLog.objects.create(
@@ -232,16 +240,12 @@ class LabPurchaseSerializer(serializers.ModelSerializer):
                 notes=f"Purchase Inv: {purchase.supplier_invoice_no}"
             )
 
-        # Emit Socket Event for Real-time Reports
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            async_to_sync(sio.emit)('lab_inventory_update', {
-                'purchase_id': str(purchase.id),
-                'amount': float(purchase.total_amount)
-            })
-        except Exception as e:
-            print(f"Socket emit error: {e}")
+        # Emit Socket Event for Real-time Reports (after commit)
+        publish_event('lab_inventory_update', {
+            'purchase_id': str(purchase.id),
+            'amount': float(purchase.total_amount),
+            **snapshot(purchase, LAB_PURCHASE_SNAPSHOT_FIELDS),
+        }, room=[role_room('ADMIN'), role_room('LAB')])
 
         return purchase
 
@@ -267,15 +271,14 @@ class LabChargeSerializer(serializers.ModelSerializer):
         instance = super().update(instance, validated_data)
         
         if instance.status == 'COMPLETED':
-             try:
-                from asgiref.sync import async_to_sync
-                from revive_cms.sio import sio
-                
-                async_to_sync(sio.emit)('lab_update', {
-                    'lc_id': str(instance.id),
-                    'visit_id': str(instance.visit.id),
-                    'status': 'COMPLETED'
-                })
-             except Exception as e:
-                print(f"Socket emit error: {e}")
+            visit = instance.visit
+            rooms = [role_room('ADMIN'), role_room('LAB'), visit_room(visit.id), patient_room(visit.patient_id)]
+            if visit.doctor_id:
+                rooms.append(doctor_room(visit.doctor_id))
+            publish_event('lab_update', {
+                'lc_id': str(instance.id),
+                'visit_id': str(instance.visit.id),
+                'status': 'COMPLETED',
+                **snapshot(instance, LAB_CHARGE_SNAPSHOT_FIELDS),
+            }, room=rooms)
         return instance
@@ -1,27 +1,35 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import LabInventory
-from core.models import Notification
-from django.contrib.auth import get_user_model
+from core.alerts import LAB_LOW_STOCK, raise_alert, clear_alerts
+from core.stock import stock_moved
+
+
+def sync_lab_low_stock_alerts(items, created=False):
+    """Raise or clear alerts for items whose qty crossed the reorder level (saves and bulk moves)."""
+    recovered = []
+    for item in items:
+        # Only saves that cross the reorder threshold touch the notification table
+        crossing = item.stock_level_crossing()
+        item.remember_stock_level()
+
+        if crossing == LabInventory.STOCK_WENT_LOW:
+            raise_alert(
+                LAB_LOW_STOCK, item.id,
+                f"Lab Low Stock: {item.item_name} has only {item.qty} units left.",
+                roles=['LAB', 'ADMIN'],
+            )
+        elif crossing == LabInventory.STOCK_RECOVERED and not created:
+            recovered.append(item.id)
+
+    clear_alerts(LAB_LOW_STOCK, recovered)
 
-User = get_user_model()
 
 @receiver(post_save, sender=LabInventory)
-def check_lab_low_stock(sender, instance, **kwargs):
-    if instance.qty < instance.reorder_level:
-        # Check active notification
-        pass_check = Notification.objects.filter(
-            message__contains=f"Lab Low Stock: {instance.item_name}",
-            is_read=False
-        ).exists()
-
-        if not pass_check:
-            recipients = User.objects.filter(role__in=['LAB', 'ADMIN'], is_active=True)
-            notifications = [
-                Notification(
-                    recipient=u,
-                    message=f"Lab Low Stock: {instance.item_name} has only {instance.qty} units left.",
-                    type='WARNING'
-                ) for u in recipients
-            ]
-            Notification.objects.bulk_create(notifications)
+def check_lab_low_stock(sender, instance, created, **kwargs):
+    sync_lab_low_stock_alerts([instance], created=created)
+
+
+@receiver(stock_moved, sender=LabInventory)
+def check_lab_low_stock_after_move(sender, instances, **kwargs):
+    sync_lab_low_stock_alerts(instances)
@@ -2,7 +2,7 @@ from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db import models
+from django.db import models, transaction
 
 from billing.models import Invoice, InvoiceItem
 from .models import (
@@ -14,12 +14,13 @@ from .serializers import (
     LabTestSerializer, LabCategorySerializer, LabSupplierSerializer, LabPurchaseSerializer
 )
 
-from rest_framework.pagination import PageNumberPagination
+from core.stock import InsufficientStock, take, put, consume_in_order
+from revive_cms.pagination import CursorOrPageNumberPagination
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(CursorOrPageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 10000
+    max_page_size = 200
 
 class IsLabOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -81,12 +82,13 @@ class LabInventoryViewSet(viewsets.ModelViewSet):
         if qty <= 0:
             return Response({'error': 'Quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Update Stock
-        item.qty += qty
-        # Update cost if provided
-        if float(cost) > 0:
-            item.cost_per_unit = cost
-        item.save()
+        with transaction.atomic():
+            # Update Stock
+            put(LabInventory, {item.pk: qty})
+            # Update cost if provided
+            if float(cost) > 0:
+                LabInventory.objects.filter(pk=item.pk).update(cost_per_unit=cost)
+            item.refresh_from_db()
 
         # Log
         LabInventoryLog.objects.create(
@@ -109,35 +111,26 @@ class LabInventoryViewSet(viewsets.ModelViewSet):
         if qty <= 0:
             return Response({'error': 'Quantity must be positive'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if item.qty < qty:
-            return Response({'error': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Update Stock
-        item.qty -= qty
-        item.save()
-        
-        # Deduct from batches (FIFO)
-        remaining_to_deduct = qty
-        batches = LabBatch.objects.filter(inventory_item=item, qty__gt=0).order_by('expiry_date')
-        
-        for batch in batches:
-            if remaining_to_deduct <= 0:
-                break
-            
-            deduct = min(batch.qty, remaining_to_deduct)
-            batch.qty -= deduct
-            batch.save()
-            remaining_to_deduct -= deduct
-
-        # Log
-        LabInventoryLog.objects.create(
-            item=item,
-            transaction_type='STOCK_OUT',
-            qty=qty,
-            performed_by=user,
-            notes=request.data.get('notes', 'Quick adjustment')
-        )
+        with transaction.atomic():
+            # Update Stock (conditional: fails rather than going below zero)
+            try:
+                take(LabInventory, {item.pk: qty})
+            except InsufficientStock:
+                return Response({'error': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Deduct from batches (FIFO)
+            consume_in_order(LabBatch.objects.filter(inventory_item=item).order_by('expiry_date', 'id'), qty)
+
+            # Log
+            LabInventoryLog.objects.create(
+                item=item,
+                transaction_type='STOCK_OUT',
+                qty=qty,
+                performed_by=user,
+                notes=request.data.get('notes', 'Quick adjustment')
+            )
 
+        item.refresh_from_db()
         return Response(self.get_serializer(item).data)
 
 
@@ -166,6 +159,7 @@ class LabChargeViewSet(viewsets.ModelViewSet):
     serializer_class = LabChargeSerializer
     permission_classes = [IsLabOrAdmin]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['test_name', 'visit__patient__full_name', 'visit__patient__phone']
     filterset_fields = ['visit', 'status']
@@ -193,18 +187,11 @@ class LabChargeViewSet(viewsets.ModelViewSet):
                         
                         if inv_id and qty_used > 0:
                             inv_item = LabInventory.objects.get(id=inv_id)
-                            inv_item.qty = max(0, inv_item.qty - qty_used)
-                            inv_item.save()
+                            # Used is used: the master count stops at zero rather than failing
+                            take(LabInventory, {inv_item.pk: qty_used}, partial=True)
                             
                             # FIFO Logic for batches
-                            remaining_to_deduct = qty_used
-                            batches = LabBatch.objects.filter(inventory_item=inv_item, qty__gt=0).order_by('expiry_date')
-                            for batch in batches:
-                                if remaining_to_deduct <= 0: break
-                                deduct = min(batch.qty, remaining_to_deduct)
-                                batch.qty -= deduct
-                                batch.save()
-                                remaining_to_deduct -= deduct
+                            consume_in_order(LabBatch.objects.filter(inventory_item=inv_item).order_by('expiry_date', 'id'), qty_used)
 
                             LabInventoryLog.objects.create(
                                 item=inv_item,
@@ -222,18 +209,10 @@ class LabChargeViewSet(viewsets.ModelViewSet):
                             qty_needed = requirement.qty_per_test
                             
                             # Deduct Stock (Master)
-                            inventory_item.qty = max(0, inventory_item.qty - qty_needed)
-                            inventory_item.save()
+                            take(LabInventory, {inventory_item.pk: qty_needed}, partial=True)
                             
                             # FIFO Logic for batches
-                            remaining_to_deduct = qty_needed
-                            batches = LabBatch.objects.filter(inventory_item=inventory_item, qty__gt=0).order_by('expiry_date')
-                            for batch in batches:
-                                if remaining_to_deduct <= 0: break
-                                deduct = min(batch.qty, remaining_to_deduct)
-                                batch.qty -= deduct
-                                batch.save()
-                                remaining_to_deduct -= deduct
+                            consume_in_order(LabBatch.objects.filter(inventory_item=inventory_item).order_by('expiry_date', 'id'), qty_needed)
                             
                             # Log Transaction
                             LabInventoryLog.objects.create(
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from revive_cms.realtime import publish_event, snapshot, role_room, patient_room, visit_room
 from .models import DoctorNote
 
 
@@ -42,7 +43,8 @@ class DoctorNoteSerializer(serializers.ModelSerializer):
         This ensures POS/Billing sees the medicines immediately.
         """
         try:
-            from pharmacy.models import PharmacySale, PharmacySaleItem, PharmacyStock
+            from pharmacy.models import PharmacySale, PharmacySaleItem
+            from pharmacy.dispensing import medicine_batches, medicine_key, plan_medicines
             from django.db import transaction
 
             # Only proceed if there is a prescription
@@ -72,8 +74,7 @@ class DoctorNoteSerializer(serializers.ModelSerializer):
                 # (Simple overwrite strategy for PENDING sales)
                 sale.items.all().delete()
 
-                total_amt = 0
-
+                lines = []
                 for med_name, details in note.prescription.items():
                     # Parse Qty: "Dosage | Duration | Qty: 10"
                     try:
@@ -84,42 +85,40 @@ class DoctorNoteSerializer(serializers.ModelSerializer):
                                 qty_str = parts[1].strip().split(" ")[0] # Handle cases like "10 (Tabs)"
                                 qty = int(qty_str)
                         
-                        if qty <= 0:
-                            continue
-
-                        # Find Stock (Best effort by name, usually doctor selects generic name)
-                        # We pick the batch with earliest expiry or just first available
-                        stock_item = PharmacyStock.objects.filter(
-                            name__iexact=med_name, 
-                            qty_available__gt=0,
-                            is_deleted=False
-                        ).order_by('expiry_date').first()
-
-                        # If no stock with qty, just pick any stock record for price reference? 
-                        # Or fallback to stock with 0 qty.
-                        if not stock_item:
-                             stock_item = PharmacyStock.objects.filter(
-                                name__iexact=med_name,
-                                is_deleted=False
-                            ).first()
-
-                        if stock_item:
-                            price = stock_item.selling_price if stock_item.selling_price > 0 else stock_item.mrp
-                            amount = price * qty
-                            
-                            PharmacySaleItem.objects.create(
-                                sale=sale,
-                                med_stock=stock_item,
-                                qty=qty,
-                                unit_price=price,
-                                amount=amount,
-                                gst_percent=stock_item.gst_percent
-                            )
-                            total_amt += amount
+                        if qty > 0:
+                            lines.append((med_name, qty))
                     except Exception as e:
                         print(f"Error syncing med {med_name}: {e}")
                         continue
 
+                # One query for every prescribed medicine's batches; each quantity is split
+                # across batches nearest expiry first (stock is taken at billing)
+                batches = medicine_batches(name for name, _ in lines)
+                items = []
+                for (med_name, qty), (taken, shortfall) in zip(lines, plan_medicines(lines, batches)):
+                    if shortfall:
+                        # Not enough in stock: the rest stays on the last batch (or any batch,
+                        # for pricing) so the pharmacy sees the full prescribed quantity
+                        candidates = batches.get(medicine_key(med_name))
+                        if taken:
+                            taken[-1] = (taken[-1][0], taken[-1][1] + shortfall)
+                        elif candidates:
+                            taken = [(candidates[0], shortfall)]
+
+                    for stock_item, batch_qty in taken:
+                        price = stock_item.selling_price if stock_item.selling_price > 0 else stock_item.mrp
+                        items.append(PharmacySaleItem(
+                            sale=sale,
+                            med_stock=stock_item,
+                            qty=batch_qty,
+                            unit_price=price,
+                            amount=price * batch_qty,
+                            gst_percent=stock_item.gst_percent
+                        ))
+
+                PharmacySaleItem.objects.bulk_create(items)
+                total_amt = sum(item.amount for item in items)
+
                 sale.total_amount = total_amt
                 sale.save()
 
@@ -127,18 +126,21 @@ class DoctorNoteSerializer(serializers.ModelSerializer):
             print(f"Error in _sync_pharmacy_sale: {e}")
 
     def emit_socket_update(self, note):
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            
-            data = {
-                'visit_id': str(note.visit.id),
-                'note_id': str(note.id),
-                'has_prescription': bool(note.prescription),
-                'has_lab': bool(note.lab_referral_details)
-            }
-            async_to_sync(sio.emit)('doctor_notes_update', data)
-        except Exception as e:
-            print(f"Socket emit error: {e}")
+        # Queued on commit and emitted by the ASGI dispatcher (see revive_cms.realtime)
+        publish_event('doctor_notes_update', {
+            'visit_id': str(note.visit.id),
+            'note_id': str(note.id),
+            'has_prescription': bool(note.prescription),
+            'has_lab': bool(note.lab_referral_details),
+            **snapshot(
+                note, ('visit_id', 'updated_at'),
+                has_prescription=bool(note.prescription),
+                has_lab=bool(note.lab_referral_details),
+            ),
+        }, room=[
+            # Departments that act on prescriptions/referrals, plus the record's viewers
+            role_room('ADMIN'), role_room('PHARMACY'), role_room('LAB'),
+            visit_room(note.visit_id), patient_room(note.visit.patient_id),
+        ])
 
 
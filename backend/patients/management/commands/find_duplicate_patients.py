@@ -0,0 +1,95 @@
+import csv
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from patients.models import Patient
+from patients.search import DUPLICATE_PHONE_DIGITS, DUPLICATE_PROMPT_THRESHOLD, name_similarity
+
+
+class Command(BaseCommand):
+    help = 'Clusters likely duplicate patients (same phone, similar name) without loading the whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--min-score', type=float, default=DUPLICATE_PROMPT_THRESHOLD)
+        parser.add_argument('--csv', dest='csv_path', help='Write clusters to this CSV file')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        min_score = options['min_score']
+
+        writer = None
+        csv_file = None
+        if options['csv_path']:
+            csv_file = open(options['csv_path'], 'w', newline='')
+            writer = csv.writer(csv_file)
+            writer.writerow(['cluster', 'patient_id', 'registration_number', 'full_name', 'phone', 'created_at', 'score'])
+
+        # Walk the table in phone_reversed order (keyset on (phone_reversed, id)),
+        # so every patient sharing the last N phone digits arrives as one contiguous run.
+        scanned = 0
+        clusters = 0
+        group_key = None
+        group = []
+        last = None
+
+        try:
+            while True:
+                qs = Patient.objects.only(
+                    'id', 'full_name', 'phone', 'phone_reversed', 'registration_number', 'created_at'
+                ).exclude(phone_reversed='').order_by('phone_reversed', 'id')
+                if last:
+                    qs = qs.filter(Q(phone_reversed__gt=last[0]) | Q(phone_reversed=last[0], id__gt=last[1]))
+                chunk = list(qs[:chunk_size])
+                if not chunk:
+                    break
+
+                for patient in chunk:
+                    key = patient.phone_reversed[:DUPLICATE_PHONE_DIGITS]
+                    if key != group_key:
+                        clusters += self._emit(group, min_score, clusters, writer)
+                        group_key, group = key, []
+                    group.append(patient)
+
+                scanned += len(chunk)
+                last = (chunk[-1].phone_reversed, chunk[-1].id)
+                self.stdout.write(f"Scanned {scanned} patients, {clusters} clusters so far")
+
+            clusters += self._emit(group, min_score, clusters, writer)
+        finally:
+            if csv_file:
+                csv_file.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Scanned {scanned} patients, found {clusters} duplicate clusters'))
+
+    def _emit(self, group, min_score, offset, writer):
+        """Splits one same-phone group into name clusters; returns how many clusters had duplicates."""
+        if len(group) < 2:
+            return 0
+
+        # Greedy clustering against each cluster's oldest record (groups are a handful of rows)
+        group = sorted(group, key=lambda p: p.created_at)
+        clusters = []
+        for patient in group:
+            for cluster in clusters:
+                score = name_similarity(cluster[0][0].full_name, patient.full_name)
+                if score >= min_score:
+                    cluster.append((patient, score))
+                    break
+            else:
+                clusters.append([(patient, 1.0)])
+
+        found = 0
+        for cluster in clusters:
+            if len(cluster) < 2:
+                continue
+            found += 1
+            label = offset + found
+            primary = cluster[0][0]
+            self.stdout.write(f"[{label}] {primary.full_name} ({primary.phone}) x{len(cluster)}")
+            for patient, score in cluster:
+                self.stdout.write(f"    {patient.id}  {patient.registration_number or '-'}  {patient.full_name}  score={score}")
+                if writer:
+                    writer.writerow([label, patient.id, patient.registration_number, patient.full_name, patient.phone, patient.created_at, score])
+        return found
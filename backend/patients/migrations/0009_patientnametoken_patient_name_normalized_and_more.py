@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:52
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_patient_age_months'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientNameToken',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('token', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='name_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=15),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_reversed',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Reversed digits for last-N-digit matching', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['registration_number'], name='patient_reg_no_idx'),
+        ),
+        migrations.AddField(
+            model_name='patientnametoken',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_tokens', to='patients.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='patientnametoken',
+            index=models.Index(fields=['token', 'patient'], name='patient_name_token_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+import re
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+
+
+# Frozen copies of the patients.search normalizers as of this migration: later changes
+# there must not change what it writes.
+
+def normalize_phone(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def normalize_name(value):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (value or '').lower()).split())
+
+
+def tokenize_name(value):
+    return sorted(set(normalize_name(value).split()))
+
+
+def backfill(apps, schema_editor):
+    Patient = apps.get_model('patients', 'Patient')
+    PatientNameToken = apps.get_model('patients', 'PatientNameToken')
+
+    last_id = None
+    while True:
+        chunk = Patient.objects.only('id', 'full_name', 'phone').order_by('id')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        batch = list(chunk[:CHUNK_SIZE])
+        if not batch:
+            break
+
+        for patient in batch:
+            patient.phone_digits = normalize_phone(patient.phone)
+            patient.phone_reversed = patient.phone_digits[::-1]
+            patient.name_normalized = normalize_name(patient.full_name)
+        _flush(Patient, PatientNameToken, batch)
+        last_id = batch[-1].id
+
+
+def _flush(Patient, PatientNameToken, batch):
+    Patient.objects.bulk_update(batch, ['phone_digits', 'phone_reversed', 'name_normalized'])
+    PatientNameToken.objects.bulk_create([
+        PatientNameToken(patient_id=p.id, token=token[:64])
+        for p in batch
+        for token in tokenize_name(p.full_name)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0009_patientnametoken_patient_name_normalized_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -21,10 +21,65 @@ class Patient(BaseModel):
     address = models.TextField()
     id_proof = models.CharField(max_length=50, blank=True, null=True)
 
+    # Normalized lookup columns (maintained in save(), see patients.search)
+    phone_digits = models.CharField(max_length=15, blank=True, default='', editable=False, db_index=True)
+    phone_reversed = models.CharField(max_length=15, blank=True, default='', editable=False, db_index=True, help_text="Reversed digits for last-N-digit matching")
+    name_normalized = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['registration_number'], name='patient_reg_no_idx'),
+            models.Index(fields=['created_at', 'id'], name='patient_created_keyset_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .search import normalize_name, normalize_phone
+
+        name_normalized = normalize_name(self.full_name)
+        name_changed = self._state.adding or name_normalized != self.name_normalized
+
+        self.phone_digits = normalize_phone(self.phone)
+        self.phone_reversed = self.phone_digits[::-1]
+        self.name_normalized = name_normalized
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'phone_digits', 'phone_reversed', 'name_normalized'}
+
+        super().save(*args, **kwargs)
+
+        if name_changed:
+            self.rebuild_name_tokens()
+
+    def rebuild_name_tokens(self):
+        from .search import tokenize_name
+
+        self.name_tokens.all().delete()
+        PatientNameToken.objects.bulk_create([
+            PatientNameToken(patient=self, token=token[:64]) for token in tokenize_name(self.full_name)
+        ])
+
     def __str__(self):
         return f"{self.full_name} ({self.phone})"
 
 
+class PatientNameToken(BaseModel):
+    """
+    One row per word of a patient's name. Lets reception match any word by prefix
+    with an index range scan instead of a leading-wildcard LIKE over the patients table.
+    """
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='name_tokens')
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'patient'], name='patient_name_token_idx'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+
 class Visit(BaseModel):
     STATUS_CHOICES = (
         ('OPEN', 'Open'),
@@ -56,5 +111,10 @@ class Visit(BaseModel):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='OPEN')
     vitals = models.JSONField(default=dict, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='visit_created_keyset_idx'),
+        ]
+
     def __str__(self):
         return f"Visit {self.id} - {self.patient.full_name}"
@@ -0,0 +1,139 @@
+import re
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db.models import Q
+
+# Upper bound for prefix range scans: sorts after any character we store in the normalized columns
+PREFIX_SENTINEL = '\uffff'
+
+LOOKUP_LIMIT = 20
+MAX_LOOKUP_LIMIT = 50
+MIN_PHONE_SUFFIX = 4
+PHONE_QUERY_RE = re.compile(r'[\d\s+\-()]*\d[\d\s+\-()]*')
+
+# Duplicate detection: phones are compared on their last N digits so "+91 98765 43210" == "9876543210"
+DUPLICATE_PHONE_DIGITS = 10
+DUPLICATE_MAX_CANDIDATES = 10
+# Same phone + name at least this similar -> registration returns the existing patient
+DUPLICATE_AUTO_LINK_THRESHOLD = getattr(settings, 'PATIENT_DUPLICATE_AUTO_LINK_THRESHOLD', 0.92)
+# Same phone + name at least this similar -> registration asks reception to confirm
+DUPLICATE_PROMPT_THRESHOLD = getattr(settings, 'PATIENT_DUPLICATE_PROMPT_THRESHOLD', 0.75)
+
+# Rank buckets (lower is better); exact matches always come first
+RANK_REGISTRATION = 0
+RANK_PHONE_EXACT = 1
+RANK_NAME_EXACT = 2
+RANK_PHONE_SUFFIX = 3
+RANK_NAME_PREFIX = 4
+RANK_NAME_TOKEN = 5
+
+
+def normalize_phone(value):
+    """Digits only, e.g. '+91 98765-43210' -> '919876543210'."""
+    return re.sub(r'\D', '', value or '')
+
+
+def normalize_name(value):
+    """Lower-cased, punctuation stripped, whitespace collapsed."""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', (value or '').lower()).split())
+
+
+def tokenize_name(value):
+    return sorted(set(normalize_name(value).split()))
+
+
+def prefix_range(field, prefix):
+    """
+    Index-friendly prefix match. Translates to `field >= prefix AND field < prefix+sentinel`,
+    which every backend can answer from a B-tree, unlike LIKE on SQLite.
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + PREFIX_SENTINEL})
+
+
+def lookup_patients(queryset, query, limit=LOOKUP_LIMIT):
+    """
+    Returns patients from `queryset` ranked best-first for a reception search box.
+    Every probe is a bounded range or equality scan on an indexed column.
+    """
+    from .models import Patient, PatientNameToken
+
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    ranked = {}
+
+    def collect(rank, probe):
+        for pid in probe.values_list('id', flat=True)[:limit]:
+            if pid not in ranked or rank < ranked[pid]:
+                ranked[pid] = rank
+
+    # 1. Registration number (exact)
+    collect(RANK_REGISTRATION, Patient.objects.filter(registration_number=query))
+
+    if PHONE_QUERY_RE.fullmatch(query):
+        # Phone-like input: exact number first, then "last N digits" via the reversed column
+        digits = normalize_phone(query)
+        collect(RANK_PHONE_EXACT, Patient.objects.filter(phone_digits=digits))
+        if len(digits) >= MIN_PHONE_SUFFIX:
+            collect(RANK_PHONE_SUFFIX, Patient.objects.filter(prefix_range('phone_reversed', digits[::-1])))
+    else:
+        name = normalize_name(query)
+        if name:
+            collect(RANK_NAME_EXACT, Patient.objects.filter(name_normalized=name))
+            collect(RANK_NAME_PREFIX, Patient.objects.filter(prefix_range('name_normalized', name)))
+
+            # Every query word must prefix-match one of the patient's name tokens ("kum ra" -> "Ravi Kumar")
+            probe = Patient.objects.all()
+            for token in name.split():
+                probe = probe.filter(
+                    id__in=PatientNameToken.objects.filter(prefix_range('token', token)).values('patient_id')
+                )
+            collect(RANK_NAME_TOKEN, probe)
+
+    if not ranked:
+        return []
+
+    # Ties within a rank go to the most recently registered patient
+    patients = list(queryset.filter(id__in=list(ranked)))
+    patients.sort(key=lambda p: p.created_at, reverse=True)
+    patients.sort(key=lambda p: ranked[p.id])
+    return patients[:limit]
+
+
+def phone_match_key(value):
+    """Reversed last N digits; a prefix of Patient.phone_reversed."""
+    return normalize_phone(value)[-DUPLICATE_PHONE_DIGITS:][::-1]
+
+
+def name_similarity(a, b):
+    """
+    0..1 similarity of two names. Takes the better of a straight and a word-sorted
+    comparison so "Kumar Ravi" and "Ravi Kumar" score as the same person.
+    """
+    a, b = normalize_name(a), normalize_name(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    straight = SequenceMatcher(None, a, b).ratio()
+    sorted_words = SequenceMatcher(None, ' '.join(sorted(a.split())), ' '.join(sorted(b.split()))).ratio()
+    return round(max(straight, sorted_words), 3)
+
+
+def find_duplicate_candidates(queryset, full_name, phone, threshold=None):
+    """
+    Existing patients sharing the phone number whose name scores at least `threshold`.
+    One indexed range scan on phone_reversed; returns [(patient, score)] best-first.
+    """
+    threshold = DUPLICATE_PROMPT_THRESHOLD if threshold is None else threshold
+    key = phone_match_key(phone)
+    if len(key) < MIN_PHONE_SUFFIX:
+        return []
+
+    same_phone = queryset.filter(prefix_range('phone_reversed', key))[:DUPLICATE_MAX_CANDIDATES * 5]
+    scored = [(patient, name_similarity(full_name, patient.full_name)) for patient in same_phone]
+    scored = [pair for pair in scored if pair[1] >= threshold]
+    scored.sort(key=lambda pair: pair[1], reverse=True)
+    return scored[:DUPLICATE_MAX_CANDIDATES]
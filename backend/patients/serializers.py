@@ -1,6 +1,15 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import CharField, Count, OuterRef, Subquery, UUIDField, Value
+from django.db.models.functions import Concat
 from rest_framework import serializers
+from revive_cms.realtime import (
+    publish_event, snapshot, role_room, doctor_room, patient_room, visit_room
+)
 from .models import Patient, Visit
 
+# Compact row sent with visit_update so queues can patch in place
+VISIT_SNAPSHOT_FIELDS = ('patient_id', 'doctor_id', 'status', 'assigned_role', 'updated_at')
+
 
 class PatientSerializer(serializers.ModelSerializer):
     p_id = serializers.UUIDField(source='id', read_only=True)
@@ -12,7 +21,32 @@ class PatientSerializer(serializers.ModelSerializer):
         fields = ['id', 'p_id', 'registration_number', 'full_name', 'age', 'age_months', 'gender', 'phone', 'address', 'id_proof', 'total_visits', 'last_consulted_doctor', 'created_at', 'updated_at']
         read_only_fields = ['id', 'p_id', 'created_at', 'updated_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Annotates visit count and last consulting doctor so list pages run as a single query.
+        """
+        last_doctor_visits = Visit.objects.filter(
+            patient=OuterRef('pk'), doctor__isnull=False
+        ).order_by('-created_at')
+
+        return queryset.annotate(
+            total_visits_count=Count('visits', distinct=True),
+            last_doctor_id=Subquery(last_doctor_visits.values('doctor_id')[:1], output_field=UUIDField()),
+            last_doctor_name=Subquery(
+                last_doctor_visits.annotate(
+                    doctor_full_name=Concat(
+                        Value('Dr. '), 'doctor__first_name', Value(' '), 'doctor__last_name',
+                        output_field=CharField()
+                    )
+                ).values('doctor_full_name')[:1]
+            ),
+        )
+
     def get_total_visits(self, obj):
+        # Prefer the annotation from setup_eager_loading; fall back for single-object responses
+        if hasattr(obj, 'total_visits_count'):
+            return obj.total_visits_count
         return obj.visits.count()
 
     def validate_phone(self, value):
@@ -27,6 +61,14 @@ class PatientSerializer(serializers.ModelSerializer):
     last_consulted_doctor = serializers.SerializerMethodField()
 
     def get_last_consulted_doctor(self, obj):
+        if hasattr(obj, 'last_doctor_id'):
+            if obj.last_doctor_id is None:
+                return None
+            return {
+                "id": obj.last_doctor_id,
+                "name": obj.last_doctor_name
+            }
+
         # Find the last visit that actually had a doctor assigned
         last_visit = obj.visits.filter(doctor__isnull=False).order_by('-created_at').first()
         if last_visit:
@@ -84,6 +126,42 @@ class VisitSerializer(serializers.ModelSerializer):
             return float(obj.doctor.consultation_fee)
         return 0.00 if not obj.doctor else 500.00  # Default fee only if doctor exists
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Prefetch plan for every relation the serializer reads.
+        Keeps list/queue endpoints at a fixed number of queries regardless of row count.
+        """
+        from django.db.models import Prefetch
+        from pharmacy.models import PharmacySale, PharmacySaleItem
+        from lab.models import LabCharge
+        from casualty.models import CasualtyMedicine, CasualtyService
+
+        return queryset.select_related('patient', 'doctor', 'doctor_note').prefetch_related(
+            Prefetch(
+                'pharmacy_sales',
+                queryset=PharmacySale.objects.prefetch_related(
+                    Prefetch('items', queryset=PharmacySaleItem.objects.select_related('med_stock'))
+                )
+            ),
+            'lab_charges',
+            Prefetch(
+                'lab_charges',
+                queryset=LabCharge.objects.filter(status='COMPLETED'),
+                to_attr='completed_lab_charges'
+            ),
+            Prefetch('casualty_medicines', queryset=CasualtyMedicine.objects.select_related('med_stock')),
+            Prefetch('casualty_services', queryset=CasualtyService.objects.select_related('service_definition')),
+            'casualty_observations',
+        )
+
+    def _get_doctor_note(self, obj):
+        # Reverse one-to-one: select_related caches the note (or its absence) on the visit
+        try:
+            return obj.doctor_note
+        except ObjectDoesNotExist:
+            return None
+
     def get_pharmacy_items(self, obj):
         # Return list of items from all PENDING pharmacy sales
         try:
@@ -96,12 +174,9 @@ class VisitSerializer(serializers.ModelSerializer):
         
         # Get prescription data for dosage/duration
         prescription_map = {}
-        try:
-            if hasattr(obj, 'doctor_note') and obj.doctor_note and hasattr(obj.doctor_note, 'prescription'):
-                if isinstance(obj.doctor_note.prescription, dict):
-                    prescription_map = obj.doctor_note.prescription
-        except Exception:
-            pass # prescription fetch is optional
+        note = self._get_doctor_note(obj)
+        if note and isinstance(note.prescription, dict):
+            prescription_map = note.prescription
         
         for sale in sales:
             # Iterate through items safely
@@ -156,34 +231,25 @@ class VisitSerializer(serializers.ModelSerializer):
         return items
 
     def get_lab_referral_details(self, obj):
-        try:
-            if hasattr(obj, 'doctor_note') and obj.doctor_note:
-                return obj.doctor_note.lab_referral_details
-        except:
-            pass
-        return None
+        note = self._get_doctor_note(obj)
+        return note.lab_referral_details if note else None
 
     def get_prescription(self, obj):
         # Safely get prescription from related DoctorNote
-        try:
-            if hasattr(obj, 'doctor_note') and obj.doctor_note:
-                return obj.doctor_note.prescription
-        except:
-            pass
-        return None
+        note = self._get_doctor_note(obj)
+        return note.prescription if note else None
 
     def get_diagnosis(self, obj):
-        try:
-            if hasattr(obj, 'doctor_note') and obj.doctor_note:
-                return obj.doctor_note.diagnosis
-        except:
-            pass
-        return None
+        note = self._get_doctor_note(obj)
+        return note.diagnosis if note else None
 
     def get_lab_results(self, obj):
         # Return completed lab results for this visit
         try:
-            charges = obj.lab_charges.filter(status='COMPLETED')
+            charges = getattr(obj, 'completed_lab_charges', None)
+            if charges is None:
+                # Not prefetched (e.g. single create/update response): filter the cached set in Python
+                charges = [c for c in obj.lab_charges.all() if c.status == 'COMPLETED']
             results = []
             for c in charges:
                 results.append({
@@ -234,23 +300,38 @@ class VisitSerializer(serializers.ModelSerializer):
         return visit
 
     def update(self, instance, validated_data):
+        # Whoever held the visit before a transfer/referral must hear that it left
+        previous = (instance.doctor_id, instance.assigned_role)
         visit = super().update(instance, validated_data)
-        self.emit_socket_update(visit)
+        self.emit_socket_update(visit, previous=previous)
         return visit
 
-    def emit_socket_update(self, visit):
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            
-            data = {
-                'visit_id': str(visit.id),
-                'doctor_id': str(visit.doctor.id) if visit.doctor else None,
-                'status': visit.status
-            }
-            print(f"--- ATTEMPTING SOCKET EMIT: visit_update --- Data: {data}")
-            # Emit to all clients (broadcast)
-            async_to_sync(sio.emit)('visit_update', data)
-        except Exception as e:
-            # Non-blocking error logging
-            print(f"Socket emit error: {e}")
+    def emit_socket_update(self, visit, previous=None):
+        # Queued on commit and emitted by the ASGI dispatcher (see revive_cms.realtime)
+        publish_event('visit_update', {
+            'visit_id': str(visit.id),
+            'doctor_id': str(visit.doctor.id) if visit.doctor else None,
+            'status': visit.status,
+            **snapshot(
+                visit, VISIT_SNAPSHOT_FIELDS,
+                patient_name=visit.patient.full_name,
+                registration_number=visit.patient.registration_number,
+            ),
+        }, room=self.visit_rooms(visit, previous))
+
+    @staticmethod
+    def visit_rooms(visit, previous=None):
+        """Front desk and admin, the treating doctor, the assigned department and the record's viewers."""
+        rooms = [
+            role_room('ADMIN'), role_room('RECEPTION'),
+            patient_room(visit.patient_id), visit_room(visit.id),
+        ]
+        holders = [(visit.doctor_id, visit.assigned_role)]
+        if previous:
+            holders.append(previous)
+        for doctor_id, assigned_role in holders:
+            if doctor_id:
+                rooms.append(doctor_room(doctor_id))
+            if assigned_role and assigned_role != 'DOCTOR':
+                rooms.append(role_room(assigned_role))
+        return rooms
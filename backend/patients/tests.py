@@ -1,3 +1,72 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from patients.models import Patient
+from patients.search import (
+    find_duplicate_candidates, lookup_patients, name_similarity, normalize_name, normalize_phone, phone_match_key,
+)
+
+
+def make_patient(full_name, phone, registration_number='TEMP'):
+    return Patient.objects.create(
+        full_name=full_name, phone=phone, registration_number=registration_number, age=30, gender='M', address='-',
+    )
+
+
+class NormalizeTests(SimpleTestCase):
+    def test_normalize_phone_and_name(self):
+        self.assertEqual(normalize_phone('+91 98765-43210'), '919876543210')
+        self.assertEqual(normalize_name('  Ravi   KUMAR, Jr. '), 'ravi kumar jr')
+
+    def test_phone_match_key_uses_last_digits(self):
+        self.assertEqual(phone_match_key('+91 98765 43210'), phone_match_key('9876543210'))
+
+    def test_name_similarity_ignores_word_order(self):
+        self.assertEqual(name_similarity('Kumar Ravi', 'ravi kumar'), 1.0)
+        self.assertEqual(name_similarity('', 'Ravi'), 0.0)
+        self.assertLess(name_similarity('Ravi Kumar', 'Sunita Devi'), 0.5)
+
+
+class LookupPatientsTests(TestCase):
+    def setUp(self):
+        self.ravi = make_patient('Ravi Kumar', '+91 98765 43210', 'REG-7')
+        self.ravina = make_patient('Ravina Shah', '9123456789')
+        self.sunita = make_patient('Sunita Kumari', '9000043210')
+
+    def lookup(self, query):
+        return lookup_patients(Patient.objects.all(), query)
+
+    def test_registration_number(self):
+        self.assertEqual(self.lookup('REG-7'), [self.ravi])
+
+    def test_exact_phone_before_suffix_matches(self):
+        self.assertEqual(self.lookup('919876543210'), [self.ravi])
+        self.assertEqual(self.lookup('43210'), [self.sunita, self.ravi])
+
+    def test_name_exact_prefix_and_word_prefixes(self):
+        self.assertEqual(self.lookup('ravi kumar'), [self.ravi])
+        self.assertEqual(self.lookup('Ravi'), [self.ravina, self.ravi])
+        self.assertEqual(self.lookup('kum ra'), [self.ravi])
+
+    def test_updated_name_is_found_by_its_new_words(self):
+        self.ravina.full_name = 'Meera Shah'
+        self.ravina.save()
+        self.assertEqual(self.lookup('meer'), [self.ravina])
+        self.assertEqual(self.lookup('ravina'), [])
+
+    def test_blank_and_unmatched_queries(self):
+        self.assertEqual(self.lookup('  '), [])
+        self.assertEqual(self.lookup('zzz'), [])
+
+
+class DuplicateCandidatesTests(TestCase):
+    def test_same_phone_and_similar_name_best_first(self):
+        ravi = make_patient('Ravi Kumar', '+91 98765 43210')
+        make_patient('Sunita Devi', '9876543210')
+        make_patient('Ravi Kumar', '9000000000')
+
+        candidates = find_duplicate_candidates(Patient.objects.all(), 'Kumar Ravi', '98765 43210')
+        self.assertEqual(candidates, [(ravi, 1.0)])
+
+    def test_short_phone_matches_nothing(self):
+        make_patient('Ravi Kumar', '123')
+        self.assertEqual(find_duplicate_candidates(Patient.objects.all(), 'Ravi Kumar', '123'), [])
@@ -6,22 +6,27 @@ from revive_cms.utils import export_to_csv
 
 from .models import Patient, Visit
 from .serializers import PatientSerializer, VisitSerializer
+from .search import (
+    lookup_patients, find_duplicate_candidates,
+    LOOKUP_LIMIT, MAX_LOOKUP_LIMIT, DUPLICATE_AUTO_LINK_THRESHOLD
+)
 
 
 from core.permissions import IsHospitalStaff
 
-from rest_framework.pagination import PageNumberPagination
+from revive_cms.pagination import CursorOrPageNumberPagination
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(CursorOrPageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 10000
+    max_page_size = 200
 
 class PatientViewSet(viewsets.ModelViewSet):
     queryset = Patient.objects.all().order_by('-created_at')
     serializer_class = PatientSerializer
     permission_classes = [IsHospitalStaff]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
 
     filter_backends = [filters.SearchFilter]
     search_fields = ['full_name', 'phone', 'registration_number']
@@ -36,7 +41,7 @@ class PatientViewSet(viewsets.ModelViewSet):
             active_statuses = ['OPEN', 'IN_PROGRESS', 'WAITING']
             qs = qs.exclude(visits__status__in=active_statuses)
             
-        return qs
+        return PatientSerializer.setup_eager_loading(qs)
 
     @action(detail=False, methods=['get'], url_path='export')
     def export_csv(self, request):
@@ -46,21 +51,54 @@ class PatientViewSet(viewsets.ModelViewSet):
             ['id', 'full_name', 'age', 'gender', 'phone', 'created_at']
         )
 
+    @action(detail=False, methods=['get'], url_path='lookup')
+    def lookup(self, request):
+        """
+        Ranked reception lookup backed by indexed, normalized columns.
+        ?q=<phone | last N digits | registration no | name words>&limit=20
+        Order: registration no, exact phone, exact name, phone suffix, name prefix, name word prefix.
+        """
+        query = request.query_params.get('q') or request.query_params.get('search') or ''
+        try:
+            limit = min(int(request.query_params.get('limit', LOOKUP_LIMIT)), MAX_LOOKUP_LIMIT)
+        except ValueError:
+            limit = LOOKUP_LIMIT
+
+        patients = lookup_patients(self.get_queryset(), query, limit=max(limit, 1))
+        return Response(PatientSerializer(patients, many=True).data)
+
     @action(detail=False, methods=['post'], url_path='register')
     def register(self, request):
         """
         Flow:
-        - Search by phone
-        - If exists -> return existing patient
-        - Else -> create new patient
+        - Look up patients sharing the (normalized) phone and score their names
+        - Near-identical name -> return existing patient (200)
+        - Similar name -> 409 with duplicate_candidates, unless confirm_new=true
+        - Else -> create new patient (201)
         """
         phone = (request.data.get("phone") or "").strip()
         if not phone:
             return Response({"phone": ["This field is required."]}, status=status.HTTP_400_BAD_REQUEST)
 
-        # existing = Patient.objects.filter(phone=phone).first()
-        # if existing:
-        #     return Response(PatientSerializer(existing).data, status=status.HTTP_200_OK)
+        confirm_new = str(request.data.get("confirm_new", "")).lower() in ("1", "true", "yes")
+        if not confirm_new:
+            candidates = find_duplicate_candidates(
+                PatientSerializer.setup_eager_loading(Patient.objects.all()),
+                request.data.get("full_name"),
+                phone
+            )
+            if candidates:
+                best, score = candidates[0]
+                if score >= DUPLICATE_AUTO_LINK_THRESHOLD:
+                    return Response(PatientSerializer(best).data, status=status.HTTP_200_OK)
+
+                return Response({
+                    "detail": "Possible duplicate patient. Resend with confirm_new=true to register anyway.",
+                    "duplicate_candidates": [
+                        dict(PatientSerializer(patient).data, match_score=match_score)
+                        for patient, match_score in candidates
+                    ]
+                }, status=status.HTTP_409_CONFLICT)
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -75,6 +113,8 @@ class VisitViewSet(viewsets.ModelViewSet):
     queryset = Visit.objects.all().order_by('-created_at')
     serializer_class = VisitSerializer
     permission_classes = [IsHospitalStaff]
+    pagination_class = CursorOrPageNumberPagination
+    keyset_ordering = ('-created_at', '-id')
 
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = {
@@ -86,30 +126,31 @@ class VisitViewSet(viewsets.ModelViewSet):
     search_fields = ['patient__full_name', 'patient__phone', 'patient__registration_number']
     ordering_fields = ['created_at', 'updated_at']
 
+    def get_queryset(self):
+        return VisitSerializer.setup_eager_loading(super().get_queryset())
+
     @action(detail=False, methods=['get'])
     def casualty_history(self, request):
         """
         Returns all visits that have passed through Casualty 
-        (i.e., have at least one CasualtyLog entry).
+        (i.e., have at least one casualty log, medicine, service or observation).
         """
-        from casualty.models import CasualtyLog
-        # Get distinct visits that have logs
+        from django.db.models import Exists, OuterRef
+        from casualty.models import CasualtyLog, CasualtyMedicine, CasualtyService, CasualtyObservation
         # We can also filter by assigned_role='CASUALTY' but that only gets CURRENT ones.
         # We want PAST history.
-        # Efficient query: Visits where id is in the set of log visits.
-        
-        # Method 1 using distinct (might be slow on huge DBs but fine here)
-        # visits = Visit.objects.filter(casualty_logs__isnull=False).distinct().order_by('-created_at')
-        
-        # Method 2: Reverse query
-        from django.db.models import Q
-        # Efficient query: Visits where id is in the set of log visits OR have casualty items.
+        # EXISTS probes hit the visit_id index once per visit; unlike OR-ed joins + DISTINCT
+        # they never multiply rows as the casualty tables grow.
+        def has(model):
+            return Exists(model.objects.filter(visit=OuterRef('pk')))
+
         visits = Visit.objects.filter(
-            Q(casualty_logs__isnull=False) |
-            Q(casualty_medicines__isnull=False) |
-            Q(casualty_services__isnull=False) |
-            Q(casualty_observations__isnull=False)
-        ).order_by('-created_at').distinct()
+            has(CasualtyLog) |
+            has(CasualtyMedicine) |
+            has(CasualtyService) |
+            has(CasualtyObservation)
+        ).order_by('-created_at')
+        visits = VisitSerializer.setup_eager_loading(visits)
         
         page = self.paginate_queryset(visits)
         if page is not None:
@@ -139,20 +180,13 @@ class VisitViewSet(viewsets.ModelViewSet):
 
         if match_role:
             from core.models import Notification
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            
-            # Broadcast to all active users in that role
-            recipients = User.objects.filter(role=match_role, is_active=True)
-            notifications = [
-                Notification(
-                    recipient=u,
-                    message=f"New Patient in Queue: {visit.patient.full_name}",
-                    type='VISIT_ASSIGNED',
-                    related_id=visit.id
-                ) for u in recipients
-            ]
-            Notification.objects.bulk_create(notifications)
+            # One row on the role channel reaches every user in that role
+            Notification.objects.create(
+                recipient_role=match_role,
+                message=f"New Patient in Queue: {visit.patient.full_name}",
+                type='VISIT_ASSIGNED',
+                related_id=visit.id
+            )
 
     def perform_update(self, serializer):
         old_doctor = serializer.instance.doctor
@@ -183,16 +217,9 @@ class VisitViewSet(viewsets.ModelViewSet):
         # Check for Role change (Referral)
         if visit.assigned_role and visit.assigned_role != old_role and visit.assigned_role != 'DOCTOR':
             from core.models import Notification
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            
-            recipients = User.objects.filter(role=visit.assigned_role, is_active=True)
-            notifications = [
-                Notification(
-                    recipient=u,
-                    message=f"New Referral: {visit.patient.full_name} (from {old_role or 'Reception'})",
-                    type='VISIT_ASSIGNED',
-                    related_id=visit.id
-                ) for u in recipients
-            ]
-            Notification.objects.bulk_create(notifications)
+            Notification.objects.create(
+                recipient_role=visit.assigned_role,
+                message=f"New Referral: {visit.patient.full_name} (from {old_role or 'Reception'})",
+                type='VISIT_ASSIGNED',
+                related_id=visit.id
+            )
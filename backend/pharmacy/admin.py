@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Supplier, PurchaseInvoice, PurchaseItem, PharmacyStock, PharmacySale, PharmacySaleItem, PharmacyReturn, PharmacyReturnItem
+from .models import Supplier, PurchaseInvoice, PurchaseItem, PharmacyStock, PharmacySale, PharmacySaleItem, PharmacyReturn, PharmacyReturnItem, PharmacyImportJob, StockMovement
 
 class PharmacyReturnItemInline(admin.TabularInline):
     model = PharmacyReturnItem
@@ -38,3 +38,14 @@ class PharmacySaleItemInline(admin.TabularInline):
 class PharmacySaleAdmin(admin.ModelAdmin):
     list_display = ('id', 'visit', 'total_amount', 'payment_status', 'sale_date')
     inlines = [PharmacySaleItemInline]
+
+@admin.register(PharmacyImportJob)
+class PharmacyImportJobAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'supplier_name', 'status', 'rows_imported', 'rows_failed', 'invoice')
+    list_filter = ('status',)
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'name', 'batch_no', 'movement_type', 'qty', 'source')
+    list_filter = ('movement_type', 'source')
+    search_fields = ('name', 'batch_no')
@@ -0,0 +1,113 @@
+"""
+Barcode -> batch resolution for the POS scan endpoints (PharmacyStockViewSet.scan_barcode
+and scan_basket).
+
+Each process caches, per barcode, its live batches (not deleted, qty > 0) serialized in
+FEFO order, so a scan is a dict lookup plus a cache read instead of a query.
+
+Stock changes (pharmacy.signals, bulk imports) drop entries here at once and, after
+commit, replace a stamp in the Django cache with a fresh token: quantity moves stamp the
+barcodes they touch; saves and deletes, which may change a batch's barcode, stamp all of
+them. A process whose entry carries other stamps re-reads that barcode. Entries also
+expire after BARCODE_CACHE_SECONDS, which bounds staleness if a shared cache evicts a stamp.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+BARCODE_CACHE_SECONDS = getattr(settings, 'PHARMACY_BARCODE_CACHE_SECONDS', 60)
+BARCODE_CACHE_SIZE = getattr(settings, 'PHARMACY_BARCODE_CACHE_SIZE', 5000)
+
+# barcode -> (stamp, loaded at, [serialized batch, ...] nearest expiry first)
+_entries = {}
+_lock = threading.Lock()
+
+# Stamp shared by every barcode, replaced by saves and deletes
+ALL_BARCODES_KEY = 'pharmacy:barcode:*'
+
+
+def _stamp_key(barcode):
+    return f'pharmacy:barcode:{barcode}'
+
+
+def live_batches(barcodes):
+    """{barcode: [serialized batch, ...]} in FEFO order; one query for all uncached codes."""
+    barcodes = list(dict.fromkeys(barcodes))
+    stamps = cache.get_many([ALL_BARCODES_KEY] + [_stamp_key(code) for code in barcodes])
+    now = time.monotonic()
+
+    found, missing = {}, []
+    for code in barcodes:
+        stamp = (stamps.get(ALL_BARCODES_KEY), stamps.get(_stamp_key(code)))
+        entry = _entries.get(code)
+        if entry and entry[0] == stamp and now - entry[1] < BARCODE_CACHE_SECONDS:
+            found[code] = entry[2]
+        else:
+            missing.append((code, stamp))
+
+    if missing:
+        loaded = _load([code for code, _ in missing])
+        with _lock:
+            if len(_entries) + len(missing) > BARCODE_CACHE_SIZE:
+                _entries.clear()
+            for code, stamp in missing:
+                found[code] = loaded.get(code, [])
+                _entries[code] = (stamp, now, found[code])
+    return found
+
+
+def _load(barcodes):
+    from .models import PharmacyStock
+    from .serializers import PharmacyStockSerializer
+
+    stocks = (
+        PharmacyStock.objects
+        .filter(barcode__in=barcodes, is_deleted=False, qty_available__gt=0)
+        .select_related('supplier')
+        .order_by('barcode', 'expiry_date', 'id')
+    )
+    batches = {}
+    for data in PharmacyStockSerializer(stocks, many=True).data:
+        batches.setdefault(data['barcode'], []).append(data)
+    return batches
+
+
+def resolve(batches, qty, category=None, supplier=None):
+    """Nearest-expiry batch of `batches` that can cover `qty` on its own, or None."""
+    for batch in batches:
+        if category and batch['category'] != category:
+            continue
+        if supplier and str(batch['supplier']) != str(supplier):
+            continue
+        if batch['qty_available'] >= qty:
+            return batch
+    return None
+
+
+def invalidate_barcodes(barcodes=None):
+    """Forget the given barcodes, or every barcode when None."""
+    if barcodes is not None:
+        barcodes = {code for code in barcodes if code}
+        if not barcodes:
+            return
+    _forget(barcodes)
+    # Again after commit: a scan before then may have cached the old rows
+    transaction.on_commit(lambda: _publish(barcodes))
+
+
+def _forget(barcodes):
+    with _lock:
+        if barcodes is None:
+            _entries.clear()
+        for code in barcodes or ():
+            _entries.pop(code, None)
+
+
+def _publish(barcodes):
+    _forget(barcodes)
+    keys = [ALL_BARCODES_KEY] if barcodes is None else [_stamp_key(code) for code in barcodes]
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
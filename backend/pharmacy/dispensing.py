@@ -0,0 +1,50 @@
+"""
+Dispensing medicines asked for by name (prescriptions, bill lines without a batch):
+every candidate batch is read in one query and each quantity is split across batches
+nearest expiry first with core.stock.allocate / dispense.
+"""
+from django.db.models.functions import Lower
+
+from core.stock import allocate, dispense
+
+
+def medicine_key(name):
+    """Names match case-insensitively, as the name__iexact lookups did."""
+    return (name or '').strip().lower()
+
+
+def medicine_batches(names):
+    """{medicine_key: [batch, ...]} for live batches of `names`, nearest expiry first (empty ones too)."""
+    from .models import PharmacyStock
+
+    keys = {medicine_key(name) for name in names}
+    batches = {}
+    stocks = (
+        PharmacyStock.objects
+        .annotate(name_key=Lower('name'))
+        .filter(name_key__in=keys, is_deleted=False)
+        .order_by('expiry_date', 'id')
+    )
+    for stock in stocks:
+        batches.setdefault(stock.name_key, []).append(stock)
+    return batches
+
+
+def plan_medicines(lines, batches=None):
+    """FEFO split of [(name, qty), ...] without touching stock; one ([(batch, n), ...], shortfall) per line."""
+    batches = medicine_batches(name for name, _ in lines) if batches is None else batches
+    return allocate(batches, [(medicine_key(name), qty) for name, qty in lines], 'qty_available')
+
+
+def dispense_medicines(lines, changes=(), allow_shortfall=False):
+    """
+    Take [(name, qty), ...] FEFO, plus fixed {batch pk: delta} `changes`, in one move.
+    Raises InsufficientStock with the medicine key (or a `changes` pk) as `pk`.
+    """
+    from .models import PharmacyStock
+
+    keyed = [(medicine_key(name), qty) for name, qty in lines]
+    return dispense(
+        PharmacyStock, lambda: medicine_batches(key for key, _ in keyed), keyed,
+        changes=changes, allow_shortfall=allow_shortfall,
+    )
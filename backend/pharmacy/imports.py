@@ -0,0 +1,463 @@
+"""
+Background import of distributor invoice CSVs (MediWMS layout):
+
+    H,<source>,<version>,<invoice no>,<dd/mm/yyyy>,,,<CASH|CREDIT>,<credit days>,...
+    TH,<column headers>...
+    T,<values>...        one line per purchased batch
+    F,...                footer, ignored
+
+The upload is saved to MEDIA_ROOT and read back as a stream, so memory stays flat for
+any file size. Item lines are validated as they are read and written `CHUNK_SIZE` at a
+time with bulk_create; lines that fail validation are skipped and listed in the job's
+error report. The invoice stays a DRAFT while lines come in. Distribution, stock and the
+COMPLETED status then commit in one transaction, so a failed or interrupted job never
+leaves partial stock behind.
+"""
+import codecs
+import csv
+import re
+import threading
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+CHUNK_SIZE = getattr(settings, 'PHARMACY_IMPORT_CHUNK_SIZE', 500)
+# Rows listed in the error report; rows_failed still counts every rejected row
+MAX_REPORTED_ERRORS = getattr(settings, 'PHARMACY_IMPORT_MAX_ERRORS', 1000)
+# False runs the job inside the upload request instead of a background thread
+IMPORT_IN_BACKGROUND = getattr(settings, 'PHARMACY_IMPORT_IN_BACKGROUND', True)
+
+# Accepted header names per field, in priority order (matched case-insensitively).
+# The first of them holding a value on a line wins.
+COLUMNS = {
+    'product_name': ('Product Name', 'Item Name', 'Particulars'),
+    'batch_no': ('Batch', 'Batch No'),
+    'expiry': ('Expiry', 'Exp', 'Exp Date'),
+    'qty': ('Qty', 'Quantity'),
+    'free_qty': ('Free', 'Free Qty'),
+    'purchase_rate': ('Rate', 'Price'),
+    'ptr': ('PTR', 'Purchase Rate'),
+    'mrp': ('MRP',),
+    'hsn': ('HSN', 'HSN Code'),
+    'manufacturer': ('Manufacturer Name', 'Manufacturer.Name', 'Mfr Name', 'Mfr'),
+    'barcode': ('Product Code', 'Barcode', 'Code'),
+    'packing': ('ItemPerPack', 'Packing', 'Strip Size', 'Tablets per Strip', 'TPS', 'Unit'),
+    'gst_percent': ('GST', 'GST%', 'Tax', 'Tax %', 'IGST', 'TaxPerc'),
+    'discount_percent': ('DiscountPerc', 'Discount %', 'Disc %', 'Discount', 'Disc'),
+}
+
+# Metadata only: quantities are added with conditional UPDATEs (core.stock.put)
+STOCK_UPDATE_FIELDS = [
+    'mrp', 'selling_price', 'purchase_rate', 'ptr', 'tablets_per_strip',
+    'gst_percent', 'manufacturer', 'hsn', 'barcode', 'updated_at',
+]
+
+
+class ImportAborted(Exception):
+    """The file cannot be imported at all (as opposed to a bad line, which is skipped)."""
+
+
+def d_round(val):
+    return Decimal(val).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+# --- Running jobs ---
+
+def start_import(job):
+    """Run `job` once the transaction that created it commits."""
+    if IMPORT_IN_BACKGROUND:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_in_thread, args=(job.pk,), name=f'pharmacy-import-{job.pk}', daemon=True
+        ).start())
+    else:
+        transaction.on_commit(lambda: run_import(job.pk))
+
+
+def _run_in_thread(job_id):
+    try:
+        run_import(job_id)
+    finally:
+        connection.close()  # the thread's own connection
+
+
+def run_import(job_id):
+    """Claim a QUEUED job and process it; returns False if another worker got there first."""
+    from .models import PharmacyImportJob
+
+    claimed = PharmacyImportJob.objects.filter(pk=job_id, status='QUEUED').update(
+        status='RUNNING', started_at=timezone.now(), finished_at=None, message='', updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = PharmacyImportJob.objects.select_related('created_by').get(pk=job_id)
+    try:
+        InvoiceImport(job).run()
+    except Exception as e:
+        print(f"Pharmacy import {job_id} failed: {e}")
+        discard_draft(job)
+        PharmacyImportJob.objects.filter(pk=job_id).update(
+            status='FAILED', message=str(e), invoice=None,
+            finished_at=timezone.now(), updated_at=timezone.now()
+        )
+    return True
+
+
+def discard_draft(job):
+    """Delete the DRAFT invoice an unfinished run left behind (its items cascade)."""
+    from .models import PurchaseInvoice
+
+    if job.invoice_id:
+        PurchaseInvoice.objects.filter(pk=job.invoice_id, status='DRAFT').delete()
+        job.invoice = None
+
+
+# --- One file ---
+
+class InvoiceImport:
+    def __init__(self, job):
+        self.job = job
+        self.invoice = None
+        self.columns = None
+        self.pending = []
+        self.errors = []
+        self.rows_processed = 0
+        self.rows_imported = 0
+        self.rows_failed = 0
+
+    def run(self):
+        discard_draft(self.job)  # a re-queued job starts over
+
+        self.file = self.job.file
+        self.file.open('rb')
+        try:
+            lines = codecs.iterdecode(iter(self.file.readline, b''), 'utf-8-sig')
+            self._read(csv.reader(lines))
+        finally:
+            self.file.close()
+
+        if self.invoice is None:
+            raise ImportAborted("No invoice header (H line) found in the file.")
+        if not self.rows_imported:
+            raise ImportAborted("No valid item lines in the file; see the error report.")
+        self._complete()
+
+    def _read(self, reader):
+        for row in reader:
+            if not row:
+                continue
+            line_type = row[0].strip().upper()
+
+            if line_type == 'H':
+                if self.invoice is not None:
+                    self._reject(reader.line_num, {}, ["Only one invoice per file is supported; the rest of the file was not imported."])
+                    break
+                self._start_invoice(row)
+
+            elif line_type == 'TH':
+                self.columns = _column_positions(row)
+
+            elif line_type == 'T':
+                self.rows_processed += 1
+                self._add_item(reader.line_num, row)
+                if self.rows_processed % CHUNK_SIZE == 0:
+                    self._flush()
+
+        self._flush()
+
+    def _start_invoice(self, row):
+        from .models import Supplier, PurchaseInvoice
+
+        inv_no = row[3] if len(row) > 3 else "Unknown"
+        inv_date_str = row[4] if len(row) > 4 else ""
+        p_type = row[7].upper() if len(row) > 7 else "CASH"
+        try:
+            c_days = int(row[8]) if len(row) > 8 and row[8] else 0
+        except ValueError:
+            c_days = 0
+
+        # Convert date dd/mm/yyyy to yyyy-mm-dd
+        try:
+            inv_date = datetime.strptime(inv_date_str.strip(), '%d/%m/%Y').date()
+        except ValueError:
+            inv_date = datetime.now().date()
+
+        supplier, _ = Supplier.objects.get_or_create(supplier_name=self.job.supplier_name)
+        self.invoice = PurchaseInvoice.objects.create(
+            supplier=supplier,
+            supplier_invoice_no=inv_no,
+            invoice_date=inv_date,
+            credit_days=max(c_days, 0),
+            purchase_type='CREDIT' if 'CREDIT' in p_type else 'CASH',
+            total_amount=0,  # set by calculate_distribution
+            status='DRAFT',
+            created_by=self.job.created_by,
+        )
+        self.job.invoice = self.invoice
+        type(self.job).objects.filter(pk=self.job.pk).update(invoice=self.invoice)
+
+    def _add_item(self, line_no, row):
+        from .models import PurchaseItem
+
+        if self.invoice is None or self.columns is None:
+            self._reject(line_no, {}, ["Item line before the invoice header (H) and column headers (TH)."])
+            return
+
+        values = {field: _pick(row, positions) for field, positions in self.columns.items()}
+        item, errors = _validate_item(values)
+        if errors:
+            self._reject(line_no, values, errors)
+            return
+
+        self.pending.append(PurchaseItem(purchase=self.invoice, **item))
+        self.rows_imported += 1
+
+    def _reject(self, line_no, values, errors):
+        self.rows_failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({
+                'line': line_no,
+                'product': values.get('product_name', ''),
+                'batch': values.get('batch_no', ''),
+                'errors': errors,
+            })
+
+    def _flush(self):
+        """Write the pending chunk and publish progress."""
+        from .models import PurchaseItem
+
+        with transaction.atomic():
+            if self.pending:
+                PurchaseItem.objects.bulk_create(self.pending)
+            self._save_progress(bytes_read=self.file.tell())
+        self.pending = []
+
+    def _save_progress(self, **extra):
+        type(self.job).objects.filter(pk=self.job.pk).update(
+            rows_processed=self.rows_processed,
+            rows_imported=self.rows_imported,
+            rows_failed=self.rows_failed,
+            errors=self.errors,
+            updated_at=timezone.now(),
+            **extra
+        )
+
+    def _complete(self):
+        from revive_cms.realtime import publish_event, snapshot, role_room
+        from .models import PurchaseInvoice
+        from .serializers import PURCHASE_SNAPSHOT_FIELDS
+
+        with transaction.atomic():
+            invoice = PurchaseInvoice.objects.select_related('supplier').get(pk=self.invoice.pk)
+            invoice.calculate_distribution()
+            apply_invoice_stock(invoice)
+            invoice.status = 'COMPLETED'
+            invoice.save(update_fields=['status', 'updated_at'])
+
+            self._save_progress(
+                status='COMPLETED', bytes_read=self.job.bytes_total, finished_at=timezone.now()
+            )
+            publish_event('pharmacy_inventory_update', {
+                'invoice_id': str(invoice.id),
+                'amount': float(invoice.total_amount),
+                **snapshot(invoice, PURCHASE_SNAPSHOT_FIELDS),
+            }, room=[role_room('ADMIN'), role_room('PHARMACY')])
+
+
+def _column_positions(header_row):
+    """Field -> column indexes (priority order) for a TH line, resolved once per file."""
+    positions = {}
+    for index, name in enumerate(header_row):
+        positions.setdefault(name.strip().lower(), index)
+    return {
+        field: [positions[alias.lower()] for alias in aliases if alias.lower() in positions]
+        for field, aliases in COLUMNS.items()
+    }
+
+
+def _pick(row, positions):
+    for index in positions:
+        if index < len(row) and row[index].strip():
+            return row[index].strip()
+    return ''
+
+
+def _validate_item(values):
+    """PurchaseItem field values for one T line, or a list of problems with it."""
+    errors = []
+
+    def number(field, label, whole=False, upper=None):
+        raw = values[field].replace('%', '').replace(',', '')
+        if not raw:
+            return Decimal(0)
+        try:
+            value = Decimal(raw)
+        except InvalidOperation:
+            errors.append(f"{label}: '{values[field]}' is not a number")
+            return None
+        if not value.is_finite() or value < 0:
+            errors.append(f"{label}: must be zero or more")
+        elif whole and value != value.to_integral_value():
+            errors.append(f"{label}: must be a whole number")
+        elif upper is not None and value > upper:
+            errors.append(f"{label}: must not exceed {upper}")
+        else:
+            return int(value) if whole else d_round(value)
+        return None
+
+    product_name = values['product_name']
+    if not product_name:
+        errors.append("Product name is missing")
+
+    expiry_date = None
+    if not values['expiry']:
+        errors.append("Expiry is missing")
+    else:
+        try:
+            expiry_date = datetime.strptime(values['expiry'], '%m/%Y').date()
+        except ValueError:
+            errors.append(f"Expiry: '{values['expiry']}' is not MM/YYYY")
+
+    qty = number('qty', 'Qty', whole=True)
+    free_qty = number('free_qty', 'Free', whole=True)
+    purchase_rate = number('purchase_rate', 'Rate')
+    ptr = number('ptr', 'PTR')
+    mrp = number('mrp', 'MRP')
+    gst_percent = number('gst_percent', 'GST', upper=100)
+    discount_percent = number('discount_percent', 'Discount', upper=100)
+
+    if errors:
+        return None, errors
+
+    # Packing such as "10S" or "10 Tablets"
+    match = re.search(r'(\d+)', values['packing'])
+    tablets_per_strip = max(int(match.group(1)), 1) if match else 1
+
+    return {
+        'product_name': product_name,
+        'barcode': values['barcode'],
+        'batch_no': values['batch_no'] or 'N/A',
+        'expiry_date': expiry_date,
+        'qty': qty,
+        'free_qty': free_qty,
+        # CSV carries UNIT rates, not line totals
+        'purchase_rate': purchase_rate,
+        'mrp': mrp,
+        'ptr': ptr,
+        'manufacturer': values['manufacturer'],
+        'hsn': values['hsn'],
+        'tablets_per_strip': tablets_per_strip,
+        'gst_percent': gst_percent,
+        'discount_percent': discount_percent,
+    }, []
+
+
+# --- Stock ---
+
+def apply_invoice_stock(invoice, chunk_size=CHUNK_SIZE):
+    """
+    Add the invoice's lines to PharmacyStock: per chunk, one query resolves the existing
+    (name, batch_no) rows, one bulk_create writes the new batches, one bulk_update their
+    metadata and one `put` adds the received quantities to the existing ones.
+    Bulk writes skip post_save, so low-stock alerts, the ledger and the medicine
+    search and barcode caches are updated here.
+    """
+    items = invoice.items.order_by('created_at', 'id')
+    last = None
+    while True:
+        page = items
+        if last:
+            page = page.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], id__gt=last[1]))
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            break
+        _apply_stock_chunk(invoice, chunk)
+        last = (chunk[-1].created_at, chunk[-1].id)
+
+
+def _apply_stock_chunk(invoice, items):
+    from core.stock import put
+    from .ledger import record, recording
+    from .models import PharmacyStock, StockMovement
+    from .search import invalidate_medicine_index
+    from .barcodes import invalidate_barcodes
+    from .signals import sync_low_stock_alerts
+
+    stocks = {
+        (stock.name, stock.batch_no): stock
+        for stock in PharmacyStock.objects.filter(
+            name__in={item.product_name for item in items},
+            batch_no__in={item.batch_no for item in items},
+        )
+    }
+
+    now = timezone.now()
+    created, updated = {}, {}
+    received = []  # (stock, qty) per line of a new batch, for the ledger
+    increments = {}  # existing batch pk -> qty received
+    for item in items:
+        strips = item.qty + item.free_qty
+        qty_in = strips * item.tablets_per_strip
+        # Effective purchase rate: net cost of the line per strip, free strips included
+        if strips > 0:
+            effective_purch_rate = d_round(item.taxable_amount / strips)
+        else:
+            effective_purch_rate = d_round(item.purchase_rate)
+
+        key = (item.product_name, item.batch_no)
+        stock = stocks.get(key)
+        if stock is None:
+            stocks[key] = created[key] = PharmacyStock(
+                name=item.product_name,
+                batch_no=item.batch_no,
+                expiry_date=item.expiry_date,
+                supplier=invoice.supplier,
+                barcode=item.barcode or '',
+                mrp=item.mrp,
+                selling_price=item.mrp,
+                purchase_rate=effective_purch_rate,
+                ptr=item.ptr,
+                qty_available=qty_in,
+                tablets_per_strip=item.tablets_per_strip,
+                hsn=item.hsn,
+                gst_percent=item.gst_percent,
+                manufacturer=item.manufacturer,
+                is_deleted=False,
+            )
+            received.append((stocks[key], qty_in))
+            continue
+
+        if key in created:
+            # Another line for a batch this chunk creates: not in the table yet
+            stock.qty_available += qty_in
+            received.append((stock, qty_in))
+        else:
+            increments[stock.pk] = increments.get(stock.pk, 0) + qty_in
+        stock.mrp = item.mrp
+        stock.selling_price = item.mrp
+        stock.purchase_rate = effective_purch_rate
+        stock.ptr = item.ptr
+        stock.tablets_per_strip = item.tablets_per_strip
+        stock.gst_percent = item.gst_percent
+        if item.manufacturer: stock.manufacturer = item.manufacturer
+        if item.hsn: stock.hsn = item.hsn
+        if item.barcode: stock.barcode = item.barcode
+        stock.updated_at = now  # bulk_update does not apply auto_now
+        if key not in created:
+            updated[key] = stock
+
+    PharmacyStock.objects.bulk_create(created.values())
+    PharmacyStock.objects.bulk_update(updated.values(), STOCK_UPDATE_FIELDS)
+    record(received, source='import', reference=invoice.id, kind=StockMovement.IN)
+    # Added to the stored quantity, so sales made since the rows were read are kept;
+    # stock_moved records these in the ledger and clears low-stock alerts
+    with recording('import', invoice.id, kind=StockMovement.IN):
+        put(PharmacyStock, increments)
+    invalidate_medicine_index()
+    invalidate_barcodes()
+
+    sync_low_stock_alerts(created.values(), created=True)
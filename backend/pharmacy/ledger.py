@@ -0,0 +1,122 @@
+"""
+The pharmacy stock ledger.
+
+Every change to PharmacyStock.qty_available is appended to StockMovement:
+  - saves are recorded by a post_save handler (pharmacy.signals) against the quantity
+    stored just before the write,
+  - conditional UPDATEs (core.stock) through the stock_moved signal,
+  - bulk writes, which skip both, call `record` themselves (pharmacy.imports).
+
+Callers say why stock moved by wrapping the write in `recording(...)`; anything
+unlabelled is an ADJUST from 'edit' (stock screen, admin).
+
+StockCheckpoint rows (`checkpoint_stock` command) store per-batch balances, so the
+quantity on hand at any moment is the latest checkpoint before it plus the movements in
+between: two index range scans per batch instead of a replay of the whole history.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from django.db.models import DateTimeField, IntegerField, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+_labels = ContextVar('pharmacy_stock_movement', default=None)
+
+# Movements with no checkpoint before them count from the beginning
+BEGINNING = datetime(1970, 1, 1)
+
+
+@contextmanager
+def recording(source, reference=None, kind=None, inbound=None):
+    """
+    Label the stock movements written inside the block. `kind` applies to all of them;
+    without it removals are OUT and additions `inbound` (IN unless given, e.g. RETURN
+    for a bill line that gives stock back).
+    """
+    token = _labels.set((source, reference, kind, inbound))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def record(changes, source=None, reference=None, kind=None, keep_zero=False):
+    """
+    Append [(stock, signed qty), ...] to the ledger in one INSERT. Labels not passed
+    come from the enclosing `recording` block. Zero changes are dropped unless
+    `keep_zero` (a deleted empty batch is still worth a line).
+    """
+    from .models import StockMovement
+    labels = _labels.get() or ('edit', None, None, None)
+    source = source or labels[0]
+    reference = reference or labels[1]
+
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            stock=stock,
+            name=stock.name,
+            batch_no=stock.batch_no,
+            movement_type=kind or _movement_type(qty),
+            qty=qty,
+            rate=stock.purchase_rate,
+            source=source,
+            reference_id=reference,
+        )
+        for stock, qty in changes if qty or keep_zero
+    ])
+
+
+def _movement_type(qty):
+    from .models import StockMovement
+    labels = _labels.get()
+    if labels is None:
+        return StockMovement.ADJUST
+    kind, inbound = labels[2], labels[3]
+    if kind:
+        return kind
+    return StockMovement.OUT if qty < 0 else (inbound or StockMovement.IN)
+
+
+def ledger_start():
+    """
+    When the ledger began: its opening checkpoints (migration 0024), else its first
+    movement; None while it is empty. Stock history before then is only in the purchase
+    and sale tables.
+    """
+    from .models import StockCheckpoint, StockMovement
+    opening = StockCheckpoint.objects.aggregate(first=Min('as_of'))['first']
+    first_move = StockMovement.objects.aggregate(first=Min('created_at'))['first']
+    return min((moment for moment in (opening, first_move) if moment), default=None)
+
+
+def stock_on_hand(moment, queryset=None):
+    """
+    PharmacyStock rows annotated with `balance`, their quantity at `moment`, from the
+    latest checkpoint at or before it (`checkpoint_at`, `checkpoint_balance`) plus the
+    sum of the movements after it (`moved`, None when there were none).
+    """
+    from .models import PharmacyStock, StockCheckpoint, StockMovement
+
+    queryset = PharmacyStock.objects.all() if queryset is None else queryset
+    checkpoint = StockCheckpoint.objects.filter(stock=OuterRef('pk'), as_of__lte=moment).order_by('-as_of')
+    moved = (
+        StockMovement.objects
+        .filter(
+            stock=OuterRef('pk'),
+            created_at__gt=Coalesce(OuterRef('checkpoint_at'), Value(BEGINNING, output_field=DateTimeField())),
+            created_at__lte=moment,
+        )
+        .order_by()
+        .values('stock')
+        .annotate(total=Sum('qty'))
+        .values('total')
+    )
+    return queryset.annotate(
+        checkpoint_at=Subquery(checkpoint.values('as_of')[:1]),
+        checkpoint_balance=Subquery(checkpoint.values('balance')[:1]),
+    ).annotate(
+        moved=Subquery(moved, output_field=IntegerField()),
+    ).annotate(
+        balance=Coalesce('checkpoint_balance', 0) + Coalesce('moved', 0),
+    )
@@ -0,0 +1,73 @@
+import random
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from pharmacy.models import Supplier, PurchaseInvoice, PurchaseItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks PurchaseInvoice.calculate_distribution for invoices of 10, 100 and 1,000 '
+        'lines (or --lines). Runs in a transaction that is rolled back; nothing is kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per size; the median is reported')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        self.stdout.write(
+            "'full' recomputes after every line changed (new invoice, discount edit); "
+            "'unchanged' recomputes with nothing to write."
+        )
+        self.stdout.write(f"{'lines':>6} {'full ms':>9} {'queries':>8} {'per line ms':>12} {'unchanged ms':>13} {'queries':>8}")
+
+        for lines in options['lines']:
+            with transaction.atomic():
+                invoice = self._invoice(rng, lines)
+                full, full_queries = self._measure(invoice, options['repeat'], reset=True)
+                unchanged, unchanged_queries = self._measure(invoice, options['repeat'], reset=False)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f"{lines:>6} {full:>9.2f} {full_queries:>8} {full / lines:>12.4f} {unchanged:>13.2f} {unchanged_queries:>8}"
+            )
+
+    def _measure(self, invoice, repeat, reset):
+        """Median milliseconds and query count of calculate_distribution on `invoice`."""
+        timings = []
+        for _ in range(repeat):
+            if reset:
+                invoice.items.update(taxable_amount=0, cash_discount_amount=0, gst_amount=0, total_amount=0)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                invoice.calculate_distribution()
+                timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)[len(timings) // 2], len(queries)
+
+    def _invoice(self, rng, lines):
+        supplier = Supplier.objects.create(supplier_name='Benchmark supplier')
+        invoice = PurchaseInvoice.objects.create(
+            supplier=supplier, supplier_invoice_no='BENCH', invoice_date=date.today(),
+            purchase_type='CASH', total_amount=0,
+            cash_discount=Decimal('123.45'), courier_charge=Decimal('50.00'),
+        )
+        PurchaseItem.objects.bulk_create([
+            PurchaseItem(
+                purchase=invoice, product_name=f'Bench item {i}', batch_no=f'B{i}',
+                expiry_date=date(2030, 1, 1), qty=rng.randint(1, 50),
+                purchase_rate=Decimal(rng.randint(100, 50000)) / 100,
+                ptr=Decimal(rng.randint(100, 50000)) / 100,
+                mrp=Decimal(rng.randint(100, 90000)) / 100,
+                gst_percent=rng.choice([Decimal(0), Decimal(5), Decimal(12), Decimal(18)]),
+                discount_percent=Decimal(rng.randint(0, 1500)) / 100,
+            )
+            for i in range(lines)
+        ])
+        return invoice
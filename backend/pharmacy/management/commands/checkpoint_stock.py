@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from pharmacy.ledger import stock_on_hand
+from pharmacy.models import PharmacyStock, StockCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes a balance checkpoint for every pharmacy batch that moved since its last one, '
+        'so on-hand-at-date queries only add up the movements after it. Run periodically '
+        '(e.g. nightly). With --check, also lists batches whose ledger balance differs from '
+        'qty_available (a write that bypassed the ledger).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag-minutes', type=int, default=5,
+                            help='Checkpoint this far in the past, so transactions still open are not missed')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--check', action='store_true', help='Report ledger drift against qty_available')
+
+    def handle(self, *args, **options):
+        as_of = timezone.now() - timedelta(minutes=options['lag_minutes'])
+        written = 0
+
+        for chunk in self._chunks(options['chunk_size']):
+            balances = stock_on_hand(as_of, PharmacyStock.objects.filter(pk__in=chunk)).values_list(
+                'pk', 'checkpoint_at', 'moved', 'balance'
+            )
+            checkpoints = [
+                StockCheckpoint(stock_id=pk, as_of=as_of, balance=balance)
+                for pk, checkpoint_at, moved, balance in balances
+                if moved is not None or checkpoint_at is None
+            ]
+            StockCheckpoint.objects.bulk_create(checkpoints, ignore_conflicts=True)
+            written += len(checkpoints)
+
+        self.stdout.write(f"Wrote {written} checkpoint(s) as of {as_of:%Y-%m-%d %H:%M:%S}")
+
+        if options['check']:
+            self._check()
+
+    def _chunks(self, size):
+        """Batch ids in keyset pages."""
+        last_id = None
+        while True:
+            ids = PharmacyStock.objects.order_by('id').values_list('id', flat=True)
+            if last_id is not None:
+                ids = ids.filter(id__gt=last_id)
+            chunk = list(ids[:size])
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1]
+
+    def _check(self):
+        drifted = (
+            stock_on_hand(timezone.now())
+            .exclude(balance=F('qty_available'))
+            .values_list('name', 'batch_no', 'qty_available', 'balance')
+        )
+        count = 0
+        for name, batch_no, qty, balance in drifted.iterator():
+            count += 1
+            self.stdout.write(f"  {name} ({batch_no}): qty_available {qty}, ledger {balance}")
+        self.stdout.write(f"{count} batch(es) out of step with the ledger")
@@ -1,38 +1,45 @@
-from django.core.management.base import BaseCommand
+from decimal import Decimal
+
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+
+from core.maintenance import ChunkedCommand
+from pharmacy.barcodes import invalidate_barcodes
 from pharmacy.models import PharmacyStock, PurchaseItem
 
-class Command(BaseCommand):
-    help = 'Populates ptr field in PharmacyStock from latest PurchaseItem'
-
-    def handle(self, *args, **kwargs):
-        stocks = PharmacyStock.objects.filter(is_deleted=False)
-        updated_count = 0
-
-        for stock in stocks:
-            # Find the latest purchase item for this batch
-            last_purchase = PurchaseItem.objects.filter(
-                product_name=stock.name, 
-                batch_no=stock.batch_no
-            ).order_by('-created_at').first()
-
-            if last_purchase:
-                # Use the PTR from the invoice history
-                # If PTR was 0 in history, fall back to current purchase_rate (safeguard)
-                new_ptr = last_purchase.ptr if last_purchase.ptr > 0 else stock.purchase_rate
-                
-                if new_ptr > 0:
-                    stock.ptr = new_ptr
-                    stock.save()
-                    updated_count += 1
-                    self.stdout.write(f"Updated {stock.name}: PTR {new_ptr}")
-            else:
-                # No purchase history found (maybe manual stock entry?), leave as is or set to current rate?
-                # If we leave as 0, frontend falls back to purchase_rate anyway.
-                # But let's set it to purchase_rate to be clean if purchase_rate > 0
-                if stock.ptr == 0 and stock.purchase_rate > 0:
-                    # Wait, if we set it to purchase_rate (38.22), it defeats the purpose if the goal was to find 76.43
-                    # But if no history exists, we can't find 76.43.
-                    # So finding history is the only way to "recover" the higher price.
-                    pass
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully updated {updated_count} stock items'))
+
+class Command(ChunkedCommand):
+    help = (
+        'Populates ptr field in PharmacyStock from latest PurchaseItem of the same name and batch '
+        '(current purchase_rate when that PTR was 0). One UPDATE per chunk of batches.'
+    )
+
+    def get_queryset(self, **options):
+        return PharmacyStock.objects.filter(is_deleted=False)
+
+    def process_chunk(self, ids, **options):
+        latest_ptr = PurchaseItem.objects.filter(
+            product_name=OuterRef('name'), batch_no=OuterRef('batch_no')
+        ).order_by('-created_at').values('ptr')[:1]
+
+        # Use the PTR from the invoice history; if it was 0 there, fall back to the
+        # current purchase_rate (safeguard). Batches with no purchase history (manual
+        # entries) are left as they are: the frontend falls back to purchase_rate.
+        new_ptr = Coalesce(NullIf(Subquery(latest_ptr), Value(Decimal('0'))), F('purchase_rate'))
+        stale = (
+            PharmacyStock.objects.filter(pk__in=ids)
+            .alias(latest_ptr=Subquery(latest_ptr), new_ptr=new_ptr)
+            .filter(latest_ptr__isnull=False, new_ptr__gt=0)
+            .exclude(ptr=F('new_ptr'))
+        )
+        if options['verbosity'] > 1:
+            for name, batch_no, ptr in stale.annotate(ptr_found=new_ptr).values_list('name', 'batch_no', 'ptr_found'):
+                self.stdout.write(f"Updated {name} ({batch_no}): PTR {ptr}")
+
+        return stale.update(ptr=new_ptr, updated_at=timezone.now())
+
+    def finish(self, changed, **options):
+        if changed:
+            # Cached scan results carry the batch's ptr
+            invalidate_barcodes()
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pharmacy.imports import run_import
+from pharmacy.models import PharmacyImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Processes queued pharmacy bulk-upload jobs. Jobs left RUNNING by a worker that '
+        'stopped (no progress for --stale-minutes) are re-queued and start over.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=int, default=30,
+                            help='Re-queue RUNNING jobs with no progress for this long')
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        requeued = PharmacyImportJob.objects.filter(status='RUNNING', updated_at__lt=stale_before).update(
+            status='QUEUED', updated_at=timezone.now()
+        )
+        if requeued:
+            self.stdout.write(f"Re-queued {requeued} stalled job(s)")
+
+        for job_id in PharmacyImportJob.objects.filter(status='QUEUED').order_by('created_at').values_list('id', flat=True):
+            if not run_import(job_id):
+                continue
+            job = PharmacyImportJob.objects.defer('errors').get(pk=job_id)
+            self.stdout.write(
+                f"{job.id}: {job.status} ({job.rows_imported} imported, {job.rows_failed} rejected)"
+                + (f" - {job.message}" if job.message else '')
+            )
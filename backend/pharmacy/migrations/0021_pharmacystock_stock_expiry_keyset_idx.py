@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0020_pharmacystock_category_purchaseinvoice_category'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pharmacystock',
+            index=models.Index(fields=['expiry_date', 'id'], name='stock_expiry_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:21
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0022_pharmacyimportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.IntegerField()),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='pharmacy.pharmacystock')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stock', 'as_of'), name='unique_stock_checkpoint')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('name', models.CharField(max_length=255)),
+                ('batch_no', models.CharField(max_length=50)),
+                ('movement_type', models.CharField(choices=[('IN', 'Stock In'), ('OUT', 'Stock Out'), ('RETURN', 'Return'), ('ADJUST', 'Adjustment')], max_length=10)),
+                ('qty', models.IntegerField()),
+                ('rate', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('source', models.CharField(blank=True, max_length=30)),
+                ('reference_id', models.UUIDField(blank=True, null=True)),
+                ('stock', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='pharmacy.pharmacystock')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stock', 'created_at'], name='movement_stock_time_idx'), models.Index(fields=['created_at'], name='movement_time_idx')],
+            },
+        ),
+    ]
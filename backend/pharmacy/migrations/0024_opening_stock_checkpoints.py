@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+
+def opening_checkpoints(apps, schema_editor):
+    """The ledger starts empty: record every batch's current quantity as its opening balance."""
+    PharmacyStock = apps.get_model('pharmacy', 'PharmacyStock')
+    StockCheckpoint = apps.get_model('pharmacy', 'StockCheckpoint')
+    now = timezone.now()
+
+    last_id = None
+    while True:
+        chunk = PharmacyStock.objects.order_by('id').values_list('id', 'qty_available')
+        if last_id is not None:
+            chunk = chunk.filter(id__gt=last_id)
+        batch = list(chunk[:CHUNK_SIZE])
+        if not batch:
+            break
+
+        StockCheckpoint.objects.bulk_create([
+            StockCheckpoint(stock_id=stock_id, as_of=now, balance=qty)
+            for stock_id, qty in batch
+        ])
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0023_stockmovement_stockcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(opening_checkpoints, migrations.RunPython.noop),
+    ]
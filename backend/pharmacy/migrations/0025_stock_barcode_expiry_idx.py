@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0024_opening_stock_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pharmacystock',
+            index=models.Index(fields=['barcode', 'expiry_date'], name='stock_barcode_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0025_stock_barcode_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pharmacystock',
+            index=models.Index(fields=['updated_at'], name='stock_updated_idx'),
+        ),
+    ]
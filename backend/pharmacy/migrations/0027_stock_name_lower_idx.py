@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:29
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0026_stock_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pharmacystock',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('expiry_date'), name='stock_name_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:34
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_returns(apps, schema_editor):
+    """Fill the new counter from the returns already recorded, in one UPDATE."""
+    PharmacySaleItem = apps.get_model('pharmacy', 'PharmacySaleItem')
+    PharmacyReturnItem = apps.get_model('pharmacy', 'PharmacyReturnItem')
+
+    returned = (
+        PharmacyReturnItem.objects
+        .filter(sale_item=OuterRef('pk'))
+        .order_by()
+        .values('sale_item')
+        .annotate(total=Sum('qty_returned'))
+        .values('total')
+    )
+    PharmacySaleItem.objects.update(qty_returned=Coalesce(Subquery(returned), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0027_stock_name_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pharmacysaleitem',
+            name='qty_returned',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_returns, migrations.RunPython.noop),
+    ]
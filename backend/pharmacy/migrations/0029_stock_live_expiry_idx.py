@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0028_pharmacysaleitem_qty_returned'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pharmacystock',
+            index=models.Index(fields=['is_deleted', 'expiry_date'], name='stock_live_expiry_idx'),
+        ),
+    ]
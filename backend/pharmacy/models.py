@@ -1,8 +1,11 @@
 import uuid
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import MinValueValidator
-from core.models import BaseModel
+from core.models import BaseModel, StockLevelMixin
 from patients.models import Visit, Patient
 
 
@@ -17,6 +20,10 @@ class Supplier(BaseModel):
         return self.supplier_name
 
 
+# PurchaseItem fields written by PurchaseInvoice.calculate_distribution
+DISTRIBUTION_FIELDS = ['taxable_amount', 'cash_discount_amount', 'gst_amount', 'total_amount']
+
+
 class PurchaseInvoice(BaseModel):
     PURCHASE_TYPE_CHOICES = (
         ('CASH', 'Cash'),
@@ -52,7 +59,7 @@ class PurchaseInvoice(BaseModel):
         """Deprecated: Use calculate_distribution instead for accurate GST/Discount logic."""
         return self.calculate_distribution()
 
-    def calculate_distribution(self):
+    def calculate_distribution(self, items=None):
         """
         DISTRIBUTION LOGIC (Refined for Strict 2-Decimal Precision):
         Uses Decimal with ROUND_HALF_UP to ensure 1.666 -> 1.67
@@ -62,11 +69,15 @@ class PurchaseInvoice(BaseModel):
         2. Calculate GST = Taxable * Rate.
         3. Round GST immediately (d_round).
         4. Sum(Rounded GST) + Sum(Taxable) = Final Total.
+
+        Items are read once (or passed in as `items`) and the four computed fields are
+        written back with a single bulk_update, limited to lines whose values changed
+        (which also get a new updated_at).
         """
         from decimal import Decimal, ROUND_HALF_UP
         
-        items = self.items.all()
-        if not items.exists():
+        items = list(self.items.all()) if items is None else list(items)
+        if not items:
             self.total_amount = 0
             self.save(update_fields=['total_amount'])
             return 0
@@ -78,7 +89,7 @@ class PurchaseInvoice(BaseModel):
 
         # Step 1: Calculate Base Taxable (Gross) using Decimals
         total_taxable_pool = Decimal(0)
-        item_calcs = []
+        base_taxables = []
 
         for item in items:
             # Convert inputs to decimal first
@@ -96,28 +107,26 @@ class PurchaseInvoice(BaseModel):
             base_taxable = d_round(gross_amount - trade_disc_amt)
             
             total_taxable_pool += base_taxable
-            item_calcs.append({
-                'item': item,
-                'base_taxable': base_taxable
-            })
+            base_taxables.append(base_taxable)
 
         # Step 2 & 3: Distribute Cash Discount & Calculate GST
-        remaining_discount = Decimal(str(self.cash_discount)) # No rounding involved yet, just input
+        cash_discount = Decimal(str(self.cash_discount))
+        remaining_discount = cash_discount # No rounding involved yet, just input
         final_invoice_total = Decimal(0)
+        changed = []
         
         courier = Decimal(str(self.courier_charge))
         
-        for i, obj in enumerate(item_calcs):
-            item = obj['item']
-            base_taxable = obj['base_taxable']
+        for i, (item, base_taxable) in enumerate(zip(items, base_taxables)):
+            previous = tuple(getattr(item, field) for field in DISTRIBUTION_FIELDS)
 
             # Proportional Discount
             if total_taxable_pool > 0:
-                if i == len(item_calcs) - 1:
+                if i == len(items) - 1:
                     # Last item takes remainder to fix exact matching of input discount
                     allocated_discount = remaining_discount
                 else:
-                    allocated_discount = (base_taxable / total_taxable_pool) * Decimal(str(self.cash_discount))
+                    allocated_discount = (base_taxable / total_taxable_pool) * cash_discount
                     # NO Rounding on allocated discount here (High precision for logic)
                     remaining_discount -= allocated_discount
             else:
@@ -142,12 +151,18 @@ class PurchaseInvoice(BaseModel):
 
             # Item Total = Rounded Taxable + Rounded GST
             item.total_amount = item.taxable_amount + item.gst_amount
-            
-            # Save Item
-            item.save()
+            if tuple(getattr(item, field) for field in DISTRIBUTION_FIELDS) != previous:
+                changed.append(item)
             
             final_invoice_total += item.total_amount
 
+        if changed:
+            # bulk_update skips auto_now, so the changed lines are stamped here
+            now = timezone.now()
+            for item in changed:
+                item.updated_at = now
+            PurchaseItem.objects.bulk_update(changed, DISTRIBUTION_FIELDS + ['updated_at'])
+
         # Final Total
         # Use simple addition, NOT rounding to whole number.
         self.total_amount = final_invoice_total + courier
@@ -169,7 +184,9 @@ class PurchaseInvoice(BaseModel):
         return f"Inv {self.supplier_invoice_no} - {self.supplier.supplier_name}"
 
 
-class PharmacyStock(BaseModel):
+class PharmacyStock(StockLevelMixin, BaseModel):
+    stock_qty_field = 'qty_available'
+
     name = models.CharField(max_length=255)
     barcode = models.CharField(max_length=100, blank=True)
     batch_no = models.CharField(max_length=50)
@@ -224,6 +241,13 @@ class PharmacyStock(BaseModel):
                 name='unique_stock_name_batch'
             )
         ]
+        indexes = [
+            models.Index(fields=['expiry_date', 'id'], name='stock_expiry_keyset_idx'),
+            models.Index(fields=['barcode', 'expiry_date'], name='stock_barcode_expiry_idx'),
+            models.Index(fields=['updated_at'], name='stock_updated_idx'),
+            models.Index(Lower('name'), F('expiry_date'), name='stock_name_lower_idx'),
+            models.Index(fields=['is_deleted', 'expiry_date'], name='stock_live_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.batch_no})"
@@ -302,6 +326,8 @@ class PharmacySaleItem(BaseModel):
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     gst_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # GST rate applied at sale time
+    # Sum of returned_items.qty_returned, kept by PharmacyReturnSerializer
+    qty_returned = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.med_stock.name} x {self.qty}"
@@ -336,3 +362,103 @@ class PharmacyReturnItem(BaseModel):
 
     def __str__(self):
         return f"Ret: {self.med_stock.name} x {self.qty_returned}"
+
+
+class PharmacyImportJob(BaseModel):
+    """
+    A distributor CSV upload processed in the background (see pharmacy.imports).
+    Progress counters are updated after every chunk; `errors` holds the per-row report.
+    """
+    STATUS_CHOICES = (
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    )
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    file = models.FileField(upload_to='pharmacy_imports/')
+    supplier_name = models.CharField(max_length=255)
+    invoice = models.ForeignKey(PurchaseInvoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+
+    bytes_total = models.PositiveBigIntegerField(default=0)
+    bytes_read = models.PositiveBigIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_imported = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    # [{'line': n, 'product': ..., 'batch': ..., 'errors': [...]}, ...]
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+
+    @property
+    def progress(self):
+        """Share of the file read so far, 0-100."""
+        if self.status == 'COMPLETED':
+            return 100
+        if not self.bytes_total:
+            return 0
+        return min(99, int(self.bytes_read * 100 / self.bytes_total))
+
+    def __str__(self):
+        return f"Import {self.id} ({self.status})"
+
+
+class StockMovement(BaseModel):
+    """
+    Append-only ledger of PharmacyStock quantity changes (see pharmacy.ledger).
+    `qty` is signed: positive adds stock, negative removes it. Name and batch are
+    copied so the history survives a batch being deleted.
+    """
+    IN = 'IN'
+    OUT = 'OUT'
+    RETURN = 'RETURN'
+    ADJUST = 'ADJUST'
+    TYPE_CHOICES = (
+        (IN, 'Stock In'),
+        (OUT, 'Stock Out'),
+        (RETURN, 'Return'),
+        (ADJUST, 'Adjustment'),
+    )
+
+    stock = models.ForeignKey(PharmacyStock, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    name = models.CharField(max_length=255)
+    batch_no = models.CharField(max_length=50)
+
+    movement_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    qty = models.IntegerField()
+    rate = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # purchase rate at the time
+
+    # What moved it: 'sale', 'return', 'purchase', 'import', 'billing', 'casualty', 'edit', ...
+    source = models.CharField(max_length=30, blank=True)
+    reference_id = models.UUIDField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock', 'created_at'], name='movement_stock_time_idx'),
+            models.Index(fields=['created_at'], name='movement_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movement_type} {self.name} ({self.batch_no}) {self.qty:+d}"
+
+
+class StockCheckpoint(BaseModel):
+    """
+    Balance of a batch at `as_of`, i.e. the sum of its movements up to then. On-hand stock
+    at a date is the latest checkpoint before it plus the movements in between.
+    """
+    stock = models.ForeignKey(PharmacyStock, on_delete=models.CASCADE, related_name='checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'as_of'], name='unique_stock_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_id} @ {self.as_of}: {self.balance}"
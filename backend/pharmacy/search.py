@@ -0,0 +1,110 @@
+"""
+Medicine autocomplete for prescriptions (PharmacyStockViewSet.doctor_search).
+
+Each process keeps a MedicineIndex: one row per medicine name (total stock, plus MRP and
+strip size of the latest-expiring batch) built by a single window-function query, and a
+sorted array of lower-cased keys searched with bisect, so a keystroke costs a cache read
+and two binary searches.
+
+Any stock change bumps a generation number in the Django cache (after commit); a process
+whose index carries an older generation rebuilds it on its next search. With a shared
+cache (CACHE_DIR) this reaches every worker, otherwise only the process that made the
+change.
+"""
+import threading
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+
+# Upper bound for a prefix range in the sorted keys
+PREFIX_SENTINEL = '\uffff'
+
+MIN_QUERY_LENGTH = 2
+GENERATION_KEY = 'pharmacy:medicine-index:gen'
+
+_index = None
+_lock = threading.Lock()
+
+
+class MedicineIndex:
+    def __init__(self, generation, entries):
+        self.generation = generation
+        self.entries = entries  # ordered by name
+
+        # A key per word start, so "para" finds "Paracetamol 500" and "Dolo-Paracetamol"
+        keyed = []
+        for position, entry in enumerate(entries):
+            name = entry['name'].lower()
+            keyed.extend((name[start:], position) for start in word_starts(name))
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.positions = [position for _, position in keyed]
+
+    def search(self, query):
+        query = query.lower()
+        lo = bisect_left(self.keys, query)
+        hi = bisect_left(self.keys, query + PREFIX_SENTINEL, lo)
+        return [self.entries[position] for position in sorted(set(self.positions[lo:hi]))]
+
+
+def word_starts(name):
+    return [i for i, char in enumerate(name) if char.isalnum() and (i == 0 or not name[i - 1].isalnum())]
+
+
+def medicine_rows():
+    """One query: per name, the total quantity and the latest-expiring batch's MRP and strip size."""
+    from .models import PharmacyStock
+
+    rows = (
+        PharmacyStock.objects
+        .filter(is_deleted=False)
+        .annotate(
+            total_qty=Window(Sum('qty_available'), partition_by=[F('name')]),
+            latest=Window(
+                RowNumber(), partition_by=[F('name')],
+                order_by=[F('expiry_date').desc(), F('created_at').desc()],
+            ),
+        )
+        .filter(latest=1)
+        .order_by('name')
+        .values_list('name', 'total_qty', 'mrp', 'tablets_per_strip')
+    )
+    return [{
+        # Use name as ID to unique key it in frontend lists
+        'id': name,
+        'name': name,
+        'qty_available': total_qty or 0,
+        'mrp': mrp,
+        'tablets_per_strip': tablets_per_strip,
+    } for name, total_qty, mrp, tablets_per_strip in rows]
+
+
+def suggest_medicines(query):
+    """Medicines with a word starting with `query` (case-insensitive), ordered by name."""
+    global _index
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    index = _index
+    if index is None or index.generation != generation:
+        with _lock:
+            index = _index
+            if index is None or index.generation != generation:
+                index = _index = MedicineIndex(generation, medicine_rows())
+    return index.search(query)
+
+
+def invalidate_medicine_index():
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, None)
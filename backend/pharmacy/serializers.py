@@ -1,12 +1,20 @@
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import F
+from django.utils import timezone
 from rest_framework import serializers
+from core.stock import InsufficientStock, take, put
+from .ledger import recording
+from revive_cms.realtime import publish_event, snapshot, role_room, patient_room, visit_room
 from .models import (
     Supplier, PharmacyStock, PurchaseInvoice, PurchaseItem,
     PharmacySale, PharmacySaleItem,
-    PharmacyReturn, PharmacyReturnItem
+    PharmacyReturn, PharmacyReturnItem, PharmacyImportJob, StockMovement
 )
 
+# Compact rows sent with socket events so clients can patch in place
+PURCHASE_SNAPSHOT_FIELDS = ('supplier_id', 'supplier_invoice_no', 'status', 'total_amount', 'updated_at')
+SALE_SNAPSHOT_FIELDS = ('visit_id', 'patient_id', 'total_amount', 'payment_status', 'updated_at')
+
 
 class SupplierSerializer(serializers.ModelSerializer):
     supplier_id = serializers.UUIDField(source='id', read_only=True)
@@ -69,16 +77,17 @@ class PurchaseInvoiceSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
-        for item in items_data:
-            PurchaseItem.objects.create(purchase=invoice, **item)
+        items = PurchaseItem.objects.bulk_create([
+            PurchaseItem(purchase=invoice, **item) for item in items_data
+        ])
 
         # Calculate Distribution (GST, Disc)
-        invoice.calculate_distribution()
-        invoice.refresh_from_db()
+        invoice.calculate_distribution(items)
 
         # Conditionally Update Stock
         if invoice.status == 'COMPLETED':
-            self._process_stock_for_invoice(invoice)
+            with recording('purchase', invoice.id, kind=StockMovement.IN):
+                self._process_stock_for_invoice(invoice)
 
         return invoice
 
@@ -95,33 +104,35 @@ class PurchaseInvoiceSerializer(serializers.ModelSerializer):
              # Logic for updating items
              # IF status was already COMPLETED, we must reverse the old stock contribution before replacing items
              if old_status == 'COMPLETED':
-                 self._reverse_stock_for_invoice(instance)
+                 with recording('purchase_edit', instance.id, kind=StockMovement.ADJUST):
+                     self._reverse_stock_for_invoice(instance)
 
              # Now delete and recreate items (Works for both DRAFT and COMPLETED now)
              instance.items.all().delete()
-             for item in items_data:
-                PurchaseItem.objects.create(purchase=instance, **item)
-             
-             # Recalculate everything (GST, Discounts)
-             instance.calculate_distribution()
-             instance.refresh_from_db()
+             items = PurchaseItem.objects.bulk_create([
+                PurchaseItem(purchase=instance, **item) for item in items_data
+             ])
 
         instance.save()
 
+        # Recalculate everything (GST, Discounts) when lines or invoice-level charges changed
+        if items_data is not None:
+            instance.calculate_distribution(items)
+        elif 'cash_discount' in validated_data or 'courier_charge' in validated_data:
+            instance.calculate_distribution()
+
         # IF transitioning to COMPLETED (from Draft) OR staying COMPLETED (after edit)
         # Apply the new stock contribution
         if instance.status == 'COMPLETED':
-             self._process_stock_for_invoice(instance)
+             with recording('purchase', instance.id, kind=StockMovement.IN):
+                 self._process_stock_for_invoice(instance)
 
-        # Emit Socket
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            async_to_sync(sio.emit)('pharmacy_inventory_update', {
-                'invoice_id': str(instance.id),
-                'amount': float(instance.total_amount)
-            })
-        except: pass
+        # Emit Socket (after commit)
+        publish_event('pharmacy_inventory_update', {
+            'invoice_id': str(instance.id),
+            'amount': float(instance.total_amount),
+            **snapshot(instance, PURCHASE_SNAPSHOT_FIELDS),
+        }, room=[role_room('ADMIN'), role_room('PHARMACY')])
 
         return instance
 
@@ -196,50 +207,38 @@ class PurchaseInvoiceSerializer(serializers.ModelSerializer):
                 stock.is_deleted = False
                 stock.medicine_type = item.medicine_type
                 stock.save()
-
-            # --- Notification Cleanup ---
-            try:
-                # If stock is now healthy (above reorder level + buffer), clear low stock alerts
-                if stock.qty_available > stock.reorder_level:
-                    from core.models import Notification
-                    # Use Q for cleaner syntax
-                    Notification.objects.filter(
-                        Q(message__icontains=f"Low stock alert: {stock.name}") &
-                        Q(message__icontains=stock.batch_no)
-                    ).delete()
-            except Exception as e:
-                print(f"Failed to clear notifications: {e}")
+            # Low stock alerts for this batch are cleared by pharmacy.signals once it is restocked
 
     def _reverse_stock_for_invoice(self, invoice):
         """
         Subtracts the quantities of all items in the invoice from PharmacyStock.
         Used before replacing items in a COMPLETED invoice edit.
         """
-        for item in invoice.items.all():
-            tps = item.tablets_per_strip
-            qty_to_subtract = (item.qty + item.free_qty) * tps
-            
-            try:
-                # Use select_for_update to handle concurrency in production
-                stock = PharmacyStock.objects.select_for_update().get(
-                    name=item.product_name,
-                    batch_no=item.batch_no
-                )
-                
-                # Safety check: Prevent negative stock (indicates items already sold)
-                if stock.qty_available < qty_to_subtract:
-                    raise serializers.ValidationError(
-                        f"CRITICAL: Cannot edit invoice. {item.product_name} (Batch: {item.batch_no}) "
-                        f"has already been partially sold. Current stock: {stock.qty_available}, "
-                        f"needed to reverse: {qty_to_subtract}. Edit would cause negative inventory."
-                    )
-                
-                stock.qty_available -= qty_to_subtract
-                stock.save()
-            except PharmacyStock.DoesNotExist:
-                # If stock record was manually deleted or renamed, we skip reversal to avoid crash
-                # but might need to log this in a real prod env.
-                pass
+        items = list(invoice.items.all())
+        stock_ids = dict(
+            ((name, batch_no), pk) for pk, name, batch_no in PharmacyStock.objects.filter(
+                name__in={item.product_name for item in items},
+                batch_no__in={item.batch_no for item in items},
+            ).values_list('id', 'name', 'batch_no')
+        )
+
+        # If stock record was manually deleted or renamed, we skip reversal to avoid crash
+        # but might need to log this in a real prod env.
+        reversals = [
+            (stock_ids[(item.product_name, item.batch_no)], (item.qty + item.free_qty) * item.tablets_per_strip)
+            for item in items if (item.product_name, item.batch_no) in stock_ids
+        ]
+
+        try:
+            # Conditional decrements: a batch that was partly sold cannot go negative
+            take(PharmacyStock, reversals)
+        except InsufficientStock as e:
+            stock = PharmacyStock.objects.get(pk=e.pk)
+            raise serializers.ValidationError(
+                f"CRITICAL: Cannot edit invoice. {stock.name} (Batch: {stock.batch_no}) "
+                f"has already been partially sold. Current stock: {e.available}, "
+                f"needed to reverse: {e.requested}. Edit would cause negative inventory."
+            )
 
 
 class PharmacySaleItemSerializer(serializers.ModelSerializer):
@@ -251,7 +250,7 @@ class PharmacySaleItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = PharmacySaleItem
         fields = '__all__'
-        read_only_fields = ['item_id', 'created_at', 'updated_at', 'amount', 'sale']
+        read_only_fields = ['item_id', 'created_at', 'updated_at', 'amount', 'sale', 'qty_returned']
 
 
 class PharmacySaleSerializer(serializers.ModelSerializer):
@@ -271,19 +270,24 @@ class PharmacySaleSerializer(serializers.ModelSerializer):
 
         sale = PharmacySale.objects.create(total_amount=0, **validated_data)
 
+        if any(item['med_stock'].is_deleted for item in items_data):
+            raise serializers.ValidationError("Selected medicine stock is deleted.")
+
+        # reduce stock: one conditional UPDATE per batch, all lines or none
+        try:
+            with recording('sale', sale.id, kind=StockMovement.OUT):
+                take(PharmacyStock, [(item['med_stock'].pk, item['qty']) for item in items_data])
+        except InsufficientStock as e:
+            med_stock = next(item['med_stock'] for item in items_data if item['med_stock'].pk == e.pk)
+            raise serializers.ValidationError(
+                f"Not enough stock for {med_stock.name} ({med_stock.batch_no}). Available: {e.available}"
+            )
+
         total = 0
         for item in items_data:
             med_stock = item['med_stock']
             qty = item['qty']
 
-            if med_stock.is_deleted:
-                raise serializers.ValidationError("Selected medicine stock is deleted.")
-
-            if med_stock.qty_available < qty:
-                raise serializers.ValidationError(
-                    f"Not enough stock for {med_stock.name} ({med_stock.batch_no}). Available: {med_stock.qty_available}"
-                )
-
             unit_price = item.get('unit_price')
             if not unit_price:
                 # Calculate per-tablet price from strip selling price
@@ -293,10 +297,6 @@ class PharmacySaleSerializer(serializers.ModelSerializer):
             gst_percent = item.get('gst_percent', 0)
             total += amount
 
-            # reduce stock
-            med_stock.qty_available -= qty
-            med_stock.save()
-
             PharmacySaleItem.objects.create(
                 sale=sale,
                 med_stock=med_stock,
@@ -350,18 +350,18 @@ class PharmacySaleSerializer(serializers.ModelSerializer):
                  target_visit.status = 'OPEN' 
                  target_visit.save()
 
-        # Notify via Socket.IO
-        try:
-            from asgiref.sync import async_to_sync
-            from revive_cms.sio import sio
-            print(f"Emitting socket event for sale {sale.id}")
-            async_to_sync(sio.emit)('pharmacy_sale_update', {
-                'sale_id': str(sale.id),
-                'visit_id': str(sale.visit.id) if sale.visit else None,
-                'patient_id': str(sale.patient.id) if sale.patient else None
-            })
-        except Exception as e:
-            print(f"Socket emit error: {e}")
+        # Notify via Socket.IO (after commit): billing desk roles and the record's viewers
+        rooms = [role_room('ADMIN'), role_room('RECEPTION'), role_room('PHARMACY')]
+        if sale.visit_id:
+            rooms.append(visit_room(sale.visit_id))
+        if sale.patient_id:
+            rooms.append(patient_room(sale.patient_id))
+        publish_event('pharmacy_sale_update', {
+            'sale_id': str(sale.id),
+            'visit_id': str(sale.visit.id) if sale.visit else None,
+            'patient_id': str(sale.patient.id) if sale.patient else None,
+            **snapshot(sale, SALE_SNAPSHOT_FIELDS),
+        }, room=rooms)
 
         return sale
 
@@ -402,24 +402,45 @@ class PharmacyReturnSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
-        total_refund = 0
-        
+        lines = []
         for item in items_payload:
-            sale_item_id = item.get('sale_item_id')
             return_qty = int(item.get('qty', 0))
-
-            if return_qty <= 0:
-                continue
-
-            sale_item = PharmacySaleItem.objects.select_for_update().get(id=sale_item_id)
-            
-            # Validation: Check if already returned
-            already_returned = sum(item.qty_returned for item in sale_item.returned_items.all())
-            if (already_returned + return_qty) > sale_item.qty:
-                 raise serializers.ValidationError(
+            if return_qty > 0:
+                lines.append((str(item.get('sale_item_id')), return_qty))
+
+        # Every sale item in the payload, in one query
+        sale_items = {
+            str(pk): sale_item
+            for pk, sale_item in PharmacySaleItem.objects.select_related('med_stock').in_bulk(
+                list({sale_item_id for sale_item_id, _ in lines})
+            ).items()
+        }
+        returning = {}
+        for sale_item_id, return_qty in lines:
+            if sale_item_id not in sale_items:
+                raise serializers.ValidationError(f"Sale item {sale_item_id} not found.")
+            returning[sale_item_id] = returning.get(sale_item_id, 0) + return_qty
+
+        # Validation: Check if already returned. The counter only moves if it stays within
+        # the quantity sold, so two returns of the same item cannot both get through.
+        for sale_item_id, return_qty in returning.items():
+            sale_item = sale_items[sale_item_id]
+            counted = PharmacySaleItem.objects.filter(
+                pk=sale_item.pk, qty_returned__lte=F('qty') - return_qty
+            ).update(qty_returned=F('qty_returned') + return_qty, updated_at=timezone.now())
+            if not counted:
+                already_returned = PharmacySaleItem.objects.values_list('qty_returned', flat=True).get(pk=sale_item.pk)
+                raise serializers.ValidationError(
                     f"Cannot return {return_qty} for {sale_item.med_stock.name}. Sold: {sale_item.qty}, Already Returned: {already_returned}"
                 )
 
+        total_refund = 0
+        restock = []
+        return_items = []
+
+        for sale_item_id, return_qty in lines:
+            sale_item = sale_items[sale_item_id]
+
             # Calculation using ORIGINAL sale price and gst
             # !CRITICAL: DO NOT CHANGE. Must refund what was paid (Original Unit Price).
             refund_amt = sale_item.unit_price * return_qty
@@ -429,19 +450,23 @@ class PharmacyReturnSerializer(serializers.ModelSerializer):
 
             # 2. Update Inventory (Restock to SAME Batch)
             # !CRITICAL: DO NOT CHANGE. Must restore to the EXACT batch sold.
-            med_stock = sale_item.med_stock
-            med_stock.qty_available += return_qty
-            med_stock.save()
+            restock.append((sale_item.med_stock_id, return_qty))
 
             # 3. Create Return Item Entry
-            PharmacyReturnItem.objects.create(
+            return_items.append(PharmacyReturnItem(
                 return_record=ret_record,
                 sale_item=sale_item,
-                med_stock=med_stock,
+                med_stock_id=sale_item.med_stock_id,
                 qty_returned=return_qty,
                 refund_amount=refund_amt,
                 gst_reversed=gst_rev
-            )
+            ))
+
+        PharmacyReturnItem.objects.bulk_create(return_items)
+
+        # Restock every returned batch in one UPDATE
+        with recording('return', ret_record.id, kind=StockMovement.RETURN):
+            put(PharmacyStock, restock)
 
         ret_record.total_refund_amount = total_refund
         ret_record.save()
@@ -462,3 +487,17 @@ class PharmacyReturnSerializer(serializers.ModelSerializer):
             print(f"Failed to sync refund to billing: {e}")
 
         return ret_record
+
+
+class PharmacyImportJobSerializer(serializers.ModelSerializer):
+    invoice_no = serializers.CharField(source='invoice.supplier_invoice_no', read_only=True, default=None)
+    progress = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = PharmacyImportJob
+        fields = [
+            'id', 'status', 'supplier_name', 'invoice', 'invoice_no', 'progress',
+            'rows_processed', 'rows_imported', 'rows_failed', 'message',
+            'started_at', 'finished_at', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
@@ -1,33 +1,106 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from .models import PharmacyStock
-from core.models import Notification
-from django.contrib.auth import get_user_model
+from core.alerts import LOW_STOCK, raise_alert, clear_alerts
+from core.stock import stock_moved
+from .ledger import record
+from .search import invalidate_medicine_index
+from .barcodes import invalidate_barcodes
 
-User = get_user_model()
 
-@receiver(post_save, sender=PharmacyStock)
-def check_low_stock(sender, instance, **kwargs):
-    if instance.qty_available < instance.reorder_level:
-        # Check if a recent notification already exists to avoid spam
-        # This is a basic implementation. Ideally we'd have a 'last_notified' field.
-        # check if active notification exists for this stock
-        exists = Notification.objects.filter(
-            message__contains=f"Low stock alert: {instance.name}",
-            is_read=False
-        ).exists()
-
-        if not exists:
+def sync_low_stock_alerts(stocks, created=False):
+    """
+    Raise or clear low-stock alerts for batches whose quantity crossed the reorder level.
+    Called by the post_save handler and directly by bulk writes, which skip signals.
+    """
+    recovered = []
+    for stock in stocks:
+        crossing = stock.stock_level_crossing()
+        stock.remember_stock_level()
+
+        if crossing == PharmacyStock.STOCK_WENT_LOW:
             # Notify all Pharmacy and Admin users
-            # For simplicity, let's notify the first Admin or all admins
-            # In a real app, we might have a group or specific role query
-            
-            # Find users with role 'PHARMACY' or 'ADMIN'
-            recipients = User.objects.filter(role__in=['PHARMACY', 'ADMIN'], is_active=True)
-            
-            for user in recipients:
-                Notification.objects.create(
-                    recipient=user,
-                    message=f"Low stock alert: {instance.name} (Batch: {instance.batch_no}) has only {instance.qty_available} units left.",
-                    type='WARNING'
-                )
+            raise_alert(
+                LOW_STOCK, stock.id,
+                f"Low stock alert: {stock.name} (Batch: {stock.batch_no}) has only {stock.qty_available} units left.",
+                roles=['PHARMACY', 'ADMIN'],
+            )
+        elif crossing == PharmacyStock.STOCK_RECOVERED and not created:
+            recovered.append(stock.id)
+
+    # Restocked above reorder level: the alert no longer applies
+    clear_alerts(LOW_STOCK, recovered)
+
+
+# The ledger records what a save changes against the stored row, read (and locked, inside
+# a transaction) just before the write: the level an instance was loaded with may be stale.
+
+@receiver(pre_save, sender=PharmacyStock)
+def read_stored_stock(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._stored_qty = None
+    if raw or instance._state.adding or 'qty_available' in instance.get_deferred_fields():
+        return  # new row, or a save that does not write the quantity
+    if update_fields is not None and 'qty_available' not in update_fields:
+        return
+    rows = PharmacyStock.objects.filter(pk=instance.pk)
+    if transaction.get_connection().in_atomic_block:
+        rows = rows.select_for_update()
+    instance._stored_qty = rows.values_list('qty_available', flat=True).first()
+
+
+@receiver(post_save, sender=PharmacyStock)
+def record_stock_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        previous = 0
+    elif getattr(instance, '_stored_qty', None) is not None:
+        previous = instance._stored_qty
+    else:
+        return  # this save did not write the quantity
+    instance._stored_qty = None
+    record([(instance, instance.qty_available - previous)])
+
+
+@receiver(stock_moved, sender=PharmacyStock)
+def record_stock_move(sender, instances, deltas=None, **kwargs):
+    by_id = {str(pk): delta for pk, delta in (deltas or {}).items()}
+    record([(stock, by_id.get(str(stock.pk), 0)) for stock in instances])
+
+
+@receiver(pre_delete, sender=PharmacyStock)
+def record_stock_delete(sender, instance, **kwargs):
+    # The stock link is nulled by the delete; the id stays on as the reference
+    record([(instance, -instance.qty_available)], source='delete', reference=instance.pk, keep_zero=True)
+
+
+@receiver(post_save, sender=PharmacyStock)
+def check_low_stock(sender, instance, created, **kwargs):
+    # Only saves that cross the reorder threshold touch the notification table;
+    # ordinary sales/FIFO steps above or below it cost nothing here.
+    sync_low_stock_alerts([instance], created=created)
+
+
+@receiver(stock_moved, sender=PharmacyStock)
+def check_low_stock_after_move(sender, instances, **kwargs):
+    sync_low_stock_alerts(instances)
+
+
+@receiver(post_save, sender=PharmacyStock)
+@receiver(post_delete, sender=PharmacyStock)
+@receiver(stock_moved, sender=PharmacyStock)
+def refresh_medicine_index(sender, **kwargs):
+    invalidate_medicine_index()
+
+
+@receiver(post_save, sender=PharmacyStock)
+@receiver(post_delete, sender=PharmacyStock)
+def refresh_barcodes_after_edit(sender, **kwargs):
+    # The batch's barcode itself may have changed: forget every barcode
+    invalidate_barcodes()
+
+
+@receiver(stock_moved, sender=PharmacyStock)
+def refresh_barcodes_after_move(sender, instances, **kwargs):
+    invalidate_barcodes(stock.barcode for stock in instances)
@@ -0,0 +1,85 @@
+"""
+Compact stock catalog for POS and casualty terminals (PharmacyStockViewSet.snapshot).
+
+A terminal downloads the full catalog once, as column names plus one array per batch, and
+then asks for `?since=<version>`: only the batches written since then, plus the ids of
+batches that left its scope (deleted, soft-deleted, or moved to another category).
+
+Versions are `updated_at` instants in microseconds; every stock write, including the
+conditional UPDATEs in core.stock and bulk imports, sets `updated_at`. A delta re-sends
+the last SNAPSHOT_OVERLAP_SECONDS before `since` as well, so a row written by a
+transaction that committed late is not missed; clients upsert by id, so repeats are
+harmless.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+SNAPSHOT_OVERLAP_SECONDS = getattr(settings, 'PHARMACY_SNAPSHOT_OVERLAP_SECONDS', 120)
+
+# What a POS needs to list, price and sell a batch
+SNAPSHOT_COLUMNS = (
+    'id', 'name', 'barcode', 'batch_no', 'expiry_date', 'qty_available', 'mrp',
+    'selling_price', 'tablets_per_strip', 'gst_percent', 'hsn', 'medicine_type', 'category',
+)
+CATEGORY_COLUMN = SNAPSHOT_COLUMNS.index('category')
+
+
+def to_version(moment):
+    return int(moment.timestamp() * 1_000_000)
+
+
+def from_version(version):
+    return datetime.fromtimestamp(int(version) / 1_000_000)
+
+
+def catalog_etag():
+    """Changes with any stock write (latest updated_at) or hard delete (row count)."""
+    from .models import PharmacyStock
+    state = PharmacyStock.objects.aggregate(latest=Max('updated_at'), rows=Count('id'))
+    latest = to_version(state['latest']) if state['latest'] else 0
+    return f'"stock-{latest}-{state["rows"]}"'
+
+
+def build_snapshot(category=None, since=None):
+    """
+    {'version', 'full', 'category', 'columns', 'rows', 'removed'}: every live batch of
+    `category` (all categories when None), or with `since` only what changed after it.
+    """
+    from .models import PharmacyStock, StockMovement
+
+    version = to_version(timezone.now())
+    rows, removed = [], []
+
+    if since is None:
+        stocks = PharmacyStock.objects.filter(is_deleted=False)
+        if category:
+            stocks = stocks.filter(category=category)
+        rows = [list(row) for row in stocks.order_by('name', 'expiry_date').values_list(*SNAPSHOT_COLUMNS)]
+    else:
+        changed_after = from_version(since) - timedelta(seconds=SNAPSHOT_OVERLAP_SECONDS)
+        # Category is checked here rather than in SQL, so batches moved out of it are reported
+        changed = PharmacyStock.objects.filter(updated_at__gte=changed_after).values_list(
+            'is_deleted', *SNAPSHOT_COLUMNS
+        )
+        for is_deleted, *row in changed:
+            if is_deleted or (category and row[CATEGORY_COLUMN] != category):
+                removed.append(row[0])
+            else:
+                rows.append(row)
+        # Hard deletes leave no row behind; the ledger keeps their ids
+        removed.extend(
+            StockMovement.objects.filter(source='delete', created_at__gte=changed_after)
+            .values_list('reference_id', flat=True)
+        )
+
+    return {
+        'version': version,
+        'full': since is None,
+        'category': category,
+        'columns': SNAPSHOT_COLUMNS,
+        'rows': rows,
+        'removed': removed,
+    }
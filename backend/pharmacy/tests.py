@@ -1,3 +1,122 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from core.stock import InsufficientStock
+from pharmacy.dispensing import dispense_medicines, plan_medicines
+from pharmacy.models import PharmacyStock, PurchaseInvoice, PurchaseItem, Supplier
+
+
+def make_stock(name, batch_no, qty, expiry_date):
+    return PharmacyStock.objects.create(
+        name=name, batch_no=batch_no, expiry_date=expiry_date, mrp=10, selling_price=10, qty_available=qty,
+    )
+
+
+def stock_qty(stock):
+    return PharmacyStock.objects.values_list('qty_available', flat=True).get(pk=stock.pk)
+
+
+class DispenseMedicinesTests(TestCase):
+    def setUp(self):
+        self.far = make_stock('Paracetamol', 'P-FAR', 5, '2031-01-01')
+        self.near = make_stock('Paracetamol', 'P-NEAR', 3, '2030-01-01')
+        self.empty = make_stock('Paracetamol', 'P-EMPTY', 0, '2029-01-01')
+        self.amox = make_stock('Amoxicillin', 'A1', 2, '2030-06-01')
+
+    def test_plan_splits_nearest_expiry_first_without_writing(self):
+        [(taken, shortfall)] = plan_medicines([('PARACETAMOL ', 4)])
+        self.assertEqual([(batch.batch_no, n) for batch, n in taken], [('P-NEAR', 3), ('P-FAR', 1)])
+        self.assertEqual(shortfall, 0)
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (3, 5))
+
+    def test_plan_reports_shortfall_and_unknown_names(self):
+        allocation = plan_medicines([('paracetamol', 6), ('paracetamol', 4), ('Ghost', 1)])
+        self.assertEqual(
+            [([(batch.batch_no, n) for batch, n in taken], shortfall) for taken, shortfall in allocation],
+            [([('P-NEAR', 3), ('P-FAR', 3)], 0), ([('P-FAR', 2)], 2), ([], 1)],
+        )
+
+    def test_dispense_takes_whole_prescription(self):
+        dispense_medicines([('paracetamol', 4), ('amoxicillin', 2)])
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far), stock_qty(self.amox)), (0, 4, 0))
+
+    def test_dispense_shortfall_raises_and_moves_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            dispense_medicines([('amoxicillin', 1), ('Paracetamol', 9)])
+        self.assertEqual((raised.exception.pk, raised.exception.requested, raised.exception.available),
+                         ('paracetamol', 9, 8))
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far), stock_qty(self.amox)), (3, 5, 2))
+
+    def test_dispense_with_allowed_shortfall_takes_what_there_is(self):
+        [(taken, shortfall)] = dispense_medicines([('paracetamol', 10)], allow_shortfall=True)
+        self.assertEqual(sum(n for _, n in taken), 8)
+        self.assertEqual(shortfall, 2)
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (0, 0))
+
+    def test_fixed_batch_changes_come_before_fefo_lines(self):
+        dispense_medicines([('paracetamol', 2)], changes={self.near.pk: -3})
+        self.assertEqual((stock_qty(self.near), stock_qty(self.far)), (0, 3))
+
+
+class PurchaseDistributionTests(TestCase):
+    """Expected values are those of the per-line save() implementation this replaced."""
+
+    def make_invoice(self, cash_discount, courier_charge, lines):
+        invoice = PurchaseInvoice.objects.create(
+            supplier=Supplier.objects.create(supplier_name='Medline'), supplier_invoice_no='INV-1',
+            invoice_date='2026-01-01', purchase_type='CASH', total_amount=0,
+            cash_discount=cash_discount, courier_charge=courier_charge,
+        )
+        for index, (ptr, qty, discount_percent, gst_percent) in enumerate(lines):
+            PurchaseItem.objects.create(
+                purchase=invoice, product_name=f'Medicine {index}', batch_no=f'B{index}', expiry_date='2030-01-01',
+                qty=qty, purchase_rate=ptr, mrp=20, ptr=ptr, discount_percent=discount_percent, gst_percent=gst_percent,
+            )
+        return invoice
+
+    def distribution(self, invoice):
+        return [
+            tuple(str(value) for value in row)
+            for row in invoice.items.order_by('product_name').values_list(
+                'taxable_amount', 'cash_discount_amount', 'gst_amount', 'total_amount',
+            )
+        ]
+
+    def test_last_line_takes_the_cash_discount_remainder(self):
+        invoice = self.make_invoice('10.00', '5.00', [('33.33', 3, '0', '12'), ('12.50', 7, '5', '5'), ('9.99', 1, '10', '18')])
+
+        self.assertEqual(invoice.calculate_distribution(), Decimal('203.95'))
+        self.assertEqual(self.distribution(invoice), [
+            ('94.79', '5.20', '11.37', '106.16'),
+            ('78.80', '4.33', '3.94', '82.74'),
+            ('8.52', '0.47', '1.53', '10.05'),
+        ])
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal('203.95'))
+
+    def test_zero_taxable_pool_gets_no_cash_discount(self):
+        invoice = self.make_invoice('5.00', '2.50', [('0', 2, '0', '12'), ('10.00', 1, '100', '5')])
+
+        self.assertEqual(invoice.calculate_distribution(), Decimal('2.50'))
+        self.assertEqual(self.distribution(invoice), [('0.00', '0.00', '0.00', '0.00')] * 2)
+
+    def test_invoice_without_lines_totals_zero(self):
+        invoice = self.make_invoice('5.00', '2.50', [])
+
+        self.assertEqual(invoice.calculate_distribution(), 0)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, 0)
+
+    def test_only_changed_lines_are_written_and_stamped(self):
+        invoice = self.make_invoice('0', '0', [('10.00', 1, '0', '0'), ('20.00', 1, '0', '0')])
+        invoice.calculate_distribution()
+        before = dict(invoice.items.values_list('product_name', 'updated_at'))
+
+        PurchaseItem.objects.filter(product_name='Medicine 1').update(qty=2, updated_at=before['Medicine 1'])
+        invoice.calculate_distribution()
+
+        after = dict(invoice.items.values_list('product_name', 'updated_at'))
+        self.assertEqual(after['Medicine 0'], before['Medicine 0'])
+        self.assertGreater(after['Medicine 1'], before['Medicine 1'])
+        self.assertEqual(self.distribution(invoice)[1], ('40.00', '0.00', '0.00', '40.00'))
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SupplierViewSet, PharmacyStockViewSet, PurchaseInvoiceViewSet, PharmacySaleViewSet, PharmacyBulkUploadView, PharmacyQueueViewSet, PharmacyReturnViewSet
+from .views import SupplierViewSet, PharmacyStockViewSet, PurchaseInvoiceViewSet, PharmacySaleViewSet, PharmacyBulkUploadView, PharmacyQueueViewSet, PharmacyReturnViewSet, PharmacyImportJobViewSet
 
 router = DefaultRouter()
 router.register(r'suppliers', SupplierViewSet, basename='suppliers')
@@ -9,6 +9,7 @@ router.register(r'purchases', PurchaseInvoiceViewSet, basename='purchases')
 router.register(r'sales', PharmacySaleViewSet, basename='sales')
 router.register(r'queue', PharmacyQueueViewSet, basename='queue')
 router.register(r'returns', PharmacyReturnViewSet, basename='returns')
+router.register(r'import-jobs', PharmacyImportJobViewSet, basename='import-jobs')
 
 urlpatterns = [
     path('bulk-upload/', PharmacyBulkUploadView.as_view(), name='pharmacy-bulk-upload'),
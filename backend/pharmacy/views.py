@@ -1,7 +1,6 @@
 import csv
-import io
-from datetime import datetime
 from django.db import transaction, models
+from django.http import HttpResponse
 from django.db.models import Q
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
@@ -9,12 +8,12 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser
 
-from .models import Supplier, PharmacyStock, PurchaseInvoice, PurchaseItem, PharmacySale
+from .models import Supplier, PharmacyStock, PurchaseInvoice, PurchaseItem, PharmacySale, PharmacyImportJob
 from patients.models import Visit
 from patients.serializers import VisitSerializer
 from .serializers import (
     SupplierSerializer, PharmacyStockSerializer,
-    PurchaseInvoiceSerializer, PharmacySaleSerializer
+    PurchaseInvoiceSerializer, PharmacySaleSerializer, PharmacyImportJobSerializer
 )
 
 
@@ -25,256 +24,74 @@ class IsPharmacyOrAdmin(permissions.BasePermission):
         return request.user.is_superuser or getattr(request.user, "role", None) in ["PHARMACY", "ADMIN", "DOCTOR", "RECEPTION"]
 
 
-from rest_framework.pagination import PageNumberPagination
+class CanReadStockSnapshot(permissions.BasePermission):
+    """Pharmacy staff, plus casualty terminals, which sell from the same stock."""
+    def has_permission(self, request, view):
+        if IsPharmacyOrAdmin().has_permission(request, view):
+            return True
+        return bool(request.user and request.user.is_authenticated and getattr(request.user, "role", None) == "CASUALTY")
+
+
+from revive_cms.pagination import CursorOrPageNumberPagination
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(CursorOrPageNumberPagination):
     page_size = 50
     page_size_query_param = 'page_size'
-    max_page_size = 10000
+    max_page_size = 200
 
 
 class PharmacyBulkUploadView(APIView):
+    """
+    Accepts a distributor CSV and queues it as a PharmacyImportJob (202). The file is
+    processed in the background by pharmacy.imports; poll `import-jobs/<id>/` for progress.
+    """
     permission_classes = [IsPharmacyOrAdmin]
     parser_classes = [MultiPartParser]
 
-    @transaction.atomic
     def post(self, request, format=None):
+        from .imports import start_import
+
         file_obj = request.FILES.get('file')
         supplier_name = request.data.get('supplier_name')
 
         if not file_obj:
             return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
-        if not supplier_name:
+        if not supplier_name or not supplier_name.strip():
             return Response({"error": "Supplier name is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            supplier, _ = Supplier.objects.get_or_create(supplier_name=supplier_name.strip())
-            
-            decoded_file = file_obj.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.reader(io_string)
-
-            invoice = None
-            headers = []
-            items_created = 0
-
-            for row in reader:
-                if not row: continue
-                line_type = row[0].strip().upper()
-
-                if line_type == 'H':
-                    # Parse H line
-                    # H,MediWMS,1.0,InvNo,Date,,,Type,CreditDays,...
-                    inv_no = row[3] if len(row) > 3 else "Unknown"
-                    inv_date_str = row[4] if len(row) > 4 else ""
-                    p_type = row[7].upper() if len(row) > 7 else "CASH"
-                    c_days = 0
-                    try: 
-                        c_days = int(row[8]) if len(row) > 8 and row[8] else 0
-                    except: pass
-
-                    # Convert date dd/mm/yyyy to yyyy-mm-dd
-                    try:
-                        inv_date = datetime.strptime(inv_date_str, '%d/%m/%Y').date()
-                    except:
-                        inv_date = datetime.now().date()
-
-                    invoice = PurchaseInvoice.objects.create(
-                        supplier=supplier,
-                        supplier_invoice_no=inv_no,
-                        invoice_date=inv_date,
-                        credit_days=c_days,
-                        purchase_type='CREDIT' if 'CREDIT' in p_type else 'CASH',
-                        total_amount=0, # Will update later
-                        created_by=request.user
-                    )
-
-                elif line_type == 'TH':
-                    headers = [h.strip() for h in row]
-
-                elif line_type == 'T':
-                    if not invoice or not headers: continue
-                    
-                    # Process rows
-                    # Normalize keys (strip whitespace, etc)
-                    # Create a dictionary from headers and row, then normalize keys
-                    raw_data = dict(zip(headers, row))
-                    data = {k.strip(): v for k, v in raw_data.items() if k}
-                    
-                    # Helper to find key case-insensitively, respecting priority order
-                    def get_val(keys_list, default=''):
-                        data_map = {k.lower(): v for k, v in data.items()}
-                        for k in keys_list:
-                            if k.lower() in data_map:
-                                return data_map[k.lower()]
-                        return default
-
-                    p_name = get_val(['Product Name', 'Item Name', 'Particulars'], 'Unknown')
-                    batch = get_val(['Batch', 'Batch No'], 'N/A')
-                    exp_str = get_val(['Expiry', 'Exp', 'Exp Date'], '')
-                    
-                    qty_val = get_val(['Qty', 'Quantity'], 0)
-                    try: qty = float(qty_val)
-                    except: qty = 0
-                    
-                    free_val = get_val(['Free', 'Free Qty'], 0)
-                    try: free = float(free_val)
-                    except: free = 0
-                    
-                    rate_val = get_val(['Rate', 'Price'], 0)
-                    try: rate = float(rate_val)
-                    except: rate = 0
-                    
-                    ptr_val = get_val(['PTR', 'Purchase Rate'], 0)
-                    try: ptr = float(ptr_val)
-                    except: ptr = 0
-                    
-                    mrp_val = get_val(['MRP'], 0)
-                    try: mrp = float(mrp_val)
-                    except: mrp = 0
-
-                    if qty and qty > 0:
-                        # Logic removed: CSV contains UNIT rates, not total amounts.
-                        # rate = round(rate / qty, 2)
-                        # mrp = round(mrp / qty, 2)
-                        # if ptr > 0: ptr = round(ptr / qty, 2)
-                        pass
-
-                    
-                    hsn = get_val(['HSN', 'HSN Code'], '')
-                    manufacturer = get_val(['Manufacturer Name', 'Manufacturer.Name', 'Mfr Name', 'Mfr'], '')
-                    barcode = get_val(['Product Code', 'Barcode', 'Code'], '')
-                    
-                    # New: Tablets per strip
-                    strip_size_val = get_val(['ItemPerPack', 'Packing', 'Strip Size', 'Tablets per Strip', 'TPS', 'Unit'], 1)
-                    try:
-                        # Extract number from packing like "10S" or "10 Tablets"
-                        import re
-                        match = re.search(r'(\d+)', str(strip_size_val))
-                        tps = int(match.group(1)) if match else 1
-                    except:
-                        tps = 1
-
-                    # Parse Expiry (mm/yyyy)
-                    try:
-                        # Assuming end of month or 1st of month
-                        exp_date = datetime.strptime(exp_str, '%m/%Y').date()
-                    except:
-                        exp_date = None
-
-                    for key in ['GST', 'GST%', 'Tax', 'Tax %', 'IGST', 'TaxPerc']:
-                        if key in data and data[key]:
-                            try:
-                                val_str = str(data[key]).replace('%', '').strip()
-                                gst_val = float(val_str)
-                                break
-                            except: pass
-
-                    for key in ['DiscountPerc', 'Discount %', 'Disc %', 'Discount', 'Disc']:
-                        if key in data and data[key]:
-                            try:
-                                val_str = str(data[key]).replace('%', '').strip()
-                                disc_val = float(val_str)
-                                break
-                            except: pass
-                    
-                    # Create PurchaseItem (Added gst_percent & discount_percent)
-                    PurchaseItem.objects.create(
-                        purchase=invoice,
-                        product_name=p_name,
-                        barcode=barcode,
-                        batch_no=batch,
-                        expiry_date=exp_date,
-                        qty=qty,
-                        free_qty=free,
-                        purchase_rate=rate,
-                        mrp=mrp,
-                        ptr=ptr,
-                        manufacturer=manufacturer,
-                        hsn=hsn,
-                        tablets_per_strip=tps,
-                        gst_percent=gst_val,
-                        discount_percent=disc_val
-                    )
-
-                    # Stock update moved to outside loop to use calculated distribution logic
-                    pass
-
-                    items_created += 1
-                
-                elif line_type == 'F':
-                    pass
-
-            if invoice:
-                # 1. Calculate Distribution (GST, Discount) using the robust logic
-                invoice.calculate_distribution()
-                invoice.refresh_from_db()
-                
-                # 2. Update Stock using Calculated Values (Taxable Amount etc)
-                # This ensures Bulk Upload yields same Stock Rate as Manual Entry
-                for item in invoice.items.all():
-                    qty_strips = item.qty
-                    free_strips = item.free_qty
-                    tps = item.tablets_per_strip
-                    qty_in = (qty_strips + free_strips) * tps
-                    
-                    # Effective Purchase Rate calculation (Net Cost per Strip)
-                    if (qty_strips + free_strips) > 0:
-                        effective_purch_rate = float(item.taxable_amount) / float(qty_strips + free_strips)
-                    else:
-                        effective_purch_rate = float(item.purchase_rate)
-
-                    stock, created = PharmacyStock.objects.get_or_create(
-                        name=item.product_name,
-                        batch_no=item.batch_no,
-                        defaults={
-                            'expiry_date': item.expiry_date,
-                            'supplier': invoice.supplier,
-                            'barcode': item.barcode or '',
-                            'mrp': item.mrp,
-                            'selling_price': item.mrp,
-                            'purchase_rate': round(effective_purch_rate, 2),
-                            'ptr': item.ptr,
-                            'qty_available': qty_in,
-                            'tablets_per_strip': tps,
-                            'hsn': item.hsn,
-                            'gst_percent': item.gst_percent,
-                            'manufacturer': item.manufacturer,
-                            'is_deleted': False
-                        }
-                    )
-                    
-                    if not created:
-                        stock.qty_available += qty_in
-                        stock.mrp = item.mrp
-                        stock.selling_price = item.mrp
-                        stock.purchase_rate = round(effective_purch_rate, 2)
-                        stock.ptr = item.ptr
-                        stock.tablets_per_strip = tps
-                        stock.gst_percent = item.gst_percent
-                        if item.manufacturer: stock.manufacturer = item.manufacturer
-                        if item.hsn: stock.hsn = item.hsn
-                        if item.barcode: stock.barcode = item.barcode
-                        stock.save()
-
-                    # Notification Cleanup
-                    try:
-                        if stock.qty_available > stock.reorder_level:
-                            from core.models import Notification
-                            Notification.objects.filter(
-                                Q(message__icontains=f"Low stock alert: {stock.name}") &
-                                Q(message__icontains=stock.batch_no)
-                            ).delete()
-                    except: pass
-
-            return Response({
-                "message": "Bulk upload successful",
-                "items_processed": items_created,
-                "invoice_no": invoice.supplier_invoice_no if invoice else None
-            }, status=status.HTTP_201_CREATED)
-
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        job = PharmacyImportJob.objects.create(
+            file=file_obj,
+            supplier_name=supplier_name.strip(),
+            bytes_total=file_obj.size or 0,
+            created_by=request.user,
+        )
+        start_import(job)
+        job.refresh_from_db()  # already finished when imports run inline
+
+        return Response(PharmacyImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class PharmacyImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status and progress of bulk uploads; `errors/` downloads the per-row report as CSV."""
+    serializer_class = PharmacyImportJobSerializer
+    permission_classes = [IsPharmacyOrAdmin]
+    pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        return PharmacyImportJob.objects.select_related('invoice').defer('errors').order_by('-created_at')
+
+    @action(detail=True, methods=['get'], url_path='errors')
+    def error_report(self, request, pk=None):
+        job = self.get_object()
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="import_{job.id}_errors.csv"'
+
+        writer = csv.writer(response)
+        writer.writerow(['line', 'product', 'batch', 'errors'])
+        for row in job.errors:
+            writer.writerow([row['line'], row['product'], row['batch'], '; '.join(row['errors'])])
+        return response
 
 
 class SupplierViewSet(viewsets.ModelViewSet):
@@ -294,6 +111,7 @@ class PharmacyStockViewSet(viewsets.ModelViewSet):
     ordering_fields = ['expiry_date', 'qty_available', 'updated_at', 'supplier__supplier_name']
     ordering = ['expiry_date']
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('expiry_date', 'id')
 
     def get_queryset(self):
         qs = PharmacyStock.objects.filter(is_deleted=False)
@@ -338,12 +156,8 @@ class PharmacyStockViewSet(viewsets.ModelViewSet):
         if qty <= 0:
             return Response({"qty": ["Quantity must be greater than 0."]}, status=status.HTTP_400_BAD_REQUEST)
 
-        stock = (
-            self.get_queryset()
-            .filter(barcode=barcode, qty_available__gte=qty)
-            .order_by('expiry_date')
-            .first()
-        )
+        from .barcodes import live_batches, resolve
+        stock = resolve(live_batches([barcode])[barcode], qty, **self._scan_filters())
 
         if not stock:
             return Response(
@@ -351,41 +165,87 @@ class PharmacyStockViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        return Response(self.get_serializer(stock).data, status=status.HTTP_200_OK)
+        return Response(stock, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=['get'], url_path='doctor-search')
-    def doctor_search(self, request):
+    @action(detail=False, methods=['post'], url_path='scan-basket')
+    def scan_basket(self, request):
         """
-        Aggregates stock by medicine name for Doctor's search.
-        Returns: [ { "id": "Name", "name": "Name", "qty_available": TotalQty } ]
+        Resolves a whole basket of scans in one request (FIFO nearest expiry per code).
+        Input: { "items": [ { "barcode": "xxxx", "qty": 1 }, ... ] } (repeated codes add up)
+        Output: [ { "barcode": "xxxx", "qty": 2, "stock": {...} or null, "detail": ... }, ... ]
         """
-        query = request.query_params.get('search', '').strip()
-        if len(query) < 2:
-            return Response([])
-
-        from django.db.models import Sum
-        qs = (
-            PharmacyStock.objects
-            .filter(is_deleted=False, name__icontains=query)
-            .values('name')
-            .annotate(total_qty=Sum('qty_available'))
-            .order_by('name')
-        )
-
+        from .barcodes import live_batches, resolve
+        items = request.data.get("items")
+        if not isinstance(items, list) or not items:
+            return Response({"items": ["A non-empty list is required."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        wanted = {}
+        for item in items:
+            if not isinstance(item, dict):
+                return Response(
+                    {"items": ["Every item must be an object with a barcode and a qty."]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            barcode = str(item.get("barcode") or "").strip()
+            try:
+                qty = int(item.get("qty") or 1)
+            except (TypeError, ValueError):
+                qty = 0
+            if not barcode or qty <= 0:
+                return Response(
+                    {"items": ["Every item needs a barcode and a quantity greater than 0."]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            wanted[barcode] = wanted.get(barcode, 0) + qty
+
+        batches = live_batches(wanted)
+        scan_q = self._scan_filters()
         results = []
-        for item in qs:
-            # Fetch latest stock details for pricing
-            latest = PharmacyStock.objects.filter(name=item['name'], is_deleted=False).order_by('-expiry_date').first()
+        for barcode, qty in wanted.items():
+            stock = resolve(batches[barcode], qty, **scan_q)
             results.append({
-                # Use name as ID to unique key it in frontend lists
-                'id': item['name'],
-                'name': item['name'],
-                'qty_available': item['total_qty'] or 0,
-                'mrp': latest.mrp if latest else 0,
-                'tablets_per_strip': latest.tablets_per_strip if latest else 1
+                "barcode": barcode,
+                "qty": qty,
+                "stock": stock,
+                "detail": None if stock else "No stock found for this barcode (or insufficient quantity).",
             })
-        
-        return Response(results)
+        return Response(results, status=status.HTTP_200_OK)
+
+    def _scan_filters(self):
+        """The supplier/category narrowing get_queryset applies, for cached batches."""
+        return {
+            'category': self.request.query_params.get('category'),
+            'supplier': self.request.query_params.get('supplier'),
+        }
+
+    @action(detail=False, methods=['get'], url_path='snapshot', permission_classes=[CanReadStockSnapshot])
+    def snapshot(self, request):
+        """
+        Compact catalog for POS/casualty terminals (see pharmacy.snapshot).
+        ?category=PHARMACY|CASUALTY scopes it; ?since=<version> returns only the changes.
+        Returns: { "version", "full", "category", "columns": [...], "rows": [[...], ...], "removed": [ids] }
+        """
+        from .snapshot import build_snapshot, catalog_etag
+        since = request.query_params.get('since')
+        if since is not None and not since.isdigit():
+            return Response({"since": ["Must be a version returned by this endpoint."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        etag = catalog_etag()
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = build_snapshot(category=request.query_params.get('category') or None, since=since and int(since))
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=False, methods=['get'], url_path='doctor-search')
+    def doctor_search(self, request):
+        """
+        Aggregates stock by medicine name for Doctor's search, served from the
+        per-process prefix index in pharmacy.search.
+        Returns: [ { "id": "Name", "name": "Name", "qty_available": TotalQty, "mrp": ..., "tablets_per_strip": ... } ]
+        """
+        from .search import suggest_medicines
+        return Response(suggest_medicines(request.query_params.get('search', '')))
 
 
 class PurchaseInvoiceViewSet(viewsets.ModelViewSet):
@@ -400,14 +260,6 @@ class PurchaseInvoiceViewSet(viewsets.ModelViewSet):
         ctx["request"] = self.request
         return ctx
 
-    def perform_update(self, serializer):
-        instance = serializer.save()
-        # Recalculate total with new discount/courier values
-        new_total = instance.calculate_total()
-        if instance.total_amount != new_total:
-            instance.total_amount = new_total
-            instance.save()
-
 
 class PharmacySaleViewSet(viewsets.ModelViewSet):
     queryset = PharmacySale.objects.all().order_by('-sale_date')
@@ -475,10 +327,11 @@ class PharmacyQueueViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         # Visits assigned to PHARMACY
         # OR assigned to LAB but have a prescription in doctor_note
-        return Visit.objects.filter(
+        qs = Visit.objects.filter(
             Q(assigned_role='PHARMACY') | 
             (Q(assigned_role='LAB') & ~Q(doctor_note__prescription={}) & Q(doctor_note__prescription__isnull=False))
         ).exclude(status='CLOSED').order_by('updated_at')
+        return VisitSerializer.setup_eager_loading(qs)
 
     @action(detail=True, methods=['post'])
     def dispense(self, request, pk=None):
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import ExpiryEntry
 
-# Register your models here.
+
+@admin.register(ExpiryEntry)
+class ExpiryEntryAdmin(admin.ModelAdmin):
+    list_display = ('as_of', 'source', 'item_name', 'batch_no', 'expiry_date', 'bucket_days', 'qty', 'value_at_risk')
+    list_filter = ('source', 'bucket_days')
+    search_fields = ('item_name', 'batch_no')
@@ -0,0 +1,130 @@
+"""
+Expiry buckets for the expiry report and the dashboard.
+
+A batch with stock falls in bucket 0 once expired, else in the smallest of
+EXPIRY_HORIZONS (days) it expires within; its value at risk is qty x purchase rate.
+
+The `materialize_expiry` command (nightly) copies every pharmacy and lab batch within the
+widest horizon, bucket and value included, into ExpiryEntry, replacing the previous copy
+in one transaction, and records the run in ExpiryRun. Readers use the copy when the run is
+from today and reaches the asked horizon (an empty copy included), and otherwise query the live batches (indexed on is_deleted, expiry_date) with
+the same columns.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+EXPIRY_HORIZONS = tuple(sorted(getattr(settings, 'EXPIRY_REPORT_HORIZONS', (30, 60, 90))))
+
+PHARMACY = 'PHARMACY'
+LAB = 'LAB'
+SOURCES = (PHARMACY, LAB)
+
+# Columns shared by the live querysets and ExpiryEntry, in the order the live ones select them
+ROW_FIELDS = ('batch_no', 'expiry_date', 'mrp', 'qty', 'item_name', 'source', 'batch_id', 'rate',
+              'bucket_days', 'value_at_risk')
+
+CHUNK_SIZE = 2000
+
+
+def bucket_expression(today, horizons=EXPIRY_HORIZONS):
+    whens = [When(expiry_date__lt=today, then=Value(0))]
+    whens += [When(expiry_date__lte=today + timedelta(days=days), then=Value(days)) for days in horizons]
+    return Case(*whens, default=Value(None), output_field=IntegerField())
+
+
+def live_rows(source, today, days, horizons=EXPIRY_HORIZONS):
+    """Batches of `source` with stock, expiring by today + `days`, as ROW_FIELDS dicts."""
+    from pharmacy.models import PharmacyStock
+    from lab.models import LabBatch
+
+    columns = dict(
+        source=Value(source),
+        batch_id=F('id'),
+        rate=F('purchase_rate'),
+        bucket_days=bucket_expression(today, horizons),
+    )
+    value = DecimalField(max_digits=14, decimal_places=2)
+    until = today + timedelta(days=days)
+
+    # Lab's `qty` is a model field, so it is selected before the annotations; the pharmacy
+    # annotation is put in the same place for the UNION in `combine`.
+    if source == PHARMACY:
+        return PharmacyStock.objects.filter(is_deleted=False, expiry_date__lte=until, qty_available__gt=0).values(
+            'batch_no', 'expiry_date', 'mrp', qty=F('qty_available'), item_name=F('name'), **columns,
+            value_at_risk=ExpressionWrapper(F('qty_available') * F('purchase_rate'), output_field=value),
+        )
+    return LabBatch.objects.filter(is_deleted=False, expiry_date__lte=until, qty__gt=0).values(
+        'batch_no', 'expiry_date', 'mrp', 'qty', item_name=F('inventory_item__item_name'), **columns,
+        value_at_risk=ExpressionWrapper(F('qty') * F('purchase_rate'), output_field=value),
+    )
+
+
+def materialize(today=None, horizons=EXPIRY_HORIZONS):
+    """Replace the ExpiryEntry copy with today's batches; returns how many were written."""
+    from .models import ExpiryEntry, ExpiryRun
+
+    today = today or timezone.now().date()
+    widest = max(horizons)
+    written = 0
+    with transaction.atomic():
+        ExpiryEntry.objects.all().delete()
+        for source in SOURCES:
+            rows = live_rows(source, today, widest, horizons).order_by('expiry_date').iterator(chunk_size=CHUNK_SIZE)
+            chunk = []
+            for row in rows:
+                chunk.append(ExpiryEntry(as_of=today, horizon_days=widest, **row))
+                if len(chunk) == CHUNK_SIZE:
+                    written += len(ExpiryEntry.objects.bulk_create(chunk))
+                    chunk = []
+            written += len(ExpiryEntry.objects.bulk_create(chunk))
+        ExpiryRun.objects.all().delete()
+        ExpiryRun.objects.create(as_of=today, horizon_days=widest)
+    return written
+
+
+def expiry_rows(sources=SOURCES, days=None, today=None):
+    """
+    ([queryset of ROW_FIELDS dicts per source], as_of): from ExpiryEntry when the last run
+    (ExpiryRun) is from today and covers `days` (the widest horizon when None), else from the live batches
+    (as_of None).
+    """
+    from .models import ExpiryEntry, ExpiryRun
+
+    today = today or timezone.now().date()
+    days = max(EXPIRY_HORIZONS) if days is None else days
+    latest = ExpiryRun.objects.values_list('as_of', 'horizon_days').first()
+
+    if latest and latest[0] == today and days <= latest[1]:
+        rows = ExpiryEntry.objects.filter(expiry_date__lte=today + timedelta(days=days)).values(*ROW_FIELDS)
+        return [rows.filter(source=source) for source in sources], today
+    return [live_rows(source, today, days) for source in sources], None
+
+
+def combine(querysets):
+    """One queryset of all rows, nearest expiry first."""
+    rows = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+    return rows.order_by('expiry_date', 'item_name', 'batch_no')
+
+
+def bucket_summary(querysets):
+    """[{'bucket_days', 'batches', 'qty', 'value_at_risk'}, ...] expired first, beyond every horizon (None) last."""
+    totals = {}
+    for rows in querysets:
+        grouped = rows.order_by().values('bucket_days').annotate(
+            batches=Count('*'),
+            total_qty=Sum('qty'),
+            total_value=Coalesce(Sum('value_at_risk'), Value(0), output_field=DecimalField()),
+        )
+        for group in grouped:
+            bucket = totals.setdefault(group['bucket_days'], {
+                'bucket_days': group['bucket_days'], 'batches': 0, 'qty': 0, 'value_at_risk': 0,
+            })
+            bucket['batches'] += group['batches']
+            bucket['qty'] += group['total_qty'] or 0
+            bucket['value_at_risk'] += group['total_value']
+    return [totals[days] for days in sorted(totals, key=lambda days: (days is None, days or 0))]
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from reports.expiry import EXPIRY_HORIZONS, materialize
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies every pharmacy and lab batch with stock that is expired or expires within the '
+        'widest horizon into the expiry report table, with its bucket and value at risk. '
+        'Run nightly (e.g. from cron just after midnight); until it has run for the day the '
+        'report reads the live batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizons', type=int, nargs='+', default=list(EXPIRY_HORIZONS),
+                            help='Bucket horizons in days (default from EXPIRY_REPORT_HORIZONS)')
+
+    def handle(self, *args, **options):
+        horizons = tuple(sorted(set(options['horizons'])))
+        written = materialize(horizons=horizons)
+        self.stdout.write(self.style.SUCCESS(
+            f"Materialized {written} expiring batch(es), buckets {', '.join(map(str, horizons))} days"
+        ))
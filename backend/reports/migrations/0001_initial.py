@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:37
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiryEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('as_of', models.DateField()),
+                ('horizon_days', models.PositiveIntegerField()),
+                ('source', models.CharField(choices=[('PHARMACY', 'Pharmacy'), ('LAB', 'Lab')], max_length=10)),
+                ('batch_id', models.UUIDField()),
+                ('item_name', models.CharField(max_length=255)),
+                ('batch_no', models.CharField(max_length=50)),
+                ('expiry_date', models.DateField()),
+                ('bucket_days', models.PositiveIntegerField()),
+                ('qty', models.PositiveIntegerField()),
+                ('rate', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('mrp', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('value_at_risk', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'expiry_date', 'id'], name='expiry_source_date_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,48 @@
 from django.db import models
+from core.models import BaseModel
 
-# Create your models here.
+
+class ExpiryRun(BaseModel):
+    """
+    The last `materialize_expiry` run: the ExpiryEntry copy is current as of `as_of` up to
+    `horizon_days`, even when the run found nothing to copy. One row, replaced by each run.
+    """
+    as_of = models.DateField()
+    horizon_days = models.PositiveIntegerField()  # widest horizon of the run
+
+    def __str__(self):
+        return f"Expiry copy as of {self.as_of} ({self.horizon_days} days)"
+
+
+class ExpiryEntry(BaseModel):
+    """
+    A pharmacy or lab batch with stock that expires within the widest horizon, copied by
+    the `materialize_expiry` command as of `as_of` (see reports.expiry).
+    """
+    SOURCE_CHOICES = (
+        ('PHARMACY', 'Pharmacy'),
+        ('LAB', 'Lab'),
+    )
+
+    as_of = models.DateField()
+    horizon_days = models.PositiveIntegerField()  # widest horizon of the run that wrote it
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    batch_id = models.UUIDField()  # PharmacyStock or LabBatch id
+    item_name = models.CharField(max_length=255)
+    batch_no = models.CharField(max_length=50)
+    expiry_date = models.DateField()
+    # 0 when already expired, else the smallest horizon (days) the batch expires within
+    bucket_days = models.PositiveIntegerField()
+
+    qty = models.PositiveIntegerField()
+    rate = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # purchase rate
+    mrp = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    value_at_risk = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # qty x rate
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'expiry_date', 'id'], name='expiry_source_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_name} ({self.batch_no}) expires {self.expiry_date}"
@@ -1,3 +1,42 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from pharmacy.models import PharmacyStock
+from users.models import User
+
+
+class PharmacyStockReportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', role='ADMIN'))
+        # Saves outside a labelled flow are ledger adjustments: +10, then -6
+        self.stock = PharmacyStock.objects.create(
+            name='Paracetamol', batch_no='P1', expiry_date='2030-01-01', mrp=10, selling_price=10, qty_available=10,
+        )
+        self.stock.qty_available = 4
+        self.stock.save()
+        self.today = timezone.now().date().isoformat()
+
+    def test_inventory_keeps_the_sign_of_adjustments(self):
+        response = self.client.get('/api/reports/pharmacy-inventory/', {'start_date': self.today, 'end_date': self.today})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted((row['type'], row['qty']) for row in response.json()['details']),
+                         [('ADJUST', -6), ('ADJUST', 10)])
+
+    def test_stock_on_hand_from_the_ledger(self):
+        response = self.client.get('/api/reports/pharmacy-stock-on-hand/', {'date': self.today})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['batch_no'], row['qty']) for row in response.json()['details']], [('P1', 4)])
+
+    def test_stock_on_hand_before_the_ledger_is_rejected(self):
+        yesterday = (timezone.now().date() - timedelta(days=1)).isoformat()
+
+        response = self.client.get('/api/reports/pharmacy-stock-on-hand/', {'date': yesterday})
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.json())
@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     OPDReportView, FinancialReportView, DoctorReportView,
     PharmacySalesReportView, LabTestReportView, LabInventoryReportView,
-    ProfitAnalyticsView, PharmacyInventoryReportView, ExpiryReportView,
+    ProfitAnalyticsView, PharmacyInventoryReportView, PharmacyStockOnHandReportView, ExpiryReportView,
     SupplierPurchaseReportView, VisitBillingSummaryView
 )
 
@@ -17,6 +17,7 @@ urlpatterns = [
     
     # New Reports
     path('pharmacy-inventory/', PharmacyInventoryReportView.as_view(), name='pharmacy-inventory-report'),
+    path('pharmacy-stock-on-hand/', PharmacyStockOnHandReportView.as_view(), name='pharmacy-stock-on-hand-report'),
     path('expiry/', ExpiryReportView.as_view(), name='expiry-report'),
     path('supplier-purchase/', SupplierPurchaseReportView.as_view(), name='supplier-purchase-report'),
     path('billing-summary/', VisitBillingSummaryView.as_view(), name='billing-summary-report'),
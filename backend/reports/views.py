@@ -1,19 +1,26 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
+from rest_framework.exceptions import ValidationError
 from django.db.models import Sum, Count, F
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from dateutil.relativedelta import relativedelta
 
 from patients.models import Visit
 from billing.models import Invoice, InvoiceItem
-from pharmacy.models import PharmacySale, PharmacySaleItem, PharmacyStock, PurchaseInvoice, PurchaseItem, Supplier, PharmacyReturn
+from pharmacy.models import PharmacySale, PharmacySaleItem, PharmacyStock, PurchaseInvoice, PurchaseItem, Supplier, PharmacyReturn, StockMovement
+from pharmacy.ledger import ledger_start, stock_on_hand
 from lab.models import LabCharge, LabInventoryLog, LabPurchase, LabPurchaseItem
 from medical.models import DoctorNote
 from django.db.models.functions import TruncDate
 import csv
-from django.http import HttpResponse
+from itertools import chain
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.pagination import PageNumberPagination
+from .expiry import (
+    EXPIRY_HORIZONS, PHARMACY as EXPIRY_PHARMACY, SOURCES as EXPIRY_SOURCES, bucket_summary, combine, expiry_rows,
+)
 
 class BaseReportView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -30,6 +37,13 @@ class BaseReportView(APIView):
             
         return str(start_date), str(end_date)
 
+    def parse_day(self, value, param):
+        """Midnight of a YYYY-MM-DD query parameter; a malformed one is a 400."""
+        try:
+            return datetime.strptime(value, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValidationError({param: f"Invalid date '{value}', expected YYYY-MM-DD."})
+
     def export_csv(self, filename, headers, data):
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
@@ -39,6 +53,22 @@ class BaseReportView(APIView):
             writer.writerow(row)
         return response
 
+    def stream_csv(self, filename, headers, rows):
+        """Like export_csv, but sends each row as `rows` (an iterator) yields it."""
+        writer = csv.writer(_Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in chain([headers], rows)), content_type='text/csv'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+
+
+class _Echo:
+    """File-like target for csv.writer that hands each line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
 class OPDReportView(BaseReportView):
     def get(self, request):
         start_date, end_date = self.get_date_range(request)
@@ -426,52 +456,47 @@ class ProfitAnalyticsView(APIView):
         })
 
 class PharmacyInventoryReportView(BaseReportView):
+    # Ledger movement types as the report has always labelled them
+    TYPE_LABELS = {
+        StockMovement.IN: 'STOCK_IN',
+        StockMovement.OUT: 'STOCK_OUT',
+        StockMovement.RETURN: 'RETURN',
+        StockMovement.ADJUST: 'ADJUST',
+    }
+
     def get(self, request):
         start_date, end_date = self.get_date_range(request)
-        
-        # Stock IN (Purchases)
-        purchases = PurchaseItem.objects.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
-        ).values('product_name', 'batch_no', 'qty', 'created_at', 'purchase_rate')
-        
-        # Stock OUT (Sales)
-        sales = PharmacySaleItem.objects.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
-        ).values('med_stock__name', 'med_stock__batch_no', 'qty', 'created_at', 'unit_price')
+
+        # Half-open datetime range: one scan of the created_at index. Before the ledger
+        # began, purchases and sales are read from their own tables instead.
+        start = self.parse_day(start_date, 'start_date')
+        end = self.parse_day(end_date, 'end_date') + timedelta(days=1)
+        boundary = min(max(ledger_start() or end, start), end)
+
+        movements = list(StockMovement.objects.filter(
+            created_at__gte=boundary, created_at__lt=end
+        ).order_by('-created_at').values('id', 'name', 'batch_no', 'movement_type', 'qty', 'rate', 'source', 'created_at'))
+        if boundary > start:
+            movements += self._before_ledger(start, boundary)
 
         if request.query_params.get('export') == 'csv':
-            data = []
-            for p in purchases:
-                data.append([p['created_at'], p['product_name'], p['batch_no'], 'IN', p['qty'], p['purchase_rate']])
-            for s in sales:
-                data.append([s['created_at'], s['med_stock__name'], s['med_stock__batch_no'], 'OUT', s['qty'], s['unit_price']])
-            return self.export_csv("inventory_logs", ["Date", "Item", "Batch", "Type", "Qty", "Rate"], data)
-
-        details = []
-        for p in purchases:
-            details.append({
-                "id": f"IN-{p['batch_no']}",
-                "item_name": p['product_name'],
-                "batch_no": p['batch_no'],
-                "type": "STOCK_IN",
-                "qty": p['qty'],
-                "cost": p['purchase_rate'],
-                "date": p['created_at']
-            })
-        for s in sales:
-            details.append({
-                "id": f"OUT-{s['med_stock__batch_no']}",
-                "item_name": s['med_stock__name'],
-                "batch_no": s['med_stock__batch_no'],
-                "type": "STOCK_OUT",
-                "qty": s['qty'],
-                "cost": s['unit_price'],
-                "date": s['created_at']
-            })
-            
-        details.sort(key=lambda x: x['date'], reverse=True)
+            data = [
+                [m['created_at'], m['name'], m['batch_no'], m['movement_type'], m['qty'], m['rate'], m['source']]
+                for m in movements
+            ]
+            return self.export_csv("inventory_logs", ["Date", "Item", "Batch", "Type", "Qty", "Rate", "Source"], data)
+
+        details = [{
+            "id": str(m['id']),
+            "item_name": m['name'],
+            "batch_no": m['batch_no'],
+            "type": self.TYPE_LABELS[m['movement_type']],
+            # The type says which way IN/OUT/RETURN go; an adjustment keeps its sign
+            "qty": m['qty'] if m['movement_type'] == StockMovement.ADJUST else abs(m['qty']),
+            "cost": m['rate'],
+            "source": m['source'],
+            "date": m['created_at']
+        } for m in movements]
 
         return Response({
             "start_date": start_date,
@@ -480,32 +505,119 @@ class PharmacyInventoryReportView(BaseReportView):
             "details": details
         })
 
-class ExpiryReportView(BaseReportView):
+    def _before_ledger(self, start, end):
+        """Purchase and sale lines in [start, end) shaped like ledger movements, newest first."""
+        purchases = PurchaseItem.objects.filter(created_at__gte=start, created_at__lt=end).values(
+            'id', 'batch_no', 'qty', 'created_at', name=F('product_name'), rate=F('purchase_rate'),
+        )
+        sales = PharmacySaleItem.objects.filter(created_at__gte=start, created_at__lt=end).values(
+            'id', 'qty', 'created_at', name=F('med_stock__name'), batch_no=F('med_stock__batch_no'), rate=F('unit_price'),
+        )
+        rows = [{**p, 'movement_type': StockMovement.IN, 'source': 'purchase'} for p in purchases]
+        rows += [{**s, 'qty': -s['qty'], 'movement_type': StockMovement.OUT, 'source': 'sale'} for s in sales]
+        return sorted(rows, key=lambda m: m['created_at'], reverse=True)
+
+class PharmacyStockOnHandReportView(BaseReportView):
+    """
+    Quantity of every batch at the end of ?date= (default today), from the stock ledger.
+    A date before the ledger began is a 400: it holds no balances for it.
+    """
+
     def get(self, request):
-        # Expiry report doesn't necessarily need a date range filter for creation, 
-        # but rather a filter for things expiring SOON or ALREADY EXPIRED.
-        target_date = timezone.now().date() + timedelta(days=90) # Expiring in 90 days
-        stocks = PharmacyStock.objects.filter(expiry_date__lte=target_date, is_deleted=False).order_by('expiry_date')
+        as_of_date = request.query_params.get('date') or str(timezone.now().date())
+        moment = datetime.combine(self.parse_day(as_of_date, 'date'), time.max)
+        began = ledger_start()
+        if began is not None and moment < began:
+            raise ValidationError({'date': (
+                f"Stock on hand is only known from {began.date().isoformat()}, when the stock ledger began."
+            )})
+
+        stocks = (
+            stock_on_hand(moment)
+            .filter(balance__gt=0)
+            .order_by('name', 'expiry_date')
+            .values('id', 'name', 'batch_no', 'expiry_date', 'purchase_rate', 'balance')
+        )
 
         if request.query_params.get('export') == 'csv':
-            data = [[s.name, s.batch_no, s.expiry_date, s.qty_available, s.mrp] for s in stocks]
-            return self.export_csv("expiry_report", ["Item", "Batch", "Expiry", "Qty Available", "MRP"], data)
+            data = [[s['name'], s['batch_no'], s['expiry_date'], s['balance'], s['purchase_rate']] for s in stocks]
+            return self.export_csv("stock_on_hand", ["Item", "Batch", "Expiry", "Qty On Hand", "Rate"], data)
 
         details = [{
-            "id": str(s.id),
-            "item_name": s.name,
-            "batch_no": s.batch_no,
-            "expiry_date": s.expiry_date,
-            "qty": s.qty_available,
-            "cost": s.mrp,
-            "date": s.expiry_date # Using expiry date as primary date for sorting/display
+            "id": str(s['id']),
+            "item_name": s['name'],
+            "batch_no": s['batch_no'],
+            "expiry_date": s['expiry_date'],
+            "qty": s['balance'],
+            "cost": s['purchase_rate'],
         } for s in stocks]
 
         return Response({
-            "report_type": "Expiry Report (Expiring within 90 days)",
+            "date": as_of_date,
+            "report_type": "Stock On Hand",
             "details": details
         })
 
+class ExpiryPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class ExpiryReportView(BaseReportView):
+    """
+    Batches with stock that are expired or expire within ?days= (default: widest horizon),
+    read from the nightly expiry table (reports.expiry). ?source= PHARMACY (default), LAB
+    or ALL. ?page= pages the rows; ?export=csv streams them.
+    """
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days') or max(EXPIRY_HORIZONS))
+        except ValueError:
+            return Response({"error": "days must be a whole number"}, status=status.HTTP_400_BAD_REQUEST)
+        source = (request.query_params.get('source') or EXPIRY_PHARMACY).upper()
+        sources = EXPIRY_SOURCES if source == 'ALL' else (source,)
+        if source != 'ALL' and source not in EXPIRY_SOURCES:
+            return Response({"error": f"Unknown source {source}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        querysets, as_of = expiry_rows(sources, days)
+        rows = combine(querysets)
+
+        if request.query_params.get('export') == 'csv':
+            data = (
+                [r['item_name'], r['batch_no'], r['expiry_date'], r['qty'], r['mrp'], r['source'], r['value_at_risk']]
+                for r in rows.iterator()
+            )
+            return self.stream_csv("expiry_report", ["Item", "Batch", "Expiry", "Qty Available", "MRP", "Source", "Value At Risk"], data)
+
+        paginator = ExpiryPagination() if 'page' in request.query_params else None
+        if paginator:
+            rows = paginator.paginate_queryset(rows, request, view=self)
+
+        details = [{
+            "id": str(r['batch_id']),
+            "source": r['source'],
+            "item_name": r['item_name'],
+            "batch_no": r['batch_no'],
+            "expiry_date": r['expiry_date'],
+            "bucket_days": r['bucket_days'],
+            "qty": r['qty'],
+            "cost": r['mrp'],
+            "value_at_risk": r['value_at_risk'],
+            "date": r['expiry_date'] # Using expiry date as primary date for sorting/display
+        } for r in rows]
+
+        data = {
+            "report_type": f"Expiry Report (Expiring within {days} days)",
+            "as_of": as_of,
+            "buckets": bucket_summary(querysets),
+            "details": details
+        }
+        if paginator:
+            data.update(count=paginator.page.paginator.count, next=paginator.get_next_link(), previous=paginator.get_previous_link())
+        return Response(data)
+
 class SupplierPurchaseReportView(BaseReportView):
     def get(self, request):
         start_date, end_date = self.get_date_range(request)
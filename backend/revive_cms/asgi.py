@@ -11,11 +11,20 @@ import os
 
 from django.core.asgi import get_asgi_application
 import socketio
-from .sio import sio
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'revive_cms.settings')
 
 django_asgi_app = get_asgi_application()
 
+# Imported after setup: the client manager is chosen from settings
+from .sio import sio  # noqa: E402
+
 # Wrap Django ASGI application with Socket.IO
-application = socketio.ASGIApp(sio, django_asgi_app)
+sio_app = socketio.ASGIApp(sio, django_asgi_app)
+
+
+async def application(scope, receive, send):
+    # Socket events queued by requests are emitted from this loop (see revive_cms.realtime)
+    from .realtime import outbox
+    outbox.ensure_dispatcher()
+    await sio_app(scope, receive, send)
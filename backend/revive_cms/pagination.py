@@ -0,0 +1,162 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a unique composite ordering such as ('-created_at', '-id').
+    Each page is `WHERE (created_at, id) < (last row) ORDER BY ... LIMIT n`, so page 500
+    costs the same as page 1 and no COUNT(*) is run. Cursors are opaque base64 tokens.
+
+    Views choose the ordering with a `keyset_ordering` attribute; the last field must be unique.
+    A queryset already ordered otherwise (`?ordering=` from OrderingFilter, an explicit
+    order_by) keeps that order, with the primary key appended to break ties; it must be on
+    non-null fields of the model itself, or the request is a 400.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_ordering_message = "Cannot page by cursor when ordered by '{term}'."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.ordering = self.get_ordering(queryset, view)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_ordering(self, queryset, view):
+        preferred = tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+        requested = tuple(queryset.query.order_by)
+        if not requested or preferred[:len(requested)] == requested:
+            return preferred
+
+        ordering = []
+        for term in requested:
+            if not isinstance(term, str) or not self._orderable(term.lstrip('-')):
+                raise ValidationError({'ordering': [self.invalid_ordering_message.format(term=term)]})
+            ordering.append(term)
+            if self._field(term.lstrip('-')).unique:
+                return tuple(ordering)
+        # Same direction as the last term, so ties keep a stable order
+        ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        values = [self._field(name).value_to_string(last) for name in self._field_names()]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    # --- Cursor encoding ---
+
+    def encode_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            names = self._field_names()
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError
+            return [self._field(name).to_python(value) for name, value in zip(names, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    # --- Helpers ---
+
+    def _field_names(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def _field(self, name):
+        if name == 'pk':
+            return self.model._meta.pk
+        return self.model._meta.get_field(name)
+
+    def _orderable(self, name):
+        """A concrete, non-null column of the model: one a row-value comparison can seek on."""
+        try:
+            field = self._field(name)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.is_relation and not field.null
+
+    def _after(self, position):
+        """(a, b, c) > (x, y, z) expanded to OR-of-ANDs, honouring each field's direction."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{name}__{lookup}': position[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], position[:i]):
+                term &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= term
+        return condition
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination that switches to KeysetPagination when the client sends
+    `?cursor=` (empty for the first page). Existing page/page_size clients are unaffected.
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
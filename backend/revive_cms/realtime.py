@@ -0,0 +1,256 @@
+"""
+Transactional outbox for Socket.IO events.
+
+Request code calls `publish_event(...)`; the event is queued only when the surrounding
+transaction commits (rolled-back writes never announce themselves) and is emitted by a
+dispatcher coroutine running on the ASGI event loop, so request latency no longer
+includes socket I/O.
+
+Events are addressed to rooms rather than broadcast: every authenticated socket sits in
+`role:<ROLE>` and `user:<id>` (plus `doctor:<id>` for doctors), and may join
+`patient:<id>` / `visit:<id>` for the record it has open. See revive_cms.sio.
+
+Payloads carry a compact `entity` snapshot and its `version`, so clients can patch rows
+in place. Bursts of the same event are coalesced into one `{'batch': [...]}` payload.
+"""
+import asyncio
+import datetime
+import threading
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+
+BATCH_SIZE = 100
+# The dispatcher keeps collecting while events arrive less than QUIET_SECONDS apart,
+# for at most MAX_DELAY_SECONDS, so a burst of saves becomes one emit per event type.
+QUIET_SECONDS = 0.2
+MAX_DELAY_SECONDS = 1.0
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+# --- Payload snapshots ---
+
+def entity_version(instance):
+    """
+    Per-row version that only moves forward: `updated_at` (auto_now) in microseconds.
+    Every worker derives it from the row itself, so no shared counter is needed.
+    """
+    updated = instance.updated_at
+    if updated.tzinfo is not None:
+        updated = updated.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (updated - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def snapshot(instance, fields, **extra):
+    """`{'entity': {...}, 'version': n}` for merging into an event payload."""
+    entity = {'id': str(instance.pk)}
+    for name in fields:
+        entity[name] = _jsonable(getattr(instance, name))
+    for name, value in extra.items():
+        entity[name] = _jsonable(value)
+    return {'entity': entity, 'version': entity_version(instance)}
+
+
+def _jsonable(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+# --- Room names ---
+
+def role_room(role):
+    return f'role:{role}'
+
+
+def user_room(user_id):
+    return f'user:{user_id}'
+
+
+def doctor_room(user_id):
+    return f'doctor:{user_id}'
+
+
+def patient_room(patient_id):
+    return f'patient:{patient_id}'
+
+
+def visit_room(visit_id):
+    return f'visit:{visit_id}'
+
+
+def normalize_rooms(room):
+    """None means broadcast; a name or an iterable of names becomes a sorted, de-duplicated tuple."""
+    if room is None:
+        return None
+    if isinstance(room, str):
+        return (room,)
+    return tuple(sorted({r for r in room if r}))
+
+
+class EventOutbox:
+    def __init__(self):
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._lock = threading.Lock()
+
+    # --- Producer side (any thread) ---
+
+    def publish(self, event, data, room=None, using=None):
+        """
+        Queue `event` for delivery after the current transaction (if any) commits.
+        `room` is a room name, a list of room names, or None to broadcast.
+        """
+        rooms = normalize_rooms(room)
+        if rooms == ():
+            return  # addressed to nobody
+        transaction.on_commit(lambda: self._enqueue((event, data, rooms)), using=using)
+
+    def _enqueue(self, item):
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and self._task is not None and not self._task.done():
+            try:
+                if _running_loop() is loop:
+                    self._queue.put_nowait(item)
+                else:
+                    loop.call_soon_threadsafe(self._queue.put_nowait, item)
+                return
+            except RuntimeError:
+                pass  # loop shut down between the check and the call
+
+        # No dispatcher in this process (WSGI worker, management command): emit inline
+        self._emit_inline(item)
+
+    def _emit_inline(self, item):
+        try:
+            from asgiref.sync import async_to_sync
+            from .sio import sio
+            event, data, rooms = item
+            async_to_sync(sio.emit)(event, data, room=_emit_target(rooms))
+        except Exception as e:
+            print(f"Socket emit error: {e}")
+
+    # --- Consumer side (ASGI event loop) ---
+
+    def ensure_dispatcher(self):
+        """Start the dispatcher on the running loop. Safe to call on every ASGI request."""
+        if self._task is not None and not self._task.done():
+            return
+        with self._lock:
+            if self._task is not None and not self._task.done():
+                return
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            self._task = self._loop.create_task(self._run())
+
+    async def _run(self):
+        from .sio import sio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + MAX_DELAY_SECONDS
+            while len(batch) < BATCH_SIZE:
+                timeout = min(QUIET_SECONDS, deadline - loop.time())
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            for event, data, rooms in self._coalesce(batch):
+                try:
+                    await sio.emit(event, data, room=_emit_target(rooms))
+                except Exception as e:
+                    print(f"Socket emit error: {e}")
+
+    @staticmethod
+    def _coalesce(batch):
+        """
+        Fold a burst into as few emits as possible, keeping first-seen event order:
+        - repeated updates of one entity keep only the highest version (exact duplicates drop),
+          sent to every room any of them targeted (a transfer's old doctor still hears it);
+        - several entities of one event share a `{'batch': [...], 'version': max}` payload
+          sent to the rooms they all target, and each item still goes alone to its own
+          extra rooms (patient/visit/doctor viewers).
+        """
+        events = {}
+        for event, data, rooms in batch:
+            items = events.setdefault((event, rooms is None), {})
+            key = _entity_key(data)
+            current = items.get(key)
+            if current is None:
+                items[key] = (data, rooms)
+                continue
+            if rooms is not None:
+                rooms = normalize_rooms(rooms + current[1])
+            if _version(data) < _version(current[0]):
+                data = current[0]
+            items[key] = (data, rooms)
+
+        emits = []
+        for (event, broadcast), items in events.items():
+            items = list(items.values())
+            if len(items) == 1:
+                emits.append((event, items[0][0], items[0][1]))
+                continue
+
+            shared = None if broadcast else frozenset.intersection(*(frozenset(r) for _, r in items))
+            if not broadcast and not shared:
+                emits.extend((event, data, rooms) for data, rooms in items)
+                continue
+
+            payloads = [data for data, _ in items]
+            emits.append((event, {
+                'batch': payloads,
+                'version': max(_version(data) for data in payloads),
+            }, None if broadcast else tuple(sorted(shared))))
+            if not broadcast:
+                for data, rooms in items:
+                    extra = tuple(r for r in rooms if r not in shared)
+                    if extra:
+                        emits.append((event, data, extra))
+        return emits
+
+
+def _entity_key(data):
+    if isinstance(data, dict):
+        entity = data.get('entity')
+        if isinstance(entity, dict) and 'id' in entity:
+            return ('entity', entity['id'])
+        return ('data', repr(sorted(data.items())))
+    return ('data', repr(data))
+
+
+def _version(data):
+    return (data.get('version') or 0) if isinstance(data, dict) else 0
+
+
+def _emit_target(rooms):
+    # python-socketio accepts a list of rooms and delivers once per socket
+    if rooms is None:
+        return None
+    return rooms[0] if len(rooms) == 1 else list(rooms)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+outbox = EventOutbox()
+
+
+def publish_event(event, data, room=None, using=None):
+    """Shortcut for `outbox.publish`; pass `room` (name or list) to target specific clients."""
+    outbox.publish(event, data, room=room, using=using)
@@ -169,4 +169,20 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# Socket.IO client manager shared by all ASGI workers (see revive_cms/socket_managers.py).
+# Leave empty for a single worker; unix:///path/socketio.sock to run several workers on one host.
+SOCKETIO_MANAGER_URL = os.getenv('SOCKETIO_MANAGER_URL', '')
+
+# Cache for per-user unread notification counts (core/notifications.py). The default is
+# per process; set CACHE_DIR to share a file-based cache between workers on one host. With
+# more than one worker this is required, or other workers serve stale counts for up to
+# NOTIFICATION_UNREAD_CACHE_SECONDS.
+if os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        }
+    }
+
 
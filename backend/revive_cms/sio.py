@@ -1,13 +1,92 @@
 import socketio
 import os
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .socket_managers import build_client_manager
 
 # Create a Socket.IO server
 # cors_allowed_origins='*' is important for development
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+# With SOCKETIO_MANAGER_URL set, emits and room changes are shared across worker processes
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    client_manager=build_client_manager(getattr(settings, 'SOCKETIO_MANAGER_URL', '')),
+)
+
+# Rooms a client may join on request; role/user/doctor rooms are assigned at connect only
+JOINABLE_ROOM_PREFIXES = ('patient:', 'visit:')
+
+# Patient and visit rooms carry clinical data (lab results, notes): these roles may join any
+# of them, a doctor only those of their own visits and those visits' patients
+CLINICAL_ROOM_ROLES = ('ADMIN', 'LAB')
+
+
+def _token_from(environ, auth):
+    """JWT from the socket.io `auth` payload, falling back to `?token=` on the handshake URL."""
+    if isinstance(auth, dict) and auth.get('token'):
+        return auth['token']
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    return (query.get('token') or [None])[0]
+
+
+@sync_to_async
+def _authenticate(token):
+    from rest_framework_simplejwt.tokens import AccessToken
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from django.contrib.auth import get_user_model
+
+    try:
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+    User = get_user_model()
+    return User.objects.filter(
+        **{api_settings.USER_ID_FIELD: user_id}, is_active=True, is_deleted=False
+    ).only('id', 'role').first()
+
+
+@sync_to_async
+def _may_join(user_id, role, room):
+    import uuid
+    from patients.models import Visit
+
+    if role in CLINICAL_ROOM_ROLES:
+        return True
+    if role != 'DOCTOR':
+        return False
+    kind, _, object_id = room.partition(':')
+    try:
+        object_id = uuid.UUID(object_id)
+    except ValueError:
+        return False
+    visits = Visit.objects.filter(doctor_id=user_id)
+    if kind == 'visit':
+        return visits.filter(id=object_id).exists()
+    return visits.filter(patient_id=object_id).exists()
+
 
 @sio.event
-async def connect(sid, environ):
-    print(f"SocketIO Client Connected: {sid}")
+async def connect(sid, environ, auth=None):
+    from .realtime import role_room, user_room, doctor_room
+
+    token = _token_from(environ, auth)
+    user = await _authenticate(token) if token else None
+    if user is None:
+        raise socketio.exceptions.ConnectionRefusedError('authentication failed')
+
+    rooms = [role_room(user.role), user_room(user.id)]
+    if user.role == 'DOCTOR':
+        rooms.append(doctor_room(user.id))
+
+    await sio.save_session(sid, {'user_id': str(user.id), 'role': user.role})
+    for room in rooms:
+        await sio.enter_room(sid, room)
+    print(f"SocketIO Client Connected: {sid} ({', '.join(rooms)})")
 
 @sio.event
 async def disconnect(sid):
@@ -15,5 +94,16 @@ async def disconnect(sid):
 
 @sio.event
 async def join_room(sid, room):
+    if not isinstance(room, str) or not room.startswith(JOINABLE_ROOM_PREFIXES):
+        return {'ok': False, 'error': 'room not joinable'}
+    session = await sio.get_session(sid)
+    if not await _may_join(session['user_id'], session['role'], room):
+        return {'ok': False, 'error': 'not allowed'}
     print(f"SocketIO joining room: {room}")
     await sio.enter_room(sid, room)
+    return {'ok': True}
+
+@sio.event
+async def leave_room(sid, room):
+    if isinstance(room, str) and room.startswith(JOINABLE_ROOM_PREFIXES):
+        await sio.leave_room(sid, room)
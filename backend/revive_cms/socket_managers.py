@@ -0,0 +1,161 @@
+"""
+Cross-process Socket.IO client managers.
+
+The default manager keeps sessions and rooms in the worker's memory, so an event emitted
+in worker A never reaches sockets attached to worker B. A pub/sub manager relays every
+emit and room operation to all workers. The backend is chosen by
+settings.SOCKETIO_MANAGER_URL:
+
+    ''                                  in-process manager (single worker)
+    unix:///run/revive/socketio.sock    local hub over a Unix socket, no external service
+    redis://host:6379/0                 socketio.AsyncRedisManager (needs the `redis` package)
+"""
+import asyncio
+import fcntl
+import os
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from django.core.exceptions import ImproperlyConfigured
+
+# Upper bound for a single relayed message (one JSON line)
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# A subscriber this far behind is dropped; it reconnects and resumes with new messages
+MAX_PEER_BACKLOG_BYTES = 64 * 1024 * 1024
+
+
+class AsyncUnixSocketManager(AsyncPubSubManager):
+    """
+    Pub/sub over a Unix domain socket for workers on one host.
+
+    One worker is the hub: it holds an exclusive flock on `<path>.lock`, listens on `path`
+    and relays each newline-delimited JSON message to every subscribed worker. The OS
+    releases the lock when the hub exits, so the next worker to reconnect takes over.
+    Processes that never accept sockets (WSGI, management commands) only publish.
+    """
+    name = 'asyncunixsocket'
+    retry_seconds = 0.5
+
+    def __init__(self, path, channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = path
+        self._lock_fd = None
+        self._hub = None
+        self._subscribers = set()
+        self._listen_loop = None
+        self._writer = None
+
+    # --- Hub (one worker per host) ---
+
+    def _acquire_hub_lock(self):
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + '.lock', os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _start_hub(self):
+        # Holding the lock means any socket file left behind belongs to a dead hub
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._hub = await asyncio.start_unix_server(self._serve_peer, path=self.path, limit=MAX_MESSAGE_BYTES)
+        self._get_logger().info('Socket.IO hub listening on %s', self.path)
+
+    async def _serve_peer(self, reader, writer):
+        try:
+            role = await reader.readline()
+            if role == b'sub\n':
+                self._subscribers.add(writer)
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._relay(line)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    def _relay(self, line):
+        for peer in list(self._subscribers):
+            if peer.is_closing() or peer.transport.get_write_buffer_size() > MAX_PEER_BACKLOG_BYTES:
+                self._subscribers.discard(peer)
+                peer.close()
+                continue
+            peer.write(line)
+
+    # --- Subscriber side ---
+
+    async def _listen(self):
+        self._listen_loop = asyncio.get_running_loop()
+        while True:
+            writer = None
+            try:
+                if self._hub is None and self._acquire_hub_lock():
+                    await self._start_hub()
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_MESSAGE_BYTES)
+                writer.write(b'sub\n')
+                await writer.drain()
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    yield line.decode('utf-8')
+            except (OSError, ValueError, asyncio.IncompleteReadError) as exc:
+                self._get_logger().error('Socket.IO hub %s unavailable (%s), retrying', self.path, exc)
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(self.retry_seconds)
+
+    # --- Publisher side ---
+
+    async def _publish(self, data):
+        line = (self.json.dumps(data) + '\n').encode('utf-8')
+        loop = asyncio.get_running_loop()
+        # Workers reuse one connection on their server loop; other callers (async_to_sync
+        # from WSGI or commands) run on throwaway loops, so they connect per message.
+        persistent = loop is self._listen_loop
+
+        for retries_left in (1, 0):
+            writer = None
+            try:
+                if persistent and self._writer is not None and not self._writer.is_closing():
+                    writer = self._writer
+                else:
+                    _, writer = await asyncio.open_unix_connection(self.path)
+                    writer.write(b'pub\n')
+                    if persistent:
+                        self._writer = writer
+                writer.write(line)
+                await writer.drain()
+                if not persistent:
+                    writer.close()
+                    await writer.wait_closed()
+                return
+            except OSError as exc:
+                if writer is not None:
+                    writer.close()
+                if persistent:
+                    self._writer = None
+                if not retries_left:
+                    self._get_logger().error('Cannot publish to Socket.IO hub %s: %s', self.path, exc)
+
+
+def build_client_manager(url, write_only=False):
+    """Client manager for `url` (see module docstring); None selects the in-process default."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return AsyncUnixSocketManager(parsed.path, write_only=write_only)
+    if parsed.scheme in ('redis', 'rediss'):
+        return socketio.AsyncRedisManager(url, write_only=write_only)
+    raise ImproperlyConfigured(f"Unsupported SOCKETIO_MANAGER_URL scheme: {parsed.scheme!r}")
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from pharmacy.models import PharmacyStock
+from revive_cms.realtime import EventOutbox, doctor_room, role_room, visit_room
+from revive_cms.socket_managers import AsyncUnixSocketManager
+from users.models import User
+
+
+def visit_event(version, *rooms, visit_id='v1', **fields):
+    return ('visit_update', {'entity': {'id': visit_id, **fields}, 'version': version}, tuple(sorted(rooms)))
+
+
+class CoalesceTests(SimpleTestCase):
+    def test_transfer_then_update_reaches_old_and_new_doctor(self):
+        transfer = visit_event(1, doctor_room('A'), role_room('ADMIN'), doctor='B')
+        update = visit_event(2, doctor_room('B'), role_room('ADMIN'), doctor='B', status='IN_PROGRESS')
+
+        emits = EventOutbox._coalesce([transfer, update])
+
+        self.assertEqual(emits, [(
+            'visit_update', update[1], (doctor_room('A'), doctor_room('B'), role_room('ADMIN')),
+        )])
+
+    def test_older_version_arriving_late_keeps_newest_payload(self):
+        newer = visit_event(5, doctor_room('B'), status='CLOSED')
+        older = visit_event(4, doctor_room('A'), status='OPEN')
+
+        [(_, data, rooms)] = EventOutbox._coalesce([newer, older])
+
+        self.assertEqual(data, newer[1])
+        self.assertEqual(rooms, (doctor_room('A'), doctor_room('B')))
+
+    def test_batch_shares_common_rooms_and_sends_extras_alone(self):
+        first = visit_event(1, role_room('ADMIN'), visit_room('v1'), visit_id='v1')
+        second = visit_event(3, role_room('ADMIN'), doctor_room('B'), visit_id='v2')
+
+        emits = EventOutbox._coalesce([first, second])
+
+        self.assertEqual(emits, [
+            ('visit_update', {'batch': [first[1], second[1]], 'version': 3}, (role_room('ADMIN'),)),
+            ('visit_update', first[1], (visit_room('v1'),)),
+            ('visit_update', second[1], (doctor_room('B'),)),
+        ])
+
+    def test_batch_without_common_rooms_is_sent_per_entity(self):
+        first = visit_event(1, doctor_room('A'), visit_id='v1')
+        second = visit_event(2, doctor_room('B'), visit_id='v2')
+
+        self.assertEqual(EventOutbox._coalesce([first, second]), [first, second])
+
+    def test_broadcasts_and_duplicates(self):
+        broadcast = ('stats_update', {'pending': 3}, None)
+
+        self.assertEqual(EventOutbox._coalesce([broadcast, broadcast]), [broadcast])
+
+
+class KeysetPaginationTests(TestCase):
+    url = '/api/pharmacy/stock/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin', role='ADMIN'))
+        for batch_no, expiry_date, qty in [('A', '2030-01-01', 7), ('B', '2031-01-01', 3), ('C', '2029-01-01', 7),
+                                           ('D', '2032-01-01', 1), ('E', '2028-01-01', 20)]:
+            PharmacyStock.objects.create(name='Paracetamol', batch_no=batch_no, expiry_date=expiry_date,
+                                         mrp=10, selling_price=10, qty_available=qty)
+
+    def walk(self, **params):
+        response = self.client.get(self.url, {'cursor': '', 'page_size': 2, **params})
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['batch_no'] for row in response.json()['results']])
+            if not response.json()['next']:
+                return pages
+            response = self.client.get(response.json()['next'])
+
+    def qty_order(self, reverse=False):
+        stocks = sorted(PharmacyStock.objects.all(), key=lambda s: (s.qty_available, str(s.pk)), reverse=reverse)
+        return [stock.batch_no for stock in stocks]
+
+    def test_default_keyset_ordering(self):
+        self.assertEqual(self.walk(), [['E', 'C'], ['A', 'B'], ['D']])
+
+    def test_requested_ordering_is_kept_with_ties_broken_by_id(self):
+        for ordering, reverse in (('qty_available', False), ('-qty_available', True)):
+            pages = self.walk(ordering=ordering)
+            self.assertEqual([batch for page in pages for batch in page], self.qty_order(reverse))
+            self.assertEqual(len(pages), 3)
+
+    def test_ordering_across_a_relation_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': '', 'ordering': 'supplier__supplier_name'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+
+class UnixSocketManagerTests(SimpleTestCase):
+    async def test_message_published_by_one_worker_reaches_the_other(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'socketio.sock')
+            first, second = AsyncUnixSocketManager(path), AsyncUnixSocketManager(path)
+            received = {first: asyncio.Queue(), second: asyncio.Queue()}
+
+            async def subscribe(manager):
+                async for message in manager._listen():
+                    await received[manager].put(json.loads(message))
+
+            listeners = [asyncio.create_task(subscribe(manager)) for manager in (first, second)]
+            try:
+                # One of them becomes the hub; wait until both are subscribed to it
+                async with asyncio.timeout(5):
+                    while not any(len(manager._subscribers) == 2 for manager in (first, second)):
+                        await asyncio.sleep(0.01)
+                self.assertEqual(sum(manager._hub is not None for manager in (first, second)), 1)
+
+                await first._publish({'method': 'emit', 'event': 'visit_update', 'room': 'role:ADMIN'})
+                await second._publish({'method': 'enter_room', 'sid': 'abc', 'room': 'visit:1'})
+
+                async with asyncio.timeout(5):
+                    for manager in (first, second):
+                        self.assertEqual(
+                            [await received[manager].get(), await received[manager].get()],
+                            [{'method': 'emit', 'event': 'visit_update', 'room': 'role:ADMIN'},
+                             {'method': 'enter_room', 'sid': 'abc', 'room': 'visit:1'}],
+                        )
+            finally:
+                for listener in listeners:
+                    listener.cancel()
+                await asyncio.gather(*listeners, return_exceptions=True)
+                for manager in (first, second):
+                    if manager._writer is not None:
+                        manager._writer.close()
+                # Let the hub's peer handlers read EOF and finish before the loop closes
+                await asyncio.sleep(0.05)
+                for manager in (first, second):
+                    if manager._hub is not None:
+                        manager._hub.close()
+                    if manager._lock_fd is not None:
+                        os.close(manager._lock_fd)
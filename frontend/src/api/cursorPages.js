@@ -0,0 +1,23 @@
+// Keyset paging for list endpoints (`?cursor=`, see revive_cms.pagination.KeysetPagination).
+// Each page is one bounded query however deep it is. A pager remembers the cursor of every
+// page reached, so Previous and the numbered buttons go back without a COUNT(*).
+
+export const createCursorPager = () => ({ key: null, cursors: [''] });
+
+// Cursor for `page` (1-based); a new `key` (filters, page size) starts over from page 1
+export const cursorFor = (pager, key, page) => {
+    if (pager.key !== key) {
+        pager.key = key;
+        pager.cursors = [''];
+    }
+    return pager.cursors[page - 1] ?? '';
+};
+
+// Store the cursor of the page after `page` from the response's `next` link; returns how
+// many pages can be reached so far
+export const rememberNext = (pager, page, next) => {
+    const cursor = next ? new URL(next, window.location.origin).searchParams.get('cursor') : null;
+    if (cursor) pager.cursors[page] = cursor;
+    else pager.cursors.length = page;
+    return pager.cursors.length;
+};
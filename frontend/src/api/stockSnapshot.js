@@ -0,0 +1,29 @@
+import api from './axios';
+
+// Stock catalogs kept per category: the first load downloads the full snapshot, later
+// loads only the batches changed since the version the server last returned.
+const catalogs = {};
+
+const toRows = (columns, rows) => rows.map(values => Object.fromEntries(columns.map((col, i) => [col, values[i]])));
+
+export const loadStockSnapshot = async (category = '') => {
+    const catalog = catalogs[category] || (catalogs[category] = { version: null, etag: null, byId: new Map() });
+    const params = { category: category || undefined, since: catalog.version ?? undefined };
+    const headers = catalog.etag ? { 'If-None-Match': catalog.etag } : {};
+
+    const response = await api.get('pharmacy/stock/snapshot/', {
+        params,
+        headers,
+        validateStatus: status => (status >= 200 && status < 300) || status === 304,
+    });
+
+    if (response.status !== 304) {
+        const { version, full, columns, rows, removed } = response.data;
+        if (full) catalog.byId.clear();
+        removed.forEach(id => catalog.byId.delete(id));
+        toRows(columns, rows).forEach(row => catalog.byId.set(row.id, row));
+        catalog.version = version;
+        catalog.etag = response.headers.etag || null;
+    }
+    return Array.from(catalog.byId.values());
+};
@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import api from '../api/axios';
+import { socket, reconnectSocket } from '../socket';
 
 const AuthContext = createContext();
 
@@ -27,6 +28,7 @@ export const AuthProvider = ({ children }) => {
         const { data } = await api.post('/auth/token/', { username, password });
         sessionStorage.setItem('access_token', data.access);
         sessionStorage.setItem('refresh_token', data.refresh);
+        reconnectSocket();
 
         // Fetch profile to get role
         const profile = await api.get('/users/me/');
@@ -36,6 +38,7 @@ export const AuthProvider = ({ children }) => {
 
     const logout = () => {
         sessionStorage.clear();
+        socket.disconnect();
         setUser(null);
         window.location.href = '/login';
     };
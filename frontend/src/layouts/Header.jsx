@@ -3,12 +3,14 @@ import { Search, Bell, Check, Command, Clock, Inbox, Globe } from 'lucide-react'
 import { useSearch } from '../context/SearchContext';
 import { useAuth } from '../context/AuthContext';
 import api from '../api/axios';
+import { socket, eventItems } from '../socket';
 import { motion, AnimatePresence } from 'framer-motion';
 
 const Header = () => {
     const { globalSearch, setGlobalSearch } = useSearch();
     const { user } = useAuth();
     const [notifications, setNotifications] = useState([]);
+    const [unreadCount, setUnreadCount] = useState(0);
     const [showDropdown, setShowDropdown] = useState(false);
     const [currentTime, setCurrentTime] = useState(new Date());
     const dropdownRef = useRef(null);
@@ -40,14 +42,41 @@ const Header = () => {
         });
     };
 
+    // No polling: new notifications are pushed to this user's/role's socket room.
+    // The cached count is re-read on (re)connect to cover anything missed while offline.
     useEffect(() => {
         if (user) {
-            fetchNotifications();
-            const interval = setInterval(fetchNotifications, 30000);
-            return () => clearInterval(interval);
+            fetchUnreadCount();
+
+            const onNotification = (data) => {
+                const items = eventItems(data).map(({ entity }) => entity);
+                setUnreadCount(c => c + items.length);
+                setNotifications(prev => [...items, ...prev.filter(n => !items.some(i => i.id === n.id))]);
+            };
+
+            socket.on('notification_new', onNotification);
+            socket.on('connect', fetchUnreadCount);
+            return () => {
+                socket.off('notification_new', onNotification);
+                socket.off('connect', fetchUnreadCount);
+            };
         }
     }, [user]);
 
+    // Load the list only when it is about to be shown
+    useEffect(() => {
+        if (showDropdown) fetchNotifications();
+    }, [showDropdown]);
+
+    const fetchUnreadCount = async () => {
+        try {
+            const { data } = await api.get('/core/notifications/unread-count/');
+            setUnreadCount(data.unread);
+        } catch (err) {
+            console.error(err);
+        }
+    };
+
     const fetchNotifications = async () => {
         try {
             const { data } = await api.get('/core/notifications/');
@@ -59,15 +88,14 @@ const Header = () => {
 
     const markAsRead = async (id) => {
         try {
-            await api.post('/core/notifications/mark_read/', { ids: [id] });
-            fetchNotifications();
+            const { data } = await api.post('/core/notifications/mark_read/', { ids: [id] });
+            setNotifications(prev => prev.map(n => (n.id === id ? { ...n, is_read: true } : n)));
+            setUnreadCount(data.unread);
         } catch (err) {
             console.error(err);
         }
     };
 
-    const unreadCount = notifications.filter(n => !n.is_read).length;
-
     return (
         <header className="h-20 bg-white/90 backdrop-blur-xl border-b border-slate-100 px-8 flex items-center justify-between sticky top-0 z-40">
             {/* --- Left: Smart Search --- */}
@@ -6,6 +6,7 @@ import {
 } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import api from '../api/axios';
+import { loadStockSnapshot } from '../api/stockSnapshot';
 import { useToast } from '../context/ToastContext';
 import { socket } from '../socket';
 
@@ -715,10 +716,10 @@ const CasualtyPage = () => {
     const fetchMetadata = async () => {
         try {
             const [stock, svcs] = await Promise.all([
-                api.get('/pharmacy/stock/?page_size=2000'), // increased limit to get more stock for filtering
+                loadStockSnapshot(), // full catalog once, then only the changes
                 api.get('/casualty/service-definitions/')
             ]);
-            setPharmacyStock(stock.data.results || stock.data);
+            setPharmacyStock(stock);
             setServiceDefinitions(svcs.data.results || svcs.data);
         } catch (e) { console.error("Error fetching metadata:", e); }
     };
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import {
     Stethoscope, ClipboardList, Send, User, Activity, X, Search,
@@ -11,7 +11,7 @@ import { useSearch } from '../context/SearchContext';
 import { useToast } from '../context/ToastContext'; // Using the global toast we made
 import api from '../api/axios';
 import Pagination from '../components/Pagination';
-import { socket } from '../socket';
+import { socket, eventItems, applySnapshots } from '../socket';
 
 // --- Components: Skeletons & UI Bits ---
 const QueueSkeleton = () => (
@@ -183,6 +183,8 @@ const Doctor = () => {
 
     // Data States
     const [visitsData, setVisitsData] = useState({ results: [], count: 0 });
+    const visitsRef = useRef(visitsData); // latest rows for socket handlers bound once per page
+    visitsRef.current = visitsData;
     const [selectedVisit, setSelectedVisit] = useState(null);
     const [loading, setLoading] = useState(true);
     const [page, setPage] = useState(1);
@@ -313,14 +315,29 @@ const Doctor = () => {
             // Socket Listeners
             const onVisitUpdate = (data) => {
                 console.log("Socket: Visit Update", data);
-                fetchQueue(false); // Background refresh
-                if (data.status === 'OPEN') showToast('info', 'Patient queue updated');
+                const items = eventItems(data);
+                // Patch rows already in the queue; refetch only when a visit joins or leaves it
+                const inQueue = (v) => ['OPEN', 'IN_PROGRESS'].includes(v.status) && v.assigned_role === 'DOCTOR'
+                    && (user?.role !== 'DOCTOR' || v.doctor_id === String(user.u_id));
+                const current = visitsRef.current.results || [];
+                const { rows, missing } = applySnapshots(current, items, 'v_id');
+                const missingIds = new Set(missing.map(e => e.id));
+                const left = items.some(i => !i.entity || (!missingIds.has(i.entity.id) && !inQueue(i.entity)));
+                if (left || missing.some(inQueue)) {
+                    fetchQueue(false);
+                } else if (rows !== current) {
+                    setVisitsData(prev => ({ ...prev, results: rows }));
+                }
+                if (items.some(i => i.status === 'OPEN')) showToast('info', 'Patient queue updated');
             };
 
             const onLabUpdate = (data) => {
                 console.log("Socket: Lab Update", data);
-                if (data.status === 'COMPLETED') {
-                    showToast('success', `Lab results ready (ID: ${data.visit_id.slice(0, 8)})`);
+                const done = eventItems(data).filter(i => i.status === 'COMPLETED');
+                if (done.length) {
+                    showToast('success', done.length === 1
+                        ? `Lab results ready (ID: ${done[0].visit_id.slice(0, 8)})`
+                        : `${done.length} lab results ready`);
                     fetchQueue(false);
                 }
             };
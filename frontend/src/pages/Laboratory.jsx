@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { createPortal } from 'react-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import {
@@ -23,10 +23,11 @@ import {
 import { Card, Button, Input, Table } from '../components/UI';
 import Pagination from '../components/Pagination';
 import api from '../api/axios';
+import { createCursorPager, cursorFor, rememberNext } from '../api/cursorPages';
 import { useSearch } from '../context/SearchContext';
 import { useToast } from '../context/ToastContext';
 import { useDialog } from '../context/DialogContext';
-import { socket } from '../socket';
+import { socket, eventItems, applySnapshots } from '../socket';
 
 // --- Configuration ---
 const TEST_TEMPLATES = {
@@ -51,6 +52,8 @@ const Laboratory = () => {
 
     // --- State ---
     const [chargesData, setChargesData] = useState({ results: [], count: 0 });
+    const chargesRef = useRef(chargesData); // latest rows for socket handlers bound once per page
+    chargesRef.current = chargesData;
     const [pendingVisits, setPendingVisits] = useState([]);
     const [inventoryData, setInventoryData] = useState({ results: [], count: 0 });
     const [loading, setLoading] = useState(true);
@@ -58,6 +61,7 @@ const Laboratory = () => {
     const [statusFilter, setStatusFilter] = useState('PENDING');
     const [page, setPage] = useState(1);
     const [pageSize, setPageSize] = useState(10);
+    const chargesPager = useRef(createCursorPager());
     const [labTests, setLabTests] = useState([]);
 
     // Group charges by visit AND distinct request times (Session-based grouping)
@@ -192,14 +196,23 @@ const Laboratory = () => {
             // Socket Listeners
             const onDoctorUpdate = (data) => {
                 console.log("Socket: Doctor Update", data);
-                if (data.has_lab) {
+                if (eventItems(data).some(i => i.has_lab)) {
                     fetchPendingVisits(false);
                     showToast('info', 'New lab request received');
                 }
             };
 
-            const onLabUpdate = () => {
-                fetchCharges(false);
+            const onLabUpdate = (data) => {
+                // Patch visible charges in place; refetch only for rows this page doesn't hold
+                const items = eventItems(data);
+                const current = chargesRef.current.results || [];
+                const { rows, missing } = applySnapshots(current, items, 'lc_id');
+                const filteredOut = statusFilter !== 'ALL' && items.some(i => i.entity && i.entity.status !== statusFilter);
+                if (missing.length || filteredOut) {
+                    fetchCharges(false);
+                } else if (rows !== current) {
+                    setChargesData(prev => ({ ...prev, results: rows }));
+                }
             }
 
             socket.on('doctor_notes_update', onDoctorUpdate);
@@ -287,16 +300,11 @@ const Laboratory = () => {
         if (showLoading) setLoading(true);
         try {
             const statusQuery = statusFilter !== 'ALL' ? `&status=${statusFilter}` : '';
-            let url = `lab/charges/?page=${page}&search=${globalSearch || ''}${statusQuery}`;
-
-            if (pageSize === 'all') {
-                url += `&page_size=10000`;
-            } else {
-                url += `&page_size=${pageSize}`;
-            }
+            const cursor = cursorFor(chargesPager.current, [pageSize, globalSearch, statusFilter].join('|'), page);
+            const url = `lab/charges/?cursor=${encodeURIComponent(cursor)}&page_size=${pageSize}&search=${globalSearch || ''}${statusQuery}`;
 
             const { data } = await api.get(url);
-            setChargesData(data || { results: [], count: 0 });
+            setChargesData({ ...data, pages: rememberNext(chargesPager.current, page, data.next) });
         } catch (err) { showToast('error', 'Failed to fetch lab queue'); }
         finally { if (showLoading) setLoading(false); }
     };
@@ -1018,7 +1026,7 @@ const Laboratory = () => {
                                     <select
                                         value={pageSize}
                                         onChange={(e) => {
-                                            setPageSize(e.target.value === 'all' ? 'all' : Number(e.target.value));
+                                            setPageSize(Number(e.target.value));
                                             setPage(1); // Reset to page 1
                                         }}
                                         className="bg-transparent outline-none text-slate-900 cursor-pointer"
@@ -1027,14 +1035,13 @@ const Laboratory = () => {
                                         <option value={20}>20</option>
                                         <option value={50}>50</option>
                                         <option value={100}>100</option>
-                                        <option value="all">View All</option>
                                     </select>
                                 </div>
 
                                 <div className="flex-1 w-full md:w-auto">
                                     <Pagination
                                         current={page}
-                                        total={Math.ceil((chargesData.count || 0) / (pageSize === 'all' ? (chargesData.count || 1) : pageSize))}
+                                        total={chargesData.pages || 1}
                                         onPageChange={setPage}
                                         loading={loading}
                                         compact
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import {
     Pill, Plus, Search, ShoppingCart, AlertTriangle,
@@ -8,9 +8,10 @@ import {
 import { Button, Input } from '../components/UI';
 import Pagination from '../components/Pagination';
 import api from '../api/axios';
+import { createCursorPager, cursorFor, rememberNext } from '../api/cursorPages';
 import { useSearch } from '../context/SearchContext';
 import { useToast } from '../context/ToastContext';
-import { socket } from '../socket';
+import { socket, eventItems } from '../socket';
 
 // --- Premium Tooltip ---
 const ActionTooltip = ({ text, children }) => (
@@ -90,6 +91,7 @@ const Pharmacy = () => {
     const [stockData, setStockData] = useState({ results: [], count: 0 });
     const [page, setPage] = useState(1);
     const [rowsPerPage, setRowsPerPage] = useState(50);
+    const stockPager = useRef(createCursorPager());
     const [selectedStockItem, setSelectedStockItem] = useState(null);
     const [suppliers, setSuppliers] = useState([]);
     const [filterSupplier, setFilterSupplier] = useState('');
@@ -166,17 +168,13 @@ const Pharmacy = () => {
     const fetchStock = useCallback(async (showLoading = true) => {
         if (showLoading) setLoading(true);
         try {
-            let url = `pharmacy/stock/?page=${page}`;
-            if (rowsPerPage === 'all') {
-                url += `&page_size=10000`;
-            } else {
-                url += `&page_size=${rowsPerPage}`;
-            }
+            const cursor = cursorFor(stockPager.current, [rowsPerPage, filterSupplier, filterCategory, inventorySearch].join('|'), page);
+            let url = `pharmacy/stock/?cursor=${encodeURIComponent(cursor)}&page_size=${rowsPerPage}`;
             if (filterSupplier) url += `&supplier=${filterSupplier}`;
             if (filterCategory) url += `&category=${filterCategory}`;
             if (inventorySearch) url += `&search=${inventorySearch}`; // Add search param
             const { data } = await api.get(url);
-            setStockData(data.results ? data : { results: data || [], count: data.length || 0 });
+            setStockData({ ...data, pages: rememberNext(stockPager.current, page, data.next) });
         } catch (err) { setStockData({ results: [], count: 0 }); }
         finally { if (showLoading) setLoading(false); }
     }, [page, rowsPerPage, filterSupplier, filterCategory, inventorySearch]); // Add dependency
@@ -211,7 +209,7 @@ const Pharmacy = () => {
     useEffect(() => {
         fetchStock(true); fetchSuppliers(); fetchPendingVisits(false); fetchRecentImports();
         // Global socket listener for prescriptions
-        const onDoctorUpdate = (data) => { if (data.has_prescription) { fetchPendingVisits(false); showToast('info', 'New prescription received'); } };
+        const onDoctorUpdate = (data) => { if (eventItems(data).some(i => i.has_prescription)) { fetchPendingVisits(false); showToast('info', 'New prescription received'); } };
         socket.on('doctor_notes_update', onDoctorUpdate);
         return () => { socket.off('doctor_notes_update', onDoctorUpdate); };
     }, []);
@@ -546,7 +544,8 @@ const Pharmacy = () => {
         } catch (err) { console.error(err); } finally { setLoading(false); }
     };
     const handleFileChange = (e) => { if (e.target.files && e.target.files[0]) setFileToUpload(e.target.files[0]); };
-    const handleConfirmUpload = async () => { if (!fileToUpload || !selectedSupplier) return; const formData = new FormData(); formData.append('file', fileToUpload); formData.append('supplier_name', selectedSupplier); setUploadLoading(true); try { const { data } = await api.post('pharmacy/bulk-upload/', formData, { headers: { 'Content-Type': 'multipart/form-data' } }); setUploadResult({ success: true, message: 'Upload Successful', details: `${data.items_processed} items processed.`, invoice: data.invoice_no }); showToast('success', 'Inventory updated'); if (activeTab === 'purchases') fetchRecentImports(); setFileToUpload(null); } catch (err) { showToast('error', 'Upload failed.'); setUploadResult({ success: false, message: 'Upload Failed', details: err.response?.data?.error || "Error uploading file." }); } finally { setUploadLoading(false); } };
+    const handleConfirmUpload = async () => { if (!fileToUpload || !selectedSupplier) return; const formData = new FormData(); formData.append('file', fileToUpload); formData.append('supplier_name', selectedSupplier); setUploadLoading(true); try { let { data: job } = await api.post('pharmacy/bulk-upload/', formData, { headers: { 'Content-Type': 'multipart/form-data' } }); while (job.status === 'QUEUED' || job.status === 'RUNNING') { setUploadResult({ success: true, message: `Importing... ${job.progress}%`, details: `${job.rows_processed} lines read.` }); await new Promise(resolve => setTimeout(resolve, 1000)); ({ data: job } = await api.get(`pharmacy/import-jobs/${job.id}/`)); } const rejected = job.rows_failed ? ` ${job.rows_failed} rows rejected.` : ''; if (job.status === 'FAILED') { showToast('error', 'Upload failed.'); setUploadResult({ success: false, message: 'Upload Failed', details: `${job.message}${rejected}`, jobId: job.id, rowsFailed: job.rows_failed }); return; } setUploadResult({ success: true, message: 'Upload Successful', details: `${job.rows_imported} items processed.${rejected}`, invoice: job.invoice_no, jobId: job.id, rowsFailed: job.rows_failed }); showToast('success', 'Inventory updated'); if (activeTab === 'purchases') fetchRecentImports(); setFileToUpload(null); } catch (err) { showToast('error', 'Upload failed.'); setUploadResult({ success: false, message: 'Upload Failed', details: err.response?.data?.error || "Error uploading file." }); } finally { setUploadLoading(false); } };
+    const handleDownloadImportErrors = async (jobId) => { try { const { data } = await api.get(`pharmacy/import-jobs/${jobId}/errors/`, { responseType: 'blob' }); const url = URL.createObjectURL(data); const link = document.createElement('a'); link.href = url; link.download = `import_${jobId}_errors.csv`; link.click(); URL.revokeObjectURL(url); } catch (err) { showToast('error', 'Failed to download error report'); } };
     const handleSyncToTablets = async (item) => { if (!window.confirm(`This will multiply current stock (${item.qty_available}) by ${item.tablets_per_strip} to convert existing strip counts to tablets. Continue?`)) return; try { const newQty = item.qty_available * item.tablets_per_strip; await api.patch(`pharmacy/stock/${item.med_id || item.id}/`, { qty_available: newQty }); showToast('success', 'Stock corrected to tablets'); fetchStock(); setSelectedStockItem(null); } catch (err) { showToast('error', 'Update failed'); } };
     const handleAddSupplier = async (e) => { e.preventDefault(); try { await api.post('pharmacy/suppliers/', { supplier_name: newSupplierName }); fetchSuppliers(); setShowAddSupplierModal(false); setNewSupplierName(''); showToast('success', 'Supplier added'); } catch (err) { showToast('error', 'Failed to add supplier'); } };
 
@@ -817,8 +816,8 @@ const Pharmacy = () => {
                             </table>
                         </div>
                         <div className="p-3 border-t border-slate-100 bg-slate-50/50 flex flex-col md:flex-row items-center justify-between gap-4 shrink-0">
-                            <div className="flex items-center gap-2"><span className="text-xs font-bold text-slate-500">Rows per page:</span><select className="bg-white border border-slate-200 text-slate-700 text-xs rounded-lg p-1 outline-none font-bold" value={rowsPerPage} onChange={(e) => { setRowsPerPage(e.target.value === 'all' ? 'all' : Number(e.target.value)); setPage(1); }}><option value={10}>10</option><option value={20}>20</option><option value={50}>50</option><option value={100}>100</option><option value="all">View All</option></select></div>
-                            <Pagination current={page} total={Math.ceil(stockData.count / (rowsPerPage === 'all' ? (stockData.count || 1) : rowsPerPage))} onPageChange={setPage} loading={loading} compact />
+                            <div className="flex items-center gap-2"><span className="text-xs font-bold text-slate-500">Rows per page:</span><select className="bg-white border border-slate-200 text-slate-700 text-xs rounded-lg p-1 outline-none font-bold" value={rowsPerPage} onChange={(e) => { setRowsPerPage(Number(e.target.value)); setPage(1); }}><option value={10}>10</option><option value={20}>20</option><option value={50}>50</option><option value={100}>100</option></select></div>
+                            <Pagination current={page} total={stockData.pages || 1} onPageChange={setPage} loading={loading} compact />
                         </div>
                     </>
                 )}
@@ -954,7 +953,7 @@ const Pharmacy = () => {
                                     </div>
                                 </div>
 
-                                {uploadResult && (<div className={`p-4 rounded-2xl border-2 text-sm font-bold flex items-start gap-3 shadow-sm ${uploadResult.success ? 'bg-emerald-50 border-emerald-100 text-emerald-700' : 'bg-rose-50 border-rose-100 text-rose-700'}`}><div className="mt-0.5">{uploadResult.success ? <CheckCircle2 size={18} /> : <AlertTriangle size={18} />}</div><div><p className="uppercase tracking-wide text-xs mb-1">{uploadResult.message}</p><p className="opacity-80 font-normal">{uploadResult.details}</p></div></div>)}
+                                {uploadResult && (<div className={`p-4 rounded-2xl border-2 text-sm font-bold flex items-start gap-3 shadow-sm ${uploadResult.success ? 'bg-emerald-50 border-emerald-100 text-emerald-700' : 'bg-rose-50 border-rose-100 text-rose-700'}`}><div className="mt-0.5">{uploadResult.success ? <CheckCircle2 size={18} /> : <AlertTriangle size={18} />}</div><div><p className="uppercase tracking-wide text-xs mb-1">{uploadResult.message}</p><p className="opacity-80 font-normal">{uploadResult.details}</p>{uploadResult.rowsFailed > 0 && (<button onClick={() => handleDownloadImportErrors(uploadResult.jobId)} className="mt-2 text-xs underline font-bold">Download error report</button>)}</div></div>)}
                             </div>
                         </div>
 
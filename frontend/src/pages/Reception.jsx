@@ -1,4 +1,4 @@
-﻿import React, { useState, useEffect } from 'react';
+﻿import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import {
@@ -11,6 +11,7 @@ import { useAuth } from '../context/AuthContext';
 import { useDialog } from '../context/DialogContext';
 import Pagination from '../components/Pagination';
 import api from '../api/axios';
+import { createCursorPager, cursorFor, rememberNext } from '../api/cursorPages';
 import Billing from './Billing'; // Integrated Billing Module
 import { socket } from '../socket';
 
@@ -64,6 +65,7 @@ const Reception = () => {
     const [loading, setLoading] = useState(true);
     const [page, setPage] = useState(1);
     const [pageSize, setPageSize] = useState(10);
+    const patientPager = useRef(createCursorPager());
     const [activeTab, setActiveTab] = useState('front-desk'); // 'front-desk' | 'billing'
     const [editingPatientId, setEditingPatientId] = useState(null);
 
@@ -143,18 +145,13 @@ const Reception = () => {
     const fetchPatients = async (showSkeleton = true) => {
         if (showSkeleton) setLoading(true);
         try {
-            let url = `/reception/patients/?page=${page}`;
-
-            if (pageSize === 'all') {
-                url += `&page_size=10000`;
-            } else {
-                url += `&page_size=${pageSize}`;
-            }
+            const cursor = cursorFor(patientPager.current, `${pageSize}|${globalSearch}`, page);
+            let url = `/reception/patients/?cursor=${encodeURIComponent(cursor)}&page_size=${pageSize}`;
 
             url += `${globalSearch ? `&search=${encodeURIComponent(globalSearch)}` : ''}`;
 
             const { data } = await api.get(url);
-            setPatientsData(data);
+            setPatientsData({ ...data, pages: rememberNext(patientPager.current, page, data.next) });
         } catch (err) {
             console.error(err);
             showToast('error', 'Failed to load patients list.');
@@ -264,7 +261,22 @@ const Reception = () => {
                 showToast('success', 'Patient details updated successfully!');
             } else {
                 // Create Mode
-                response = await api.post('/reception/patients/register/', payload);
+                try {
+                    response = await api.post('/reception/patients/register/', payload);
+                } catch (regErr) {
+                    // 409: similar patient already registered on this phone number
+                    const candidates = regErr.response?.status === 409 && regErr.response.data?.duplicate_candidates;
+                    if (!candidates) throw regErr;
+                    const names = candidates.map(c => `${c.full_name} (${c.registration_number || 'No Reg'})`).join(', ');
+                    const registerAnyway = await confirm({
+                        title: 'Possible Duplicate Patient',
+                        message: `Similar patient(s) already registered with this number: ${names}. Register as a new patient anyway?`,
+                        confirmText: 'Register New',
+                        type: 'info'
+                    });
+                    if (!registerAnyway) return;
+                    response = await api.post('/reception/patients/register/', { ...payload, confirm_new: true });
+                }
                 // Backend returns 200 OK if patient exists, 201 CREATED if new
                 if (response.status === 200) {
                     showToast('error', 'The patient is already there with this number');
@@ -623,7 +635,7 @@ const Reception = () => {
                                             <select
                                                 value={pageSize}
                                                 onChange={(e) => {
-                                                    setPageSize(e.target.value === 'all' ? 'all' : Number(e.target.value));
+                                                    setPageSize(Number(e.target.value));
                                                     setPage(1); // Reset to page 1 on size change
                                                 }}
                                                 className="bg-transparent outline-none text-slate-900 cursor-pointer"
@@ -632,14 +644,13 @@ const Reception = () => {
                                                 <option value={20}>20</option>
                                                 <option value={50}>50</option>
                                                 <option value={100}>100</option>
-                                                <option value="all">View All</option>
                                             </select>
                                         </div>
 
                                         <div className="flex-1 w-full md:w-auto">
                                             <Pagination
                                                 current={page}
-                                                total={Math.ceil((patientsData.count || 0) / (pageSize === 'all' ? (patientsData.count || 1) : pageSize))}
+                                                total={patientsData.pages || 1}
                                                 onPageChange={setPage}
                                                 loading={loading}
                                                 compact
@@ -1,7 +1,46 @@
 import { io } from 'socket.io-client';
 
-// Connect to the backend URL
+// Connect to the backend URL.
+// The server authenticates the handshake with the JWT and places the socket in its
+// role/user (and doctor) rooms, so `auth` is read fresh on every (re)connect.
 export const socket = io('http://localhost:8000', {
     transports: ['websocket'],
-    autoConnect: true,
+    autoConnect: !!sessionStorage.getItem('access_token'),
+    auth: (cb) => cb({ token: sessionStorage.getItem('access_token') }),
 });
+
+// A refused handshake is not retried by socket.io; try again once a (refreshed) token exists
+socket.on('connect_error', () => {
+    setTimeout(() => {
+        if (!socket.connected && sessionStorage.getItem('access_token')) socket.connect();
+    }, 5000);
+});
+
+// Re-authenticate after login so the socket lands in the new user's rooms
+export const reconnectSocket = () => {
+    socket.disconnect();
+    socket.connect();
+};
+
+// Server events carry `{ ..., entity, version }`; bursts arrive as `{ batch: [...], version }`
+export const eventItems = (data) => (data && Array.isArray(data.batch) ? data.batch : [data]);
+
+// Merge event snapshots into a list of rows keyed by `key`. Returns the patched list
+// (same reference if nothing changed) and the snapshots that matched no row.
+export const applySnapshots = (rows, items, key = 'id') => {
+    let patched = rows;
+    const missing = [];
+    items.forEach(({ entity, version }) => {
+        if (!entity) return;
+        const idx = patched.findIndex((row) => String(row[key]) === entity.id);
+        if (idx === -1) {
+            missing.push(entity);
+            return;
+        }
+        if (patched[idx]._version && version <= patched[idx]._version) return; // stale
+        if (patched === rows) patched = [...rows];
+        const { id, ...fields } = entity;
+        patched[idx] = { ...patched[idx], ...fields, _version: version };
+    });
+    return { rows: patched, missing };
+};